@@ -0,0 +1,223 @@
+#a Copyright
+#
+#  This file 'align_8b10b.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Comma search and symbol alignment of a raw serial bit stream, using NumPy
+
+The SGMII transceiver presents the gasket with sgmii_rxd nibbles, oldest
+bit in rxd[0]; the gasket assembles these into a bit stream (oldest bit
+first), searches for a comma at every bit offset, and takes 10-bit symbols
+from the bit position of the comma. Symbols are oldest bit most
+significant, so the first bit of a symbol is bit 9 ('a' of abcdeifghj).
+
+A comma is the seven bits 0011111 or 1100000 at the start of a symbol
+(found in K28.1, K28.5 and K28.7). The aligner here takes symbols from the
+position of the first comma; a comma at any other bit offset (modulo 10)
+realigns the symbols to that comma, and a symbol that would straddle the
+realignment point is dropped. The gasket itself only looks for the
+00111110 pattern (K28.5 with negative running disparity); matching only
+that can be selected with negative_comma_only.
+"""
+
+#a Imports
+import numpy as np
+
+#a Bit stream conversion
+#f bits_of_nibbles
+def bits_of_nibbles(nibbles):
+    """
+    Convert an array of sgmii_rxd nibbles (oldest bit in bit 0) to an array of bits, oldest first
+    """
+    nibbles = np.asarray(nibbles, dtype=np.uint8)
+    bits = (nibbles[:,None] >> np.arange(4, dtype=np.uint8)) & 1
+    return bits.reshape(-1)
+
+#f nibbles_of_bits
+def nibbles_of_bits(bits):
+    """
+    Convert an array of bits, oldest first, to sgmii_rxd nibbles (oldest bit in bit 0); any partial nibble at the end is dropped
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    bits = bits[:(len(bits)//4)*4].reshape(-1,4)
+    return (bits << np.arange(4, dtype=np.uint8)).sum(axis=1).astype(np.uint8)
+
+#f bits_of_bytes
+def bits_of_bytes(data):
+    """
+    Convert packed bytes (oldest bit most significant) to an array of bits, oldest first
+    """
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+
+#f bits_of_symbols
+def bits_of_symbols(symbols):
+    """
+    Convert an array of 10-bit symbols to an array of bits, oldest (most significant bit of each symbol) first
+    """
+    symbols = np.asarray(symbols, dtype=np.uint16)
+    bits = (symbols[:,None] >> np.arange(9, -1, -1, dtype=np.uint16)) & 1
+    return bits.reshape(-1).astype(np.uint8)
+
+#f symbols_at
+def symbols_at(bits, starts):
+    """
+    Return the 10-bit symbols starting at each bit position in starts
+    """
+    if len(starts)==0: return np.zeros(0, dtype=np.uint16)
+    window = bits[starts[:,None] + np.arange(10)].astype(np.uint16)
+    return (window << np.arange(9, -1, -1, dtype=np.uint16)).sum(axis=1).astype(np.uint16)
+
+#a Comma search
+#f find_commas
+def find_commas(bits, negative_comma_only=False):
+    """
+    Return the bit positions at which a comma starts
+
+    A position is only reported if all the bits of the comma are present.
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    width = 8 if negative_comma_only else 7
+    n = len(bits) - width + 1
+    if n<=0: return np.zeros(0, dtype=np.int64)
+    window = np.zeros(n, dtype=np.uint8)
+    for i in range(width):
+        window = (window << 1) | bits[i:n+i]
+        pass
+    if negative_comma_only:
+        found = (window == 0x3e)
+        pass
+    else:
+        found = (window == 0x1f) | (window == 0x60)
+        pass
+    return np.flatnonzero(found)
+
+#f realignment_points
+def realignment_points(commas, phase=None):
+    """
+    Given comma positions, return those at which the symbol alignment changes
+
+    phase is the current alignment (bit position modulo 10), or None if not aligned
+    """
+    if len(commas)==0: return commas
+    phases = commas % 10
+    changed = np.empty(len(commas), dtype=np.bool_)
+    changed[0]  = (phase is None) or (phases[0]!=phase)
+    changed[1:] = phases[1:] != phases[:-1]
+    return commas[changed]
+
+#f symbol_starts
+def symbol_starts(first_start, realign, end):
+    """
+    Return the bit positions of all the symbols from first_start (or None), realigning at each of realign,
+    for symbols that are entirely before end
+    """
+    segment_starts = realign
+    if first_start is not None:
+        segment_starts = np.concatenate((np.array([first_start], dtype=np.int64), realign))
+        pass
+    if len(segment_starts)==0: return np.zeros(0, dtype=np.int64)
+    segment_ends = np.concatenate((segment_starts[1:], np.array([end], dtype=np.int64)))
+    counts = np.maximum((segment_ends - segment_starts) // 10, 0)
+    total = int(counts.sum())
+    first_of_segment = np.cumsum(counts) - counts
+    index = np.arange(total, dtype=np.int64) - np.repeat(first_of_segment, counts)
+    return np.repeat(segment_starts, counts) + 10*index
+
+#a Alignment
+#f align_bits
+def align_bits(bits, negative_comma_only=False):
+    """
+    Align a complete bit stream (oldest bit first) to its commas
+
+    Returns (symbols, starts, offsets) where symbols is uint16, starts is
+    the bit position of each symbol in the stream, and offsets is the
+    alignment offset (bit position modulo 10) of each symbol. Bits before
+    the first comma are discarded.
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    commas  = find_commas(bits, negative_comma_only)
+    starts  = symbol_starts(None, realignment_points(commas), len(bits))
+    symbols = symbols_at(bits, starts)
+    return (symbols, starts, (starts % 10).astype(np.uint8))
+
+#f align_nibbles
+def align_nibbles(nibbles, negative_comma_only=False):
+    """
+    Align a complete stream of sgmii_rxd nibbles; starts are bit positions in the stream
+    """
+    return align_bits(bits_of_nibbles(nibbles), negative_comma_only)
+
+#c SymbolAligner
+class SymbolAligner(object):
+    """
+    Incremental aligner, for a bit stream that arrives in pieces
+
+    Each call to add_bits (or add_nibbles) returns the symbols that are
+    known to be complete; a symbol is only returned once enough of the
+    following bits have arrived to know that no comma at another
+    alignment starts within it, so the result of a sequence of calls is the
+    same as align_bits on the whole stream. Symbol start positions are bit
+    positions from the start of the whole stream.
+    """
+    #f __init__
+    def __init__(self, negative_comma_only=False):
+        self.negative_comma_only = negative_comma_only
+        self.comma_width = 8 if negative_comma_only else 7
+        self.bits = np.zeros(0, dtype=np.uint8)
+        self.base = 0
+        self.next_start = None
+        pass
+    #f alignment
+    def alignment(self):
+        """
+        Current alignment (bit position modulo 10), or None if no comma has been seen
+        """
+        if self.next_start is None: return None
+        return self.next_start % 10
+    #f add_nibbles
+    def add_nibbles(self, nibbles, final=False):
+        return self.add_bits(bits_of_nibbles(nibbles), final)
+    #f add_bits
+    def add_bits(self, bits, final=False):
+        """
+        Add bits (oldest first); returns (symbols, starts, offsets) as align_bits does
+
+        If final is set then all complete symbols are returned
+        """
+        bits = np.concatenate((self.bits, np.asarray(bits, dtype=np.uint8)))
+        end = len(bits)
+        searched = max(end - self.comma_width + 1, 0)
+        commas = find_commas(bits, self.negative_comma_only)
+        first_start = None
+        if self.next_start is not None: first_start = self.next_start - self.base
+        realign = realignment_points(commas + self.base, self.alignment()) - self.base
+        all_starts = symbol_starts(first_start, realign, end+10)
+        emit_end = end if final else searched
+        emitted = int(np.searchsorted(all_starts + 10, emit_end, side="right"))
+        starts = all_starts[:emitted]
+        symbols = symbols_at(bits, starts)
+        if emitted<len(all_starts):
+            self.next_start = self.base + int(all_starts[emitted])
+            pass
+        keep_from = searched
+        if self.next_start is not None: keep_from = min(keep_from, self.next_start - self.base)
+        starts = starts + self.base
+        self.bits = bits[keep_from:]
+        self.base += keep_from
+        return (symbols, starts, (starts % 10).astype(np.uint8))
+    #f All done
+    pass
@@ -0,0 +1,194 @@
+#a Copyright
+#
+#  This file 'an_model.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Cycle-accurate model of the sgmii_gmii_gasket autonegotiation state machine
+
+The model mirrors gmii_an_state in the transmit clock domain: one call of
+step is one tx_clk edge, taking the ability and acknowledge match inputs
+as seen in that cycle. The link timer (counter) is loaded with
+counter_10ms on entry to restart, ability_detect, complete_acknowledge and
+idle_wait, counted down to zero, and the state moves on in the cycle after
+it reaches zero; so each of restart, complete_acknowledge and idle_wait
+lasts link_timer+1 cycles. In fast link mode (sgmii_gasket_control address
+0 bit 3) the link timer is counter_10ms>>fast_link_timer_shift, and the
+receive side reports a match after a single repeat of the config data.
+
+A test can use predict_data_cycle to compute the exact cycle at which the
+gasket reaches the data state after an autonegotiation restart, rather
+than waiting for a fixed time.
+"""
+
+#a Constants
+#v AN FSM state encodings - in the order of t_gmii_an_fsm
+an_fsm_reset                = 0
+an_fsm_data                 = 1
+an_fsm_restart              = 2
+an_fsm_ability_detect       = 3
+an_fsm_ability_acknowledge  = 4
+an_fsm_complete_acknowledge = 5
+an_fsm_idle_wait            = 6
+an_fsm_names = ["reset", "data", "restart", "ability_detect", "ability_acknowledge", "complete_acknowledge", "idle_wait"]
+
+#v Control register bits (sgmii_gasket_control address 0)
+an_control_enable_interface = 1
+an_control_an_disable       = 2
+an_control_restart_an       = 4
+an_control_fast_link        = 8
+
+fast_link_timer_shift = 8
+counter_10ms_reset    = 1<<20
+counter_mask          = (1<<24)-1
+
+#a Functions
+#f link_timer
+def link_timer(counter_10ms, fast_link=False):
+    """
+    Value the gasket loads into its link timer counter
+    """
+    counter_10ms = counter_10ms & counter_mask
+    if fast_link: return counter_10ms >> fast_link_timer_shift
+    return counter_10ms
+
+#a Classes
+#c AnFsm
+class AnFsm(object):
+    """
+    Mirror of gmii_an_state; fsm_state is the value the gasket would
+    report in sgmii_gasket_status.trace.an_fsm one cycle later
+    """
+    counting_states = (an_fsm_reset, an_fsm_restart, an_fsm_complete_acknowledge, an_fsm_idle_wait)
+    #f __init__
+    def __init__(self, counter_10ms=counter_10ms_reset, fast_link=False, an_disable=False, fsm_state=an_fsm_reset, counter=0):
+        self.counter_10ms = counter_10ms & counter_mask
+        self.fast_link    = fast_link
+        self.an_disable   = an_disable
+        self.fsm_state    = fsm_state
+        self.counter      = counter
+        self.restart_an   = False
+        self.cycle        = 0
+        pass
+    #f link_timer
+    def link_timer(self):
+        return link_timer(self.counter_10ms, self.fast_link)
+    #f control_write
+    def control_write(self, address, data):
+        """
+        Apply a control write as it arrives in the transmit clock domain
+        """
+        if address==0:
+            self.an_disable = ((data & an_control_an_disable)!=0)
+            self.restart_an = ((data & an_control_restart_an)!=0)
+            self.fast_link  = ((data & an_control_fast_link)!=0)
+            pass
+        if address==2:
+            self.counter_10ms = data & counter_mask
+            pass
+        pass
+    #f action
+    def action(self, ability_match, acknowledge_match):
+        expired = (self.counter==0)
+        action = "none"
+        if self.fsm_state==an_fsm_reset:
+            action = "restart" if expired else "count"
+            if self.an_disable: action = "enter_data"
+            pass
+        elif self.fsm_state==an_fsm_restart:
+            action = "count"
+            if self.an_disable: action = "enter_data"
+            if expired: action = "ability_detect"
+            pass
+        elif self.fsm_state==an_fsm_ability_detect:
+            if ability_match: action = "ability_acknowledge"
+            pass
+        elif self.fsm_state==an_fsm_ability_acknowledge:
+            if acknowledge_match: action = "complete_acknowledge"
+            pass
+        elif self.fsm_state==an_fsm_complete_acknowledge:
+            action = "idle_wait" if expired else "count"
+            pass
+        elif self.fsm_state==an_fsm_idle_wait:
+            action = "enter_data" if expired else "count"
+            pass
+        if self.restart_an: action = "restart"
+        return action
+    #f step
+    def step(self, ability_match=True, acknowledge_match=True):
+        """
+        Advance by one clock; ability_match and acknowledge_match are as the
+        gasket sees them (it forces both to 0 if the received config data is 0)
+        """
+        action = self.action(ability_match, acknowledge_match)
+        if action=="count":
+            if self.counter!=0: self.counter -= 1
+            pass
+        elif action=="restart":
+            self.fsm_state  = an_fsm_restart
+            self.restart_an = False
+            self.counter    = self.link_timer()
+            pass
+        elif action=="ability_detect":
+            self.fsm_state = an_fsm_ability_detect
+            self.counter   = self.link_timer()
+            pass
+        elif action=="ability_acknowledge":
+            self.fsm_state = an_fsm_ability_acknowledge
+            pass
+        elif action=="complete_acknowledge":
+            self.fsm_state = an_fsm_complete_acknowledge
+            self.counter   = self.link_timer()
+            pass
+        elif action=="idle_wait":
+            self.fsm_state = an_fsm_idle_wait
+            self.counter   = self.link_timer()
+            pass
+        elif action=="enter_data":
+            self.fsm_state = an_fsm_data
+            pass
+        self.cycle += 1
+        return self.fsm_state
+    #f run_until
+    def run_until(self, fsm_state, ability_match=True, acknowledge_match=True, max_cycles=1<<28):
+        """
+        Step with constant match inputs until fsm_state is reached, and return the cycle count at which it is
+
+        Runs of counting are skipped over in one go, so this is quick even with a full 10ms link timer
+        """
+        while self.fsm_state!=fsm_state:
+            if self.cycle>max_cycles: raise Exception("AN model did not reach state %s by cycle %d"%(an_fsm_names[fsm_state], max_cycles))
+            if (self.fsm_state in self.counting_states) and (self.counter>1) and not (self.restart_an or self.an_disable):
+                self.cycle  += self.counter-1
+                self.counter = 1
+                pass
+            self.step(ability_match, acknowledge_match)
+            pass
+        return self.cycle
+    pass
+
+#a Prediction
+#f predict_data_cycle
+def predict_data_cycle(restart_cycle, counter_10ms, fast_link=False):
+    """
+    Given the cycle at which the AN state machine enters restart, return
+    the cycle at which it enters data, for a link partner that is already
+    sending a steady, acknowledged, non-zero config word
+
+    The same offset applies to the one-cycle delayed trace.an_fsm status.
+    """
+    an = AnFsm(counter_10ms=counter_10ms, fast_link=fast_link, fsm_state=an_fsm_restart, counter=link_timer(counter_10ms, fast_link))
+    return restart_cycle + an.run_until(an_fsm_data)
@@ -0,0 +1,223 @@
+#a Copyright
+#
+#  This file 'crc32.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Ethernet CRC-32 (FCS) reference model, as gbe_axi4s32 computes it
+
+gbe_axi4s32 initializes its FCS register to all ones (fcs_op_init),
+updates it with each data byte (fcs_op_calc), and then sends the
+inverted register a byte at a time, least significant first
+(fcs_op_shift). On receive, running the same calculation over the frame
+and its FCS leaves the register at the residue 0xdebb20e3 (fcs_valid).
+
+crc32_update is the table-driven byte-at-a-time calculation, the model
+of fcs_op_calc. The whole-frame functions (fcs, fcs_ok and the batch
+functions) use zlib.crc32, which is the same CRC (table driven, in C;
+zlib's result is the inverted register) and runs at several hundred
+MB/s even for minimum size frames; the table-driven model is checked
+against it (see benchmark). fcs_batch_np is a NumPy slicing-by-8
+version that computes the FCS of many frames at once, for arrays of
+frames already in a 2-D array.
+
+corrupt_fcs builds frames with deliberately bad FCS in bulk, by
+xoring each FCS with a random non-zero mask (so every one is bad).
+
+Running this file reports the throughput of each implementation.
+"""
+
+#a Imports
+import zlib
+import struct
+import random
+import time
+import numpy as np
+
+#a Constants
+crc32_polynomial = 0xedb88320 # reflected 0x04c11db7
+crc32_init       = 0xffffffff
+fcs_residue      = 0xdebb20e3 # register value after a frame and its FCS (fcs_valid)
+fcs_residue_zlib = fcs_residue ^ 0xffffffff # zlib.crc32 of a frame and its FCS
+
+#a Tables
+#f crc32_make_tables
+def crc32_make_tables(n=8):
+    """
+    Tables for slicing-by-n; table[0] is the byte-at-a-time table
+    """
+    t0 = []
+    for i in range(256):
+        c = i
+        for j in range(8):
+            c = (c>>1) ^ (crc32_polynomial if (c&1) else 0)
+            pass
+        t0.append(c)
+        pass
+    tables = [t0]
+    for k in range(1,n):
+        tables.append([(tables[k-1][i]>>8) ^ t0[tables[k-1][i]&0xff] for i in range(256)])
+        pass
+    return tables
+
+crc32_tables = crc32_make_tables(8)
+crc32_table  = crc32_tables[0]
+crc32_tables_np = np.array(crc32_tables, dtype=np.uint32)
+
+#a Reference model
+#f crc32_update
+def crc32_update(crc, data):
+    """
+    Update the FCS register crc with the bytes of data, as fcs_op_calc does a byte at a time
+    """
+    t = crc32_table
+    for d in data:
+        crc = t[(crc ^ d) & 0xff] ^ (crc>>8)
+        pass
+    return crc
+
+#f fcs_register
+def fcs_register(data):
+    """
+    FCS register value after data, starting from fcs_op_init
+    """
+    return crc32_update(crc32_init, data)
+
+#a Whole frames
+#f fcs
+def fcs(frame):
+    """
+    FCS of a frame (as an integer; it is sent least significant byte first)
+    """
+    return zlib.crc32(frame)
+
+#f fcs_bytes
+def fcs_bytes(frame):
+    return struct.pack("<I", zlib.crc32(frame))
+
+#f add_fcs
+def add_fcs(frame):
+    """
+    The frame with its FCS appended
+    """
+    return bytes(frame) + struct.pack("<I", zlib.crc32(frame))
+
+#f residue
+def residue(frame_with_fcs):
+    """
+    FCS register value after a frame and its FCS - fcs_residue if the FCS is good
+    """
+    return zlib.crc32(frame_with_fcs) ^ 0xffffffff
+
+#f fcs_ok
+def fcs_ok(frame_with_fcs):
+    return zlib.crc32(frame_with_fcs)==fcs_residue_zlib
+
+#a Bulk
+#f fcs_batch
+def fcs_batch(frames):
+    """
+    FCS of each of frames, as a uint32 array
+    """
+    return np.fromiter((zlib.crc32(f) for f in frames), dtype=np.uint32, count=len(frames))
+
+#f fcs_ok_batch
+def fcs_ok_batch(frames_with_fcs):
+    """
+    Boolean array of whether each frame (with its FCS) has a good FCS
+    """
+    return np.fromiter((zlib.crc32(f)==fcs_residue_zlib for f in frames_with_fcs), dtype=np.bool_, count=len(frames_with_fcs))
+
+#f fcs_batch_np
+def fcs_batch_np(frames):
+    """
+    FCS of each row of a 2-D uint8 array of frames of equal length, slicing-by-8 across all rows at once
+    """
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    (n, length) = frames.shape
+    t = crc32_tables_np
+    crc = np.full(n, crc32_init, dtype=np.uint32)
+    whole = length - (length % 8)
+    if whole>0:
+        words = frames[:,:whole].view("<u4").reshape(n, whole//8, 2)
+        for i in range(whole//8):
+            lo = words[:,i,0] ^ crc
+            hi = words[:,i,1]
+            crc = (t[7][lo & 0xff] ^ t[6][(lo>>8) & 0xff] ^ t[5][(lo>>16) & 0xff] ^ t[4][lo>>24] ^
+                   t[3][hi & 0xff] ^ t[2][(hi>>8) & 0xff] ^ t[1][(hi>>16) & 0xff] ^ t[0][hi>>24])
+            pass
+        pass
+    for i in range(whole, length):
+        crc = t[0][(crc ^ frames[:,i]) & 0xff] ^ (crc>>8)
+        pass
+    return crc ^ np.uint32(0xffffffff)
+
+#f corrupt_fcs
+def corrupt_fcs(frames, seed=0, single_bit=False):
+    """
+    Return each of frames with an FCS appended that is deliberately wrong
+
+    The correct FCS is xored with a random non-zero mask (a single bit if single_bit)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(frames)
+    if single_bit:
+        masks = np.left_shift(np.uint32(1), rng.integers(0, 32, n, dtype=np.uint32))
+        pass
+    else:
+        masks = rng.integers(1, 1<<32, n, dtype=np.uint64).astype(np.uint32)
+        pass
+    bad = (fcs_batch(frames) ^ masks).astype("<u4").tobytes()
+    return [bytes(f) + bad[4*i:4*i+4] for (i,f) in enumerate(frames)]
+
+#a Benchmark
+#f benchmark
+def benchmark(frames=20000, seed=0):
+    """
+    Check the implementations agree, and return their throughput in bytes per second
+    """
+    rng = random.Random(seed)
+    lengths = [rng.choice([60]*7 + [566]*4 + [1514]) for i in range(frames)]
+    data = [rng.randbytes(l) for l in lengths]
+    total = sum(lengths)
+    results = {}
+    start = time.perf_counter()
+    f = fcs_batch(data)
+    results["zlib batch"] = total / (time.perf_counter()-start)
+    start = time.perf_counter()
+    ok = fcs_ok_batch([d + struct.pack("<I", int(c)) for (d,c) in zip(data, f)])
+    results["zlib check (with append)"] = total / (time.perf_counter()-start)
+    if not ok.all(): raise Exception("Residue check failed")
+    same = np.frombuffer(b"".join([d for d in data if len(d)==1514]), dtype=np.uint8).reshape(-1,1514)
+    start = time.perf_counter()
+    f_np = fcs_batch_np(same)
+    results["numpy slicing-by-8"] = same.size / (time.perf_counter()-start)
+    if (f_np != fcs_batch([bytes(r) for r in same])).any(): raise Exception("NumPy FCS mismatch")
+    sample = data[:200]
+    start = time.perf_counter()
+    ref = [fcs_register(d)^0xffffffff for d in sample]
+    results["table byte-at-a-time"] = sum([len(d) for d in sample]) / (time.perf_counter()-start)
+    if ref != [zlib.crc32(d) for d in sample]: raise Exception("Reference FCS mismatch")
+    bad = corrupt_fcs(data, seed=seed)
+    if fcs_ok_batch(bad).any(): raise Exception("Corrupted FCS passed")
+    return results
+
+#a Toplevel
+if __name__ == '__main__':
+    for (name, rate) in benchmark().items():
+        print("%-28s %8.1f MB/s"%(name, rate/1e6))
+        pass
+    pass
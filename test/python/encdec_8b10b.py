@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
+
 def count_ones(n, sum=0):
-    if n==0: return sum
-    if n&1: return count_ones(n//2,sum+1)
-    return count_ones(n//2,sum)
+    return sum + bin(n).count("1")
 
 class encoding:
+    """
+    An encoding of data (or a control) for a given disparity in
+
+    Instances use __slots__ to keep the tables compact, as a process may hold several sets
+    """
+    __slots__ = ("disparity_in", "is_control", "data", "encoding", "num_ones", "disparity_out", "subsequent_encoding")
     encoded_bits = 6
     fmt="%02d"
     def __init__(self, disparity_in, is_control, data, encoding):
@@ -59,16 +64,18 @@ class encoding:
         return r
     pass
 class encoding_6b5b(encoding):
+    __slots__ = ()
     encoded_bits = 6
     pass
 class encoding_4b3b(encoding):
+    __slots__ = ()
     encoded_bits = 4
     pass
 class encoding_8b10b(encoding):
+    __slots__ = ("enc_6b5b", "enc_4b3b")
     encoded_bits = 10
     def __init__(self, enc_pair):
         (enc_6b5b, enc_4b3b) = enc_pair
-        self.enc_pair = enc_pair
         self.enc_6b5b = enc_6b5b
         self.enc_4b3b = enc_4b3b
         encoding.__init__( self,
@@ -78,6 +85,9 @@ class encoding_8b10b(encoding):
                            encoding     = enc_6b5b.encoding*16 + enc_4b3b.encoding )
 
         pass
+    @property
+    def enc_pair(self):
+        return (self.enc_6b5b, self.enc_4b3b)
     def __str__(self):
         return "%s = %s%s (%03x)"%(encoding.__str__(self),str(self.enc_6b5b),str(self.enc_4b3b),self.encoding)
     
@@ -128,47 +138,116 @@ control_4b3b_encode_negative = [
     0xb, 0x6, 0xa, 0xc, 0xd, 0x5, 0x9, 0x7
     ]
 
-# D.x.A7 is used for only x=17/18/20 when RD=-1
-# D.x.A7 is used for only x=11/13/14 when RD=+1
-encodings_data_4b3b = create_encodings_list( data_4b3b_encode_negative,
-                                             data_4b3b_encode_neg_pos_diff,
-                                             0xf,
-                                             0,
-                                             encoding_4b3b )
-encodings_data_alt_4b3b = create_encodings_list( data_4b3b_encode_negative_alt,
-                                                 data_4b3b_encode_neg_pos_diff,
-                                                 0xf,
-                                                 0,
-                                             encoding_4b3b )
-encodings_control_4b3b = create_encodings_list( control_4b3b_encode_negative,
-                                                    [1]*8,
-                                                    0xf,
-                                                    1,
-                                                    encoding_4b3b )
-encodings_data_6b5b = create_encodings_list( data_6b5b_encode_negative,
-                                             data_6b5b_encode_neg_pos_diff,
-                                             0x3f,
-                                             0,
-                                             encoding_6b5b )
-encodings_control_6b5b = create_encodings_list( control_6b5b_encode_negative,
-                                                [1]*32, # All have inverted encodings if disparity +ve
-                                                0x3f,
-                                                1,
-                                                encoding_6b5b )
-# D.x.A7 is used for only x=17/18/20 when RD=-1
-# D.x.A7 is used for only x=11/13/14 when RD=+1
-for de in encodings_data_6b5b:
-    de.set_subsequent_encoding(encodings_data_4b3b)
-    if (de.matches({"data":17, "disparity_in":0})): de.set_subsequent_encoding(encodings_data_alt_4b3b)
-    if (de.matches({"data":18, "disparity_in":0})): de.set_subsequent_encoding(encodings_data_alt_4b3b)
-    if (de.matches({"data":20, "disparity_in":0})): de.set_subsequent_encoding(encodings_data_alt_4b3b)
-    if (de.matches({"data":11, "disparity_in":1})): de.set_subsequent_encoding(encodings_data_alt_4b3b)
-    if (de.matches({"data":13, "disparity_in":1})): de.set_subsequent_encoding(encodings_data_alt_4b3b)
-    if (de.matches({"data":14, "disparity_in":1})): de.set_subsequent_encoding(encodings_data_alt_4b3b)
-    pass
-for ce in encodings_control_6b5b:
-    ce.set_subsequent_encoding(encodings_control_4b3b)
+#a Table construction
+#c tables_8b10b
+class tables_8b10b:
+    """
+    All of the encodings, built from the source tables above
+
+    encode_table_8b10b is indexed by (is_control, data, disparity_in) as is_control<<9 | data<<1 | disparity_in
+    decode_table_8b10b is indexed by (symbol, disparity_in) as symbol<<1 | disparity_in
+    Entries are the encoding_8b10b, or None if there is no such encoding
+    """
+    control_symbols = [a+32*b for (a,b) in [(23,7),(27,7),(29,7),(30,7), (28,0),(28,1),(28,2),(28,3),(28,4),(28,5),(28,6),(28,7)]]
+    data_symbols = range(256)
+    def __init__(self):
+        self.encodings_data_4b3b = create_encodings_list( data_4b3b_encode_negative,
+                                                          data_4b3b_encode_neg_pos_diff,
+                                                          0xf,
+                                                          0,
+                                                          encoding_4b3b )
+        self.encodings_data_alt_4b3b = create_encodings_list( data_4b3b_encode_negative_alt,
+                                                              data_4b3b_encode_neg_pos_diff,
+                                                              0xf,
+                                                              0,
+                                                              encoding_4b3b )
+        self.encodings_control_4b3b = create_encodings_list( control_4b3b_encode_negative,
+                                                             [1]*8,
+                                                             0xf,
+                                                             1,
+                                                             encoding_4b3b )
+        self.encodings_data_6b5b = create_encodings_list( data_6b5b_encode_negative,
+                                                          data_6b5b_encode_neg_pos_diff,
+                                                          0x3f,
+                                                          0,
+                                                          encoding_6b5b )
+        self.encodings_control_6b5b = create_encodings_list( control_6b5b_encode_negative,
+                                                             [1]*32, # All have inverted encodings if disparity +ve
+                                                             0x3f,
+                                                             1,
+                                                             encoding_6b5b )
+        # D.x.A7 is used for only x=17/18/20 when RD=-1
+        # D.x.A7 is used for only x=11/13/14 when RD=+1
+        alt_data = {0:(17,18,20), 1:(11,13,14)}
+        for de in self.encodings_data_6b5b:
+            de.set_subsequent_encoding(self.encodings_data_4b3b)
+            if de.data in alt_data[de.disparity_in]: de.set_subsequent_encoding(self.encodings_data_alt_4b3b)
+            pass
+        for ce in self.encodings_control_6b5b:
+            ce.set_subsequent_encoding(self.encodings_control_4b3b)
+            pass
+        self.encodings_6b5b = {}
+        for e in self.encodings_data_6b5b + self.encodings_control_6b5b:
+            self.encodings_6b5b[(e.is_control, e.data, e.disparity_in)] = e
+            pass
+        self.encodings_4b3b = {}
+        for sub_encodings in [self.encodings_data_4b3b, self.encodings_data_alt_4b3b, self.encodings_control_4b3b]:
+            for e in sub_encodings:
+                self.encodings_4b3b[(id(sub_encodings), e.data, e.disparity_in)] = e
+                pass
+            pass
+        self.encodings_8b10b = []
+        for (is_control, data, disparity_in) in self.find_all_8b10b():
+            self.encodings_8b10b.append(encoding_8b10b(self.find_encoding_8b10b(is_control, data, disparity_in)))
+            pass
+        self.encode_table_8b10b = [None]*1024
+        self.decode_table_8b10b = [None]*2048
+        for e in self.encodings_8b10b:
+            self.encode_table_8b10b[(e.is_control<<9) | (e.data<<1) | e.disparity_in] = e
+            if self.decode_table_8b10b[(e.encoding<<1) | e.disparity_in] is not None: raise Exception("More than one encoding found")
+            self.decode_table_8b10b[(e.encoding<<1) | e.disparity_in] = e
+            pass
+        pass
+    def find_all_8b10b(self):
+        """
+        List of (is_control, data, disparity_in) of every valid 8b10b encoding, controls first
+        """
+        valid_8b10b = []
+        for (is_control, symbols) in [(1, self.control_symbols), (0, self.data_symbols)]:
+            for d in symbols:
+                for disparity_in in range(2):
+                    if self.find_encoding_8b10b(is_control, d, disparity_in) is None: raise Exception("No encoding found for %d %02x"%(is_control,d))
+                    valid_8b10b.append((is_control, d, disparity_in))
+                    pass
+                pass
+            pass
+        return valid_8b10b
+    def find_encoding_8b10b(self, is_control, data, disparity_in):
+        e6b5b = self.encodings_6b5b.get((is_control, data&0x1f, disparity_in))
+        if e6b5b is None: return None
+        e4b3b = self.encodings_4b3b.get((id(e6b5b.subsequent_encoding), (data>>5)&7, e6b5b.disparity_out))
+        if e4b3b is None: return None
+        return (e6b5b, e4b3b)
     pass
+
+#f get_tables
+_tables = None
+def get_tables():
+    """
+    Build the tables on first use, and return the same tables thereafter
+    """
+    global _tables
+    if _tables is None: _tables = tables_8b10b()
+    return _tables
+
+#f __getattr__ - build the module-level encoding lists on first use
+def __getattr__(name):
+    if name in ["encodings_data_4b3b", "encodings_data_alt_4b3b", "encodings_control_4b3b",
+                "encodings_data_6b5b", "encodings_control_6b5b", "encodings_8b10b",
+                "encode_table_8b10b", "decode_table_8b10b"]:
+        return getattr(get_tables(), name)
+    raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
 def find_encoding(encodings, d):
     matches = []
     for e in encodings:
@@ -179,40 +258,44 @@ def find_encoding(encodings, d):
     if len(matches)>1: raise Exception("More than one encoding found")
     return matches[0]
 def find_encoding_8b10b(is_control, data, disparity_in):
-    encodings = encodings_data_6b5b
-    if is_control: encodings = encodings_control_6b5b
-    e6b5b = find_encoding(encodings, {"data":data&0x1f, "is_control":is_control, "disparity_in":disparity_in})
-    if e6b5b is None: return None
-    e4b3b = find_encoding(e6b5b.subsequent_encoding, {"data":(data>>5)&7,
-                                                      "is_control":is_control,
-                                                      "disparity_in":e6b5b.disparity_out} )
-    return (e6b5b, e4b3b)
+    return get_tables().find_encoding_8b10b(is_control, data, disparity_in)
 
 def enc_pair_str(ep):
     (e6b5b, e4b3b) = ep
     return "%s%s"%(str(e6b5b),str(e4b3b))
 
-           
-        
+#f sub_block_disparity
+def sub_block_disparity(bits, value, disparity_in):
+    """
+    Running disparity after a 6-bit or 4-bit sub-block, valid or not (IEEE 802.3 clause 36.2.4.4)
+    """
+    ones = bin(value).count("1")
+    if (ones*2>bits) or (value==(1<<(bits//2))-1): return 1
+    if (ones*2<bits) or (value==((1<<(bits//2))-1)<<(bits//2)): return 0
+    return disparity_in
+
+#f symbol_disparity
+def symbol_disparity(symbol, disparity_in):
+    """
+    Running disparity after a 10-bit symbol, valid or not
+    """
+    return sub_block_disparity(4, symbol&0xf, sub_block_disparity(6, symbol>>4, disparity_in))
+
 #a Toplevel
-control_symbols = [a+32*b for (a,b) in [(23,7),(27,7),(29,7),(30,7), (28,0),(28,1),(28,2),(28,3),(28,4),(28,5),(28,6),(28,7)]]
-data_symbols = range(256)
-encodings_8b10b = []
-for d in control_symbols:
-    encodings_8b10b.append(encoding_8b10b(find_encoding_8b10b(1, d, 0)))
-    encodings_8b10b.append(encoding_8b10b(find_encoding_8b10b(1, d, 1)))
-    pass
-for d in data_symbols:
-    encodings_8b10b.append(encoding_8b10b(find_encoding_8b10b(0, d, 0)))
-    encodings_8b10b.append(encoding_8b10b(find_encoding_8b10b(0, d, 1)))
-    pass
+control_symbols = tables_8b10b.control_symbols
+data_symbols = tables_8b10b.data_symbols
+def encode_8b10b(is_control, data, disparity_in):
+    return get_tables().encode_table_8b10b[((is_control&1)<<9) | ((data&0xff)<<1) | (disparity_in&1)]
+def decode_8b10b(symbol, disparity_in):
+    return get_tables().decode_table_8b10b[((symbol&0x3ff)<<1) | (disparity_in&1)]
+
 if __name__ == '__main__':
-    for e in encodings_8b10b:
+    for e in get_tables().encodings_8b10b:
         print(str(e))
         pass
     for i in range(1024):
         for d in range(2):
-            e = find_encoding(encodings_8b10b, {"encoding":i, "disparity_in":d})
+            e = decode_8b10b(i, d)
             print(i,d,str(e))
             pass
         pass
@@ -0,0 +1,202 @@
+#a Copyright
+#
+#  This file 'gbe_stats.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Polling of the gbe_single statistics over APB
+
+gbe_single copies all of its counters to a snapshot in one cycle when
+its statistics_control register is written (clearing them in the same
+cycle if bit 0 of the data is set), and the snapshot is read at 16 above
+the live registers. A GbeStatsPoller takes a snapshot with one write and
+then reads the whole snapshot in one burst, so every sample is
+consistent however long the reads take; the byte counters are 64 bits,
+so they do not wrap.
+
+The stat_overflow counters are of per-packet statistics that the MAC
+produced but that were dropped because the packet statistic FIFO in
+gbe_single was full; they are zero unless the FIFO is slowed down with a
+holdoff in the configuration register.
+
+The poller is given functions to read and write a register (by APB
+address) and to return the current time in seconds, so the same poller
+is used by a simulation test (with an APB driver and the simulation
+cycle) and with hardware. Each poll returns a GbeStatsSample with the
+counters, the change since the previous poll (modulo the counter widths)
+and the rates over the interval.
+"""
+
+#a Imports
+from collections import deque
+
+#a Constants
+#v APB addresses - as t_apb_address in gbe_single
+apb_address_sgmii_status        = 0
+apb_address_config              = 0 # when written
+apb_address_sgmii_control       = 1
+apb_address_statistics_control  = 4
+apb_address_rx_sync_lost        = 5
+apb_address_tx_stat_overflow    = 6
+apb_address_rx_stat_overflow    = 7
+apb_address_tx_okay             = 8
+apb_address_tx_okay_bytes       = 9
+apb_address_tx_errored          = 10
+apb_address_tx_okay_bytes_hi    = 11
+apb_address_rx_okay             = 12
+apb_address_rx_okay_bytes       = 13
+apb_address_rx_errored          = 14
+apb_address_rx_okay_bytes_hi    = 15
+apb_address_snapshot_offset     = 16
+statistics_control_clear        = 1
+
+#v Statistics - (name, low word address, high word address or None, width)
+statistics = [
+    ("tx_okay",          apb_address_tx_okay,          None,                         32),
+    ("tx_okay_bytes",    apb_address_tx_okay_bytes,    apb_address_tx_okay_bytes_hi, 64),
+    ("tx_errored",       apb_address_tx_errored,       None,                         32),
+    ("rx_okay",          apb_address_rx_okay,          None,                         32),
+    ("rx_okay_bytes",    apb_address_rx_okay_bytes,    apb_address_rx_okay_bytes_hi, 64),
+    ("rx_errored",       apb_address_rx_errored,       None,                         32),
+    ("rx_sync_lost",     apb_address_rx_sync_lost,     None,                         32),
+    ("tx_stat_overflow", apb_address_tx_stat_overflow, None,                         32),
+    ("rx_stat_overflow", apb_address_rx_stat_overflow, None,                         32),
+]
+statistic_names = [n for (n,lo,hi,w) in statistics]
+
+#a Classes
+#c GbeStatistics
+class GbeStatistics(object):
+    """
+    A set of gbe_single counter values
+    """
+    __slots__ = statistic_names
+    #f __init__
+    def __init__(self, **kwargs):
+        for n in statistic_names:
+            setattr(self, n, kwargs.get(n, 0))
+            pass
+        pass
+    #f __sub__
+    def __sub__(self, other):
+        """
+        Change from other to self, modulo the counter widths
+        """
+        return GbeStatistics(**{n:(getattr(self,n)-getattr(other,n)) & ((1<<w)-1) for (n,lo,hi,w) in statistics})
+    #f as_dict
+    def as_dict(self):
+        return {n:getattr(self,n) for n in statistic_names}
+    #f __str__
+    def __str__(self):
+        return " ".join(["%s %d"%(n,getattr(self,n)) for n in statistic_names])
+    pass
+
+#c GbeStatsSample
+class GbeStatsSample(object):
+    """
+    One poll - the snapshot, its time, the change since the previous poll and the rates over that interval
+    """
+    #f __init__
+    def __init__(self, time, stats, delta, elapsed):
+        self.time    = time
+        self.stats   = stats
+        self.delta   = delta
+        self.elapsed = elapsed
+        self.rates   = {}
+        if elapsed>0:
+            self.rates = {"tx_frames_per_second":delta.tx_okay/elapsed,
+                          "tx_bytes_per_second":delta.tx_okay_bytes/elapsed,
+                          "tx_errors_per_second":delta.tx_errored/elapsed,
+                          "rx_frames_per_second":delta.rx_okay/elapsed,
+                          "rx_bytes_per_second":delta.rx_okay_bytes/elapsed,
+                          "rx_errors_per_second":delta.rx_errored/elapsed,
+            }
+            pass
+        pass
+    #f __str__
+    def __str__(self):
+        r = "%.9fs: %s"%(self.time, str(self.stats))
+        if self.elapsed>0:
+            r += " (tx %.0f frames/s %.0f bytes/s, rx %.0f frames/s %.0f bytes/s)"%(self.rates["tx_frames_per_second"], self.rates["tx_bytes_per_second"],
+                                                                                   self.rates["rx_frames_per_second"], self.rates["rx_bytes_per_second"])
+            pass
+        return r
+    pass
+
+#c GbeStatsPoller
+class GbeStatsPoller(object):
+    """
+    Poll gbe_single statistics using read(address), write(address, data) and now() (in seconds)
+
+    The last history samples are kept (if history is not None)
+    """
+    #f __init__
+    def __init__(self, read, write, now, history=None):
+        self.read  = read
+        self.write = write
+        self.now   = now
+        self.last  = None
+        self.last_cleared = False
+        self.samples = deque(maxlen=history) if history is not None else None
+        pass
+    #f snapshot
+    def snapshot(self, clear=False):
+        """
+        Take a snapshot (clearing the counters if clear) and read it, returning (time, GbeStatistics)
+        """
+        self.write(apb_address_statistics_control, statistics_control_clear if clear else 0)
+        time = self.now()
+        values = {}
+        for (n, lo, hi, w) in statistics:
+            v = self.read(lo + apb_address_snapshot_offset)
+            if hi is not None: v |= self.read(hi + apb_address_snapshot_offset) << 32
+            values[n] = v
+            pass
+        return (time, GbeStatistics(**values))
+    #f read_live
+    def read_live(self):
+        """
+        Read the live counters one register at a time - these may tear, unlike a snapshot
+        """
+        values = {}
+        for (n, lo, hi, w) in statistics:
+            v = self.read(lo)
+            if hi is not None: v |= self.read(hi) << 32
+            values[n] = v
+            pass
+        return GbeStatistics(**values)
+    #f poll
+    def poll(self, clear=False):
+        """
+        Take and read a snapshot, and return a GbeStatsSample
+
+        If the previous poll cleared the counters then they count from
+        zero, and the change is the snapshot itself
+        """
+        (time, stats) = self.snapshot(clear)
+        if self.last is None:
+            sample = GbeStatsSample(time, stats, stats, 0.0)
+            pass
+        else:
+            (last_time, last_stats) = self.last
+            delta = stats if self.last_cleared else stats - last_stats
+            sample = GbeStatsSample(time, stats, delta, time-last_time)
+            pass
+        self.last = (time, stats)
+        self.last_cleared = clear
+        if self.samples is not None: self.samples.append(sample)
+        return sample
+    pass
@@ -0,0 +1,132 @@
+#a Copyright
+#
+#  This file 'latency.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Latency histograms collected across a test run
+
+A LatencyCollector holds, for each named measurement (such as 'tx' or
+'rx') and each packet size, a histogram of latencies in cycles. The
+histograms are counts of each distinct latency, so memory does not grow
+with the number of packets, and min, average, p99 and max are all
+computed from them exactly.
+
+The summary is a dictionary that is written out as JSON, so that a
+regression run can keep the latencies and compare them between runs.
+"""
+
+#a Imports
+import json
+from collections import Counter
+
+#a Classes
+#c LatencyHistogram
+class LatencyHistogram(object):
+    """
+    Histogram of latencies (integer cycles)
+    """
+    #f __init__
+    def __init__(self):
+        self.counts = Counter()
+        self.count  = 0
+        self.total  = 0
+        pass
+    #f add
+    def add(self, latency, n=1):
+        self.counts[latency] += n
+        self.count += n
+        self.total += latency*n
+        pass
+    #f min
+    def min(self):
+        return min(self.counts)
+    #f max
+    def max(self):
+        return max(self.counts)
+    #f mean
+    def mean(self):
+        return self.total / self.count
+    #f percentile
+    def percentile(self, p):
+        """
+        Smallest latency that at least p percent of the samples are no greater than
+        """
+        threshold = self.count * p / 100.0
+        n = 0
+        for latency in sorted(self.counts):
+            n += self.counts[latency]
+            if n>=threshold: return latency
+            pass
+        return self.max()
+    #f summary
+    def summary(self):
+        return {"count":self.count,
+                "min":self.min(),
+                "avg":round(self.mean(),3),
+                "p99":self.percentile(99),
+                "max":self.max(),
+                "histogram":{str(l):self.counts[l] for l in sorted(self.counts)},
+        }
+    #f __str__
+    def __str__(self):
+        return "count %d min %d avg %.2f p99 %d max %d"%(self.count, self.min(), self.mean(), self.percentile(99), self.max())
+    pass
+
+#c LatencyCollector
+class LatencyCollector(object):
+    """
+    Latency histograms by measurement name and packet size
+    """
+    #f __init__
+    def __init__(self):
+        self.histograms = {}
+        pass
+    #f add
+    def add(self, name, size, latency):
+        if name not in self.histograms: self.histograms[name] = {}
+        if size not in self.histograms[name]: self.histograms[name][size] = LatencyHistogram()
+        self.histograms[name][size].add(latency)
+        pass
+    #f add_many
+    def add_many(self, name, sizes, latencies):
+        for (size, latency) in zip(sizes, latencies):
+            self.add(name, int(size), int(latency))
+            pass
+        pass
+    #f summary
+    def summary(self):
+        """
+        Dictionary of name -> packet size (as a string, for JSON) -> histogram summary
+        """
+        return {name:{str(size):h.summary() for (size,h) in sorted(by_size.items())}
+                for (name,by_size) in self.histograms.items()}
+    #f write_json
+    def write_json(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+            pass
+        pass
+    #f __str__
+    def __str__(self):
+        r = []
+        for (name, by_size) in self.histograms.items():
+            for (size, h) in sorted(by_size.items()):
+                r.append("%s size %d: %s"%(name, size, str(h)))
+                pass
+            pass
+        return "\n".join(r)
+    pass
@@ -0,0 +1,108 @@
+#a Copyright
+#
+#  This file 'log_batch.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Batched draining of a log recorder in to columnar arrays
+
+drain_log_columns pops every pending event from a log recorder in one
+call, and returns a LogColumns with one NumPy array per field of the
+parser's attr_map (for GMII loggers: is_control, data, disparity, even,
+dv, er). Events whose log type is not in the parser's attr_map are
+dropped by the parser's map_log_type before they are turned in to event
+objects, so a parser with only the log type of interest (such as
+TxGmiiLogParser for GMII_tx) filters the stream; each parsed event is
+only used to fill a row, and is not kept.
+
+The log recorder can only return one event at a time (num_events and
+event_pop), and only the parser knows the layout of an event, so this
+is a convenience wrapper: the events are still popped and parsed one at
+a time, but the pending count is read once, and the rows are turned in
+to columns in one NumPy conversion rather than field by field.
+
+Fields that an event's log type does not have are -1 in that row.
+"""
+
+#a Imports
+import operator
+import numpy as np
+
+#a Classes
+#c LogColumns
+class LogColumns(object):
+    """
+    Columns of log event fields; columns[field] is an int64 array, all the same length
+    """
+    #f __init__
+    def __init__(self, fields, columns):
+        self.fields  = fields
+        self.columns = columns
+        pass
+    #f __len__
+    def __len__(self):
+        if len(self.fields)==0: return 0
+        return len(self.columns[self.fields[0]])
+    #f __getitem__
+    def __getitem__(self, field):
+        return self.columns[field]
+    #f row_str
+    def row_str(self, i):
+        return " ".join(["%s:%d"%(f,self.columns[f][i]) for f in self.fields])
+    #f concatenate
+    @classmethod
+    def concatenate(cls, columns_list):
+        fields = columns_list[0].fields
+        return cls(fields, {f:np.concatenate([c[f] for c in columns_list]) for f in fields})
+    pass
+
+#a Functions
+#f log_fields
+def log_fields(log_parser):
+    """
+    Field names of all the log types in the parser attr_map, in order of first appearance
+    """
+    fields = []
+    for attrs in log_parser.attr_map.values():
+        for f in attrs:
+            if f not in fields: fields.append(f)
+            pass
+        pass
+    return fields
+
+#f drain_log_columns
+def drain_log_columns(log_data, log_parser, max_events=None):
+    """
+    Pop all (or up to max_events) pending events from log_data, and return them as a LogColumns
+    """
+    fields = log_fields(log_parser)
+    n = log_data.num_events()
+    if (max_events is not None) and (n>max_events): n = max_events
+    event_pop = log_data.event_pop
+    parse = log_parser.parse_log_event
+    if len(log_parser.attr_map)==1:
+        row = operator.attrgetter(*fields) # every parsed event has every field
+        pass
+    else:
+        row = lambda l:tuple([getattr(l, f, -1) for f in fields])
+        pass
+    rows = []
+    for i in range(n):
+        l = parse(event_pop())
+        if l is not None: rows.append(row(l))
+        pass
+    table = np.array(rows, dtype=np.int64).reshape((len(rows), len(fields)))
+    return LogColumns(fields, {f:np.ascontiguousarray(table[:,i]) for (i,f) in enumerate(fields)})
@@ -0,0 +1,277 @@
+#a Copyright
+#
+#  This file 'pcap.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Streaming pcap and pcapng reading and writing
+
+PcapReader reads either format (detected from the first block), in
+either byte order and with microsecond or nanosecond (or for pcapng, any
+if_tsresol) timestamps, and yields one PcapPacket at a time, so a
+capture of any size can be replayed in to a test in constant memory.
+In pcapng, enhanced, simple and obsolete packet blocks are read and all
+other blocks skipped. Only Ethernet (link type 1) captures are read;
+timestamps are converted to nanoseconds with integer arithmetic, so they
+are exact for any power of ten resolution.
+
+PcapWriter writes Ethernet (link type 1) captures in pcap (nanosecond)
+or pcapng format, one packet at a time, with timestamps in nanoseconds;
+tests use the simulation time of a received frame (cycles times the
+clock period).
+
+gmii_frame gives the bytes a GMII transmitter sends for a captured frame:
+preamble, start of frame delimiter, the frame, and its FCS.
+"""
+
+#a Imports
+import struct
+import zlib
+
+#a Constants
+linktype_ethernet = 1
+pcap_magic_us = 0xa1b2c3d4
+pcap_magic_ns = 0xa1b23c4d
+pcapng_block_shb = 0x0a0d0d0a
+pcapng_block_idb = 0x00000001
+pcapng_block_opb = 0x00000002 # obsolete packet block
+pcapng_block_spb = 0x00000003
+pcapng_block_epb = 0x00000006
+pcapng_byte_order_magic = 0x1a2b3c4d
+pcapng_option_if_tsresol = 9
+ethernet_preamble = bytes([0x55]*7 + [0xd5])
+
+#a Functions
+#f gmii_frame
+def gmii_frame(frame):
+    """
+    Preamble, SFD, frame and FCS, as a GMII transmitter sends them
+    """
+    return ethernet_preamble + bytes(frame) + struct.pack("<I", zlib.crc32(frame))
+
+#a Classes
+#c PcapPacket
+class PcapPacket(object):
+    __slots__ = ("timestamp_ns", "data", "original_length", "interface")
+    def __init__(self, timestamp_ns, data, original_length=None, interface=0):
+        self.timestamp_ns = timestamp_ns
+        self.data = data
+        self.original_length = len(data) if original_length is None else original_length
+        self.interface = interface
+        pass
+    def __len__(self):
+        return len(self.data)
+    def __str__(self):
+        return "Packet len %d (orig %d) at %dns"%(len(self.data), self.original_length, self.timestamp_ns)
+    pass
+
+#c PcapReader
+class PcapReader(object):
+    """
+    Read a pcap or pcapng file (a filename or binary file object) a packet at a time
+    """
+    #f __init__
+    def __init__(self, f):
+        self.own_file = isinstance(f, str)
+        self.file = open(f, "rb") if self.own_file else f
+        self.linktypes = []
+        header = self.read_exact(4, allow_eof=True)
+        if header is None: raise Exception("Empty capture file")
+        (magic_le,) = struct.unpack("<I", header)
+        (magic_be,) = struct.unpack(">I", header)
+        if magic_le==pcapng_block_shb:
+            self.format = "pcapng"
+            self.endian = None
+            self.ts_units = []
+            self.pcapng_section_header()
+            pass
+        elif (magic_le in [pcap_magic_us, pcap_magic_ns]) or (magic_be in [pcap_magic_us, pcap_magic_ns]):
+            self.format = "pcap"
+            self.endian = "<" if magic_le in [pcap_magic_us, pcap_magic_ns] else ">"
+            magic = magic_le if self.endian=="<" else magic_be
+            self.ts_scale = 1 if magic==pcap_magic_ns else 1000
+            (major, minor, thiszone, sigfigs, snaplen, linktype) = struct.unpack(self.endian+"HHiIII", self.read_exact(20))
+            self.check_linktype(linktype)
+            self.linktypes = [linktype]
+            pass
+        else:
+            raise Exception("Not a pcap or pcapng file (magic %08x)"%magic_le)
+        pass
+    #f read_exact
+    def read_exact(self, n, allow_eof=False):
+        d = self.file.read(n)
+        if (len(d)==0) and allow_eof: return None
+        if len(d)!=n: raise Exception("Truncated capture file")
+        return d
+    #f check_linktype
+    def check_linktype(self, linktype):
+        if linktype!=linktype_ethernet:
+            raise Exception("Capture link type %d is not Ethernet (%d)"%(linktype, linktype_ethernet))
+        pass
+    #f pcapng_section_header
+    def pcapng_section_header(self):
+        """
+        Read the rest of a section header block, whose type has been read; sets the byte order
+        """
+        length_bytes = self.read_exact(4)
+        bom = self.read_exact(4)
+        if struct.unpack("<I", bom)[0]==pcapng_byte_order_magic: self.endian = "<"
+        elif struct.unpack(">I", bom)[0]==pcapng_byte_order_magic: self.endian = ">"
+        else: raise Exception("Bad pcapng byte order magic")
+        (length,) = struct.unpack(self.endian+"I", length_bytes)
+        self.read_exact(length-12)
+        self.linktypes = []
+        self.ts_units = []
+        pass
+    #f pcapng_interface
+    def pcapng_interface(self, body):
+        (linktype, reserved, snaplen) = struct.unpack(self.endian+"HHI", body[:8])
+        self.check_linktype(linktype)
+        ts_unit_ns = (1000000000, 1000000) # nanoseconds per timestamp unit, as (numerator, denominator)
+        options = body[8:]
+        while len(options)>=4:
+            (code, length) = struct.unpack(self.endian+"HH", options[:4])
+            if code==0: break
+            value = options[4:4+length]
+            if (code==pcapng_option_if_tsresol) and (length>=1):
+                r = value[0]
+                ts_unit_ns = (1000000000, (1<<(r&0x7f)) if (r&0x80) else 10**r)
+                pass
+            options = options[4+((length+3)&~3):]
+            pass
+        self.linktypes.append(linktype)
+        self.ts_units.append(ts_unit_ns)
+        pass
+    #f pcap_packets
+    def pcap_packets(self):
+        while True:
+            header = self.read_exact(16, allow_eof=True)
+            if header is None: return
+            (ts_s, ts_frac, incl_len, orig_len) = struct.unpack(self.endian+"IIII", header)
+            yield PcapPacket(ts_s*1000000000 + ts_frac*self.ts_scale, self.read_exact(incl_len), orig_len)
+            pass
+        pass
+    #f pcapng_packets
+    def pcapng_packets(self):
+        while True:
+            header = self.read_exact(4, allow_eof=True)
+            if header is None: return
+            (block_type,) = struct.unpack(self.endian+"I", header)
+            if block_type==pcapng_block_shb:
+                self.pcapng_section_header()
+                continue
+            (length,) = struct.unpack(self.endian+"I", self.read_exact(4))
+            body = self.read_exact(length-12)
+            self.read_exact(4)
+            if block_type==pcapng_block_idb:
+                self.pcapng_interface(body)
+                pass
+            elif block_type in [pcapng_block_epb, pcapng_block_opb]:
+                if block_type==pcapng_block_epb:
+                    (interface, ts_high, ts_low, incl_len, orig_len) = struct.unpack(self.endian+"IIIII", body[:20])
+                    pass
+                else:
+                    (interface, drops, ts_high, ts_low, incl_len, orig_len) = struct.unpack(self.endian+"HHIIII", body[:20])
+                    pass
+                if interface>=len(self.ts_units):
+                    raise Exception("Bad pcapng file - packet for interface %d before its interface description block"%interface)
+                (num, den) = self.ts_units[interface]
+                ts = (((ts_high<<32) | ts_low) * num) // den
+                yield PcapPacket(ts, body[20:20+incl_len], orig_len, interface)
+                pass
+            elif block_type==pcapng_block_spb:
+                if len(self.linktypes)==0:
+                    raise Exception("Bad pcapng file - simple packet before any interface description block")
+                (orig_len,) = struct.unpack(self.endian+"I", body[:4])
+                yield PcapPacket(0, body[4:4+orig_len], orig_len)
+                pass
+            pass
+        pass
+    #f packets
+    def packets(self):
+        """
+        Generate the packets in the file
+        """
+        if self.format=="pcap": return self.pcap_packets()
+        return self.pcapng_packets()
+    #f __iter__
+    def __iter__(self):
+        return self.packets()
+    #f close
+    def close(self):
+        if self.own_file: self.file.close()
+        pass
+    #f __enter__, __exit__
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+        pass
+    pass
+
+#c PcapWriter
+class PcapWriter(object):
+    """
+    Write an Ethernet capture (format "pcap" or "pcapng") to a filename or binary file object, a packet at a time
+    """
+    #f __init__
+    def __init__(self, f, format="pcap", snaplen=65535, linktype=linktype_ethernet):
+        if format not in ["pcap", "pcapng"]: raise Exception("Unknown capture format '%s'"%format)
+        self.own_file = isinstance(f, str)
+        self.file = open(f, "wb") if self.own_file else f
+        self.format = format
+        self.snaplen = snaplen
+        self.count = 0
+        if format=="pcap":
+            self.file.write(struct.pack("<IHHiIII", pcap_magic_ns, 2, 4, 0, 0, snaplen, linktype))
+            pass
+        else:
+            self.pcapng_block(pcapng_block_shb, struct.pack("<IHHq", pcapng_byte_order_magic, 1, 0, -1))
+            tsresol = struct.pack("<HHB3x", pcapng_option_if_tsresol, 1, 9) # nanoseconds
+            self.pcapng_block(pcapng_block_idb, struct.pack("<HHI", linktype, 0, snaplen) + tsresol + struct.pack("<HH", 0, 0))
+            pass
+        pass
+    #f pcapng_block
+    def pcapng_block(self, block_type, body):
+        body = body + bytes((-len(body))&3)
+        length = len(body) + 12
+        self.file.write(struct.pack("<II", block_type, length) + body + struct.pack("<I", length))
+        pass
+    #f write
+    def write(self, data, timestamp_ns=0):
+        data = bytes(data)
+        captured = data[:self.snaplen]
+        if self.format=="pcap":
+            self.file.write(struct.pack("<IIII", timestamp_ns//1000000000, timestamp_ns%1000000000, len(captured), len(data)))
+            self.file.write(captured)
+            pass
+        else:
+            self.pcapng_block(pcapng_block_epb, struct.pack("<IIIII", 0, timestamp_ns>>32, timestamp_ns&0xffffffff, len(captured), len(data)) + captured)
+            pass
+        self.count += 1
+        pass
+    #f close
+    def close(self):
+        if self.own_file: self.file.close()
+        else: self.file.flush()
+        pass
+    #f __enter__, __exit__
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+        pass
+    pass
@@ -0,0 +1,598 @@
+#a Copyright
+#
+#  This file 'pcs_model.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Reference models of the IEEE 802.3 clause 36 PCS as implemented by sgmii_gmii_gasket
+
+The transmit model follows the gasket transmit state machine (gmii_tx_fsm)
+exactly: it consumes one GMII (tx_en, tx_er, txd) value per code group and
+yields the code group the gasket sends for it, with its disparity and
+whether it is at an even (tx_even) position. Ordered sets are aligned as
+the gasket aligns them - an /S/ is only started in place of the K28.5 of
+an idle, so a packet arriving at an odd position loses one more preamble
+byte, and /T/ /R/ is followed by a second /R/ if required to get back to
+an even position.
+
+The receive model follows the gasket receive state machine (gmii_rx_fsm),
+turning each 10-bit code group into the GMII (rx_dv, rx_er, rxd) that the
+gasket presents after it. Alongside it runs the IEEE 802.3 clause 36
+synchronization state machine (figure 36-9, the t_sync_fsm states), with
+its comma detect, acquire sync and good code group counting; the gasket
+does not yet implement this, so by default its status is only reported,
+but the receive model can be made to resynchronize on its loss of sync.
+
+The models are generators over an iterable of GMII values or code groups,
+holding only their current state, so expected streams for long traffic
+runs are produced lazily and in constant memory.
+"""
+
+#a Imports
+from .encdec_8b10b import encode_8b10b, decode_8b10b, symbol_disparity
+
+#a Constants
+symbol_K_k28_5 = (5<<5) | 28 # 0xbc
+symbol_S_k27_7 = (7<<5) | 27 # 0xfb
+symbol_V_k30_7 = (7<<5) | 30 # 0xfe
+symbol_T_k29_7 = (7<<5) | 29 # 0xfd
+symbol_R_k23_7 = (7<<5) | 23 # 0xf7
+symbol_d5_6    = (6<<5) | 5
+symbol_d16_2   = (2<<5) | 16
+symbol_d21_5   = (5<<5) | 21
+symbol_d2_2    = (2<<5) | 2
+
+#a GMII
+#f gmii_packet
+def gmii_packet(data, error_data=0, carrier_extend=0, ipg=8):
+    """
+    Generate the GMII (tx_en, tx_er, txd) values for a packet (whose first byte is replaced by /S/),
+    followed by error_data transmit errors, carrier_extend cycles of carrier extension, and ipg idles
+    """
+    for d in data:
+        yield (1, 0, d&0xff)
+        pass
+    for i in range(error_data):
+        yield (1, 1, 0)
+        pass
+    for i in range(carrier_extend):
+        yield (0, 1, 0x0f)
+        pass
+    for i in range(ipg):
+        yield (0, 0, 0)
+        pass
+    pass
+
+#a Code groups
+#c CodeGroup
+class CodeGroup(object):
+    """
+    A code group as sent by the PCS
+
+    is_control, data and disparity (the running disparity before the code
+    group) match the fields of the gasket 'GMII_tx' log event, as does even
+    (tx_even before the code group); symbol is the 10-bit encoding, and
+    label is the part of the ordered set that the code group is (K, I1, I2,
+    C1, C2, cfg, S, D, V, T or R)
+    """
+    __slots__ = ("is_control", "data", "disparity", "disparity_out", "symbol", "even", "label", "logged")
+    def __init__(self, is_control, data, disparity, even, label, logged):
+        e = encode_8b10b(is_control, data, disparity)
+        self.is_control    = is_control
+        self.data          = data
+        self.disparity     = disparity
+        self.disparity_out = e.disparity_out
+        self.symbol        = e.encoding
+        self.even          = even
+        self.label         = label
+        self.logged        = logged
+        pass
+    def __str__(self):
+        if self.is_control:
+            r="K%02x"%self.data
+            pass
+        else:
+            r="D%02x"%self.data
+            pass
+        return "%s(%s):%03x:%d:%d"%(self.label, r, self.symbol, self.disparity, self.even)
+    pass
+
+#a Transmit PCS
+#c TxPcs
+class TxPcs(object):
+    """
+    Model of the gasket transmit state machine
+
+    The initial state should be that of the gasket when the first GMII value is presented
+    (after reset this is idle, with tx_even and disparity clear)
+    """
+    fsm_idle           = "idle"
+    fsm_cfg            = "cfg"
+    fsm_cfg_data       = "cfg_data"
+    fsm_data_error     = "data_error"
+    fsm_data           = "data"
+    fsm_first_carrier  = "first_carrier"
+    fsm_finish_carrier = "finish_carrier"
+    op_idle            = "idle"
+    op_data            = "data"
+    op_transmit_error  = "transmit_error"
+    op_carrier_extend  = "carrier_extend"
+    an_mode_config     = "config"
+    an_mode_idle       = "idle"
+    an_mode_data       = "data"
+    #f __init__
+    def __init__(self, tx_even=0, disparity=0, fsm_state="idle", an_mode="data", an_data=0):
+        self.tx_even   = tx_even
+        self.disparity = disparity
+        self.cfg_even  = 0
+        self.fsm_state = fsm_state
+        self.an_mode   = an_mode
+        self.an_data   = an_data
+        pass
+    #f gmii_op
+    def gmii_op(self, tx_en, tx_er, txd):
+        if tx_en:
+            if tx_er: return self.op_transmit_error
+            return self.op_data
+        if tx_er:
+            if txd==0x0f: return self.op_carrier_extend
+            return self.op_transmit_error
+        return self.op_idle
+    #f action
+    def action(self, op):
+        """
+        Determine the action from the state and GMII operation, as gmii_tx_combs.action
+        """
+        if self.fsm_state==self.fsm_idle:
+            action = "k28_5"
+            if self.an_mode==self.an_mode_data:
+                if op==self.op_data:           action = "sop_data"
+                if op==self.op_transmit_error: action = "sop_error"
+                pass
+            if not self.tx_even: action = "idle"
+            return action
+        if self.fsm_state==self.fsm_cfg:
+            if not self.tx_even: return "cfg_data"
+            return "k28_5"
+        if self.fsm_state==self.fsm_cfg_data:
+            if not self.tx_even: return "cfg_data_high"
+            return "cfg_data_low"
+        if self.fsm_state==self.fsm_data_error:
+            if op in [self.op_data, self.op_transmit_error]: return "error"
+            return "eop"
+        if self.fsm_state==self.fsm_data:
+            if op==self.op_data: return "data"
+            if op==self.op_transmit_error: return "error"
+            return "eop"
+        # first_carrier and finish_carrier
+        action = "carrier"
+        if not self.tx_even: action = "carrier_idle"
+        if op==self.op_data:           action = "sop_data"
+        if op==self.op_transmit_error: action = "sop_error"
+        if op==self.op_carrier_extend: action = "carrier"
+        return action
+    #f step
+    def step(self, tx_en, tx_er, txd):
+        """
+        Consume one GMII value and return the CodeGroup transmitted for it
+        """
+        action = self.action(self.gmii_op(tx_en, tx_er, txd))
+        (is_control, data, label) = (0, txd&0xff, "D")
+        toggle_cfg_even = 0
+        next_state = self.fsm_state
+        if action=="k28_5":
+            (is_control, data, label) = (1, symbol_K_k28_5, "K")
+            pass
+        elif action=="cfg_data":
+            next_state = self.fsm_cfg_data
+            toggle_cfg_even = 1
+            (data, label) = (symbol_d2_2, "C2")
+            if self.cfg_even: (data, label) = (symbol_d21_5, "C1")
+            pass
+        elif action=="cfg_data_low":
+            (data, label) = (self.an_data&0xff, "cfg")
+            pass
+        elif action=="cfg_data_high":
+            next_state = self.fsm_cfg
+            if self.an_mode!=self.an_mode_config: next_state = self.fsm_idle
+            (data, label) = ((self.an_data>>8)&0xff, "cfg")
+            pass
+        elif action=="idle":
+            next_state = self.fsm_idle
+            if self.an_mode==self.an_mode_config: next_state = self.fsm_cfg
+            (data, label) = (symbol_d16_2, "I2")
+            if not self.disparity: (data, label) = (symbol_d5_6, "I1")
+            pass
+        elif action=="sop_data":
+            next_state = self.fsm_data
+            (is_control, data, label) = (1, symbol_S_k27_7, "S")
+            pass
+        elif action=="sop_error":
+            next_state = self.fsm_data_error
+            (is_control, data, label) = (1, symbol_S_k27_7, "S")
+            pass
+        elif action=="error":
+            next_state = self.fsm_data
+            (is_control, data, label) = (1, symbol_V_k30_7, "V")
+            pass
+        elif action=="data":
+            next_state = self.fsm_data
+            pass
+        elif action=="eop":
+            next_state = self.fsm_first_carrier
+            (is_control, data, label) = (1, symbol_T_k29_7, "T")
+            pass
+        elif action=="carrier":
+            next_state = self.fsm_finish_carrier
+            (is_control, data, label) = (1, symbol_R_k23_7, "R")
+            pass
+        else: # carrier_idle
+            next_state = self.fsm_idle
+            (is_control, data, label) = (1, symbol_R_k23_7, "R")
+            pass
+        cg = CodeGroup(is_control, data, self.disparity, self.tx_even, label,
+                       logged=(action not in ["idle", "k28_5"]))
+        self.fsm_state = next_state
+        self.tx_even   = self.tx_even ^ 1
+        self.cfg_even  = self.cfg_even ^ toggle_cfg_even
+        self.disparity = cg.disparity_out
+        return cg
+    #f code_groups
+    def code_groups(self, gmii):
+        """
+        Generator of code groups for an iterable of GMII (tx_en, tx_er, txd) values
+        """
+        for (tx_en, tx_er, txd) in gmii:
+            yield self.step(tx_en, tx_er, txd)
+            pass
+        pass
+    #f All done
+    pass
+
+#a Receive PCS
+#f is_comma
+def is_comma(symbol):
+    """
+    Return True if the 10-bit symbol (first bit most significant) starts with a comma (0011111 or 1100000)
+    """
+    return (symbol>>3) in [0x1f, 0x60]
+
+#c SyncFsm
+class SyncFsm(object):
+    """
+    IEEE 802.3 clause 36 synchronization state machine (figure 36-9)
+
+    Each code group is presented to step() with whether it is a comma, a
+    valid data code group, or invalid; sync_status is True when
+    synchronization has been acquired.
+    """
+    loss_of_sync     = "loss_of_sync"
+    comma_detect_1   = "comma_detect_1"
+    acquire_sync_1   = "acquire_sync_1"
+    comma_detect_2   = "comma_detect_2"
+    acquire_sync_2   = "acquire_sync_2"
+    comma_detect_3   = "comma_detect_3"
+    sync_acquired_1  = "sync_acquired_1"
+    sync_acquired_2  = "sync_acquired_2"
+    sync_acquired_2a = "sync_acquired_2a"
+    sync_acquired_3  = "sync_acquired_3"
+    sync_acquired_3a = "sync_acquired_3a"
+    sync_acquired_4  = "sync_acquired_4"
+    sync_acquired_4a = "sync_acquired_4a"
+    # Acquire states and the comma detect state that a comma on an even code group leads to
+    acquire_next = {acquire_sync_1:comma_detect_2, acquire_sync_2:comma_detect_3}
+    # Comma detect states and the state that a data code group leads to
+    comma_detect_next = {comma_detect_1:acquire_sync_1, comma_detect_2:acquire_sync_2, comma_detect_3:sync_acquired_1}
+    # Sync acquired states and the states that a bad code group, a good code group, and three good code groups lead to
+    acquired_next = {sync_acquired_1:  (sync_acquired_2, sync_acquired_1,  None),
+                     sync_acquired_2:  (sync_acquired_3, sync_acquired_2a, None),
+                     sync_acquired_2a: (sync_acquired_3, sync_acquired_2a, sync_acquired_1),
+                     sync_acquired_3:  (sync_acquired_4, sync_acquired_3a, None),
+                     sync_acquired_3a: (sync_acquired_4, sync_acquired_3a, sync_acquired_2),
+                     sync_acquired_4:  (loss_of_sync,    sync_acquired_4a, None),
+                     sync_acquired_4a: (loss_of_sync,    sync_acquired_4a, sync_acquired_3),
+    }
+    #f __init__
+    def __init__(self):
+        self.fsm_state   = self.loss_of_sync
+        self.rx_even     = 0
+        self.good_cgs    = 0
+        self.sync_status = False
+        self.losses_of_sync = 0
+        pass
+    #f step
+    def step(self, comma, data, invalid):
+        """
+        Present a code group; comma if it contains a comma, data if it is a valid data code group,
+        invalid if it is not a valid code group for the current running disparity
+        """
+        state = self.fsm_state
+        cgbad = invalid or (comma and self.rx_even)
+        if state==self.loss_of_sync:
+            next_state = self.loss_of_sync
+            if comma: next_state = self.comma_detect_1
+            pass
+        elif state in self.comma_detect_next:
+            next_state = self.loss_of_sync
+            if data: next_state = self.comma_detect_next[state]
+            pass
+        elif state in self.acquire_next:
+            next_state = state
+            if cgbad: next_state = self.loss_of_sync
+            elif comma: next_state = self.acquire_next[state]
+            pass
+        else:
+            (bad_state, good_state, good_3_state) = self.acquired_next[state]
+            next_state = good_state
+            if cgbad:
+                next_state = bad_state
+                pass
+            elif (good_3_state is not None) and (self.good_cgs==2):
+                next_state = good_3_state
+                pass
+            pass
+        # Actions on entry to the next state
+        self.rx_even = self.rx_even ^ 1
+        if next_state in self.comma_detect_next: self.rx_even = 1
+        if next_state in [self.sync_acquired_2, self.sync_acquired_3, self.sync_acquired_4]: self.good_cgs = 0
+        if next_state in [self.sync_acquired_2a, self.sync_acquired_3a, self.sync_acquired_4a]: self.good_cgs += 1
+        if (next_state==self.loss_of_sync) and self.sync_status: self.losses_of_sync += 1
+        if next_state==self.loss_of_sync: self.sync_status = False
+        if next_state==self.sync_acquired_1: self.sync_status = True
+        self.fsm_state = next_state
+        pass
+    #f All done
+    pass
+
+#c RxPcs
+class RxPcs(object):
+    """
+    Model of the gasket receive state machine, with a clause 36 synchronization state machine
+
+    step() takes one 10-bit code group and returns the (rx_dv, rx_er, rxd)
+    the gasket presents after it; the gasket logs this ('GMII_rx') if
+    rx_dv or rx_er is set. The gasket does not check code groups for
+    validity, and decodes a code group that is only valid for the other
+    running disparity as if it were valid; here other invalid code groups
+    are decoded as a data code group with no data, so a model of a stream
+    with such code groups may differ from the gasket in rxd.
+
+    If use_sync_fsm is set then the receive state machine is held in its
+    sync state whenever the clause 36 synchronization state machine does
+    not have sync.
+    """
+    fsm_sync           = "sync"
+    fsm_wait_for_k     = "wait_for_k"
+    fsm_k              = "k"
+    fsm_invalid        = "invalid"
+    fsm_cfg_b          = "cfg_b"
+    fsm_cfg_c          = "cfg_c"
+    fsm_cfg_d          = "cfg_d"
+    fsm_idle_d         = "idle_d"
+    fsm_false_carrier  = "false_carrier"
+    fsm_receive        = "receive"
+    fsm_eop            = "eop"
+    fsm_extend_carrier = "extend_carrier"
+    #f __init__
+    def __init__(self, use_sync_fsm=False, an_in_xmit=True):
+        self.use_sync_fsm = use_sync_fsm
+        self.an_in_xmit   = an_in_xmit
+        self.sync_fsm     = SyncFsm()
+        self.fsm_state    = self.fsm_sync
+        self.disparity    = 0
+        self.running_disparity = 0
+        self.rx_even      = 0
+        self.error_count  = 0
+        self.rx_dv        = 0
+        self.rx_er        = 0
+        self.rxd          = 0
+        self.rx_config_data       = 0
+        self.rx_config_data_match = 0
+        self.code_groups         = 0
+        self.invalid_code_groups = 0
+        pass
+    #f action
+    def action(self, is_control, data):
+        """
+        Determine the action from the state and decoded code group, as gmii_rx_combs.action
+        """
+        is_K = is_control and (data==symbol_K_k28_5)
+        is_S = is_control and (data==symbol_S_k27_7)
+        is_V = is_control and (data==symbol_V_k30_7)
+        is_T = is_control and (data==symbol_T_k29_7)
+        is_R = is_control and (data==symbol_R_k23_7)
+        state = self.fsm_state
+        if state==self.fsm_sync:
+            return "comma_found"
+        if state==self.fsm_wait_for_k:
+            if is_K: return "idle_k"
+            return "none"
+        if state==self.fsm_k:
+            if is_control:
+                if self.an_in_xmit: return "idle_d"
+                return "invalid"
+            if data in [symbol_d21_5, symbol_d2_2]: return "cfg_a"
+            return "idle_d"
+        if state==self.fsm_invalid:
+            if not self.rx_even: return "none"
+            if is_K: return "idle_k"
+            return "lose_sync"
+        if state==self.fsm_cfg_b:
+            if is_control: return "invalid"
+            return "cfg_data_1"
+        if state==self.fsm_cfg_c:
+            if is_control: return "invalid"
+            return "cfg_data_2"
+        if state==self.fsm_cfg_d:
+            if is_K: return "idle_k"
+            return "invalid"
+        if state==self.fsm_idle_d:
+            if self.an_in_xmit:
+                if is_K: return "idle_k"
+                if is_S: return "carrier_detect"
+                return "false_carrier_detect"
+            if is_K: return "idle_k"
+            return "invalid"
+        if state==self.fsm_false_carrier:
+            if is_K and self.rx_even: return "idle_k"
+            return "count_errors_for_resync"
+        if state==self.fsm_receive:
+            if is_V: return "data_error"
+            if is_T: return "eop"
+            if is_R: return "early_extend_carrier"
+            if is_K: return "early_end"
+            return "data"
+        if state==self.fsm_eop:
+            if is_R: return "extend_carrier"
+            return "extend_error"
+        # extend_carrier
+        if is_R: return "extend_carrier"
+        if is_S: return "carrier_detect"
+        if is_K and self.rx_even: return "idle_k"
+        return "extend_error"
+    #f step
+    def step(self, symbol):
+        """
+        Consume one 10-bit code group and return the GMII (rx_dv, rx_er, rxd) after it
+        """
+        # Clause 36 synchronization uses the true running disparity
+        e = decode_8b10b(symbol, self.running_disparity)
+        self.code_groups += 1
+        if e is None: self.invalid_code_groups += 1
+        self.sync_fsm.step(comma=is_comma(symbol), data=(e is not None) and (not e.is_control), invalid=(e is None))
+        self.running_disparity = symbol_disparity(symbol, self.running_disparity)
+        # The gasket decodes with its own idea of the disparity, and a code group that is only
+        # valid for the other running disparity is decoded as if it were valid
+        e = decode_8b10b(symbol, self.disparity)
+        if e is None: e = decode_8b10b(symbol, self.disparity^1)
+        (is_control, data) = (0, None)
+        if e is not None: (is_control, data) = (e.is_control, e.data)
+        disparity_out = symbol_disparity(symbol, self.disparity)
+        action = self.action(is_control, data)
+        if self.use_sync_fsm and not self.sync_fsm.sync_status: action = "resync"
+        state = self.fsm_state
+        rx_even = self.rx_even
+        self.rx_even   = rx_even ^ 1
+        self.disparity = disparity_out
+        if action=="resync":
+            self.fsm_state = self.fsm_sync
+            (self.rx_dv, self.rx_er) = (0, 0)
+            pass
+        elif action=="comma_found":
+            self.fsm_state = self.fsm_wait_for_k
+            self.disparity = 1
+            pass
+        elif action=="idle_k":
+            self.fsm_state = self.fsm_k
+            self.rx_even   = 0
+            (self.rx_dv, self.rx_er) = (0, 0)
+            pass
+        elif action=="invalid":
+            self.fsm_state = self.fsm_invalid
+            (self.rx_dv, self.rx_er) = (0, 0)
+            pass
+        elif action=="idle_d":
+            self.fsm_state = self.fsm_idle_d
+            (self.rx_dv, self.rx_er) = (0, 0)
+            self.disparity = 0
+            self.rx_config_data_match = 2
+            pass
+        elif action=="cfg_a":
+            self.fsm_state = self.fsm_cfg_b
+            (self.rx_dv, self.rx_er) = (0, 0)
+            pass
+        elif action in ["cfg_data_1", "cfg_data_2"]:
+            shift = 0
+            self.fsm_state = self.fsm_cfg_c
+            if action=="cfg_data_2": (shift, self.fsm_state) = (8, self.fsm_cfg_d)
+            self.rx_config_data_match = ((self.rx_config_data_match<<1) | 1) & 0x3f
+            if ((self.rx_config_data>>shift)&0xff)!=data: self.rx_config_data_match = 0
+            self.rx_config_data = (self.rx_config_data & ~(0xff<<shift)) | (data<<shift)
+            pass
+        elif action=="carrier_detect":
+            self.fsm_state = self.fsm_receive
+            (self.rx_dv, self.rx_er, self.rxd) = (0, 1, 0x0f)
+            if state==self.fsm_idle_d: (self.rx_dv, self.rx_er, self.rxd) = (1, 0, 0x55)
+            pass
+        elif action=="data":
+            self.fsm_state = self.fsm_receive
+            (self.rx_dv, self.rx_er) = (1, 0)
+            if data is not None: self.rxd = data
+            pass
+        elif action=="data_error":
+            self.fsm_state = self.fsm_receive
+            self.rx_er = 1
+            pass
+        elif action=="eop":
+            self.fsm_state = self.fsm_eop
+            (self.rx_dv, self.rx_er) = (0, 0)
+            pass
+        elif action=="extend_carrier":
+            self.fsm_state = self.fsm_extend_carrier
+            if (state==self.fsm_extend_carrier) and rx_even: (self.rx_dv, self.rx_er, self.rxd) = (0, 1, 0x0f)
+            pass
+        elif action=="early_end":
+            self.fsm_state = self.fsm_k
+            self.rx_er = 1
+            pass
+        elif action=="early_extend_carrier":
+            self.fsm_state = self.fsm_extend_carrier
+            self.rx_er = 1
+            pass
+        elif action=="extend_error":
+            self.fsm_state = self.fsm_extend_carrier
+            (self.rx_dv, self.rx_er, self.rxd) = (0, 1, 0x1f)
+            pass
+        elif action=="false_carrier_detect":
+            self.fsm_state = self.fsm_false_carrier
+            (self.rx_dv, self.rx_er, self.rxd) = (0, 1, 0x0e)
+            pass
+        elif action=="count_errors_for_resync":
+            if self.error_count==0xff: self.fsm_state = self.fsm_sync
+            self.error_count = (self.error_count+1) & 0xff
+            pass
+        elif action=="lose_sync":
+            self.fsm_state = self.fsm_wait_for_k
+            (self.rx_dv, self.rx_er) = (0, 0)
+            pass
+        return (self.rx_dv, self.rx_er, self.rxd)
+    #f gmii
+    def gmii(self, symbols):
+        """
+        Generator of the GMII (rx_dv, rx_er, rxd) after each code group of an iterable of code groups
+        """
+        for s in symbols:
+            yield self.step(s)
+            pass
+        pass
+    #f gmii_events
+    def gmii_events(self, symbols):
+        """
+        Generator of the GMII values that the gasket logs (those with rx_dv or rx_er set) for an iterable of code groups
+        """
+        for s in symbols:
+            g = self.step(s)
+            if g[0] or g[1]: yield g
+            pass
+        pass
+    #f process
+    def process(self, symbols):
+        """
+        Process a chunk of code groups, returning the list of logged GMII values for the chunk
+        """
+        return list(self.gmii_events(symbols))
+    #f All done
+    pass
@@ -0,0 +1,248 @@
+#a Copyright
+#
+#  This file 'profiling.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Opt-in profiling of simulation tests
+
+Profiling is enabled by setting the environment variable
+CDL_TEST_PROFILE to 1 (report in the test output) or to a filename (to
+also append the summary of each test to that file as one line of JSON);
+it is off if the variable is unset, empty, or 0, false, no or off.
+
+A test class that includes ProfiledExecFile calls profile_start at the
+start of run__init and profile_finish in run__finalize. When enabled,
+profile_start wraps the exec file methods named in profile_methods, the
+wait_for_value of every signal, and the module functions in
+profile_functions (as (module, name) pairs - the reference models), with
+timers. The waits on the simulation (bfm_wait and wait_for_value) are
+counted as simulator time, and everything else as Python time; each
+wrapped method reports its number of calls, its total time, and its own
+Python time (excluding the simulation waits and other wrapped calls it
+makes).
+
+The summary gives the simulated cycles, wall time, cycles per second and
+the percentage of the time spent in Python. Some objects (such as signals
+of a built-in type) cannot have their methods replaced; these are listed
+in the summary as unwrapped, and if any of them is a simulation wait then
+the time spent in it is counted as Python time, so the Python percentage
+is then an upper bound.
+"""
+
+#a Imports
+import os
+import time
+import json
+
+#a Constants
+profile_env = "CDL_TEST_PROFILE"
+profile_off = ["", "0", "false", "no", "off"]
+profile_report_only = ["1", "true", "yes", "on"]
+
+#a Functions
+#f profile_setting
+def profile_setting():
+    """
+    Return None if profiling is off, "" to report only, or the filename to append summaries to
+    """
+    value = os.environ.get(profile_env, "").strip()
+    if value.lower() in profile_off: return None
+    if value.lower() in profile_report_only: return ""
+    return value
+
+#a Classes
+#c ProfileEntry
+class ProfileEntry(object):
+    __slots__ = ("calls", "total", "own")
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.own   = 0.0
+        pass
+    pass
+
+#c Profile
+class Profile(object):
+    """
+    Timers for wrapped functions; sim_names are those counted as simulator time
+    """
+    #f __init__
+    def __init__(self, sim_names=("bfm_wait", "wait_for_value")):
+        self.sim_names = sim_names
+        self.entries   = {}
+        self.stack     = []
+        self.sim_time  = 0.0
+        self.cycles    = 0
+        self.restore   = []
+        self.unwrapped = []
+        self.start     = time.perf_counter()
+        pass
+    #f wrap
+    def wrap(self, name, fn, cycles_arg=False):
+        """
+        Return fn wrapped with a timer for name; if cycles_arg then its first argument is a cycle count
+        """
+        if name not in self.entries: self.entries[name] = ProfileEntry()
+        entry = self.entries[name]
+        is_sim = name.split(".")[-1] in self.sim_names
+        stack = self.stack
+        def wrapped(*args, **kwargs):
+            if cycles_arg and len(args)>0: self.cycles += args[0]
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                entry.calls += 1
+                entry.total += elapsed
+                if is_sim:
+                    self.sim_time += elapsed - children
+                    pass
+                else:
+                    entry.own += elapsed - children
+                    pass
+                if len(stack)>0: stack[-1] += elapsed
+                pass
+            pass
+        return wrapped
+    #f wrap_attribute
+    def wrap_attribute(self, obj, attr, name, cycles_arg=False):
+        """
+        Replace obj.attr with a timed wrapper; returns False (and records name as unwrapped) if obj does not permit it
+        """
+        fn = getattr(obj, attr)
+        original = getattr(obj, "__dict__", {}).get(attr, None)
+        try:
+            setattr(obj, attr, self.wrap(name, fn, cycles_arg))
+            pass
+        except (AttributeError, TypeError):
+            self.unwrapped.append(name)
+            return False
+        self.restore.append((obj, attr, original))
+        return True
+    #f unwrap_all
+    def unwrap_all(self):
+        for (obj, attr, original) in reversed(self.restore):
+            if original is None:
+                try:
+                    delattr(obj, attr)
+                    pass
+                except AttributeError:
+                    pass
+                pass
+            else:
+                setattr(obj, attr, original)
+                pass
+            pass
+        self.restore = []
+        pass
+    #f unwrapped_sim_waits
+    def unwrapped_sim_waits(self):
+        return [n for n in self.unwrapped if n.split(".")[-1] in self.sim_names]
+    #f summary
+    def summary(self, name, cycles=None):
+        wall = time.perf_counter() - self.start
+        if cycles is None: cycles = self.cycles
+        python_time = wall - self.sim_time
+        return {"test":name,
+                "cycles":cycles,
+                "wall":round(wall,6),
+                "cycles_per_second":round(cycles/wall,1) if wall>0 else 0,
+                "sim_time":round(self.sim_time,6),
+                "python_time":round(python_time,6),
+                "python_percent":round(100.0*python_time/wall,2) if wall>0 else 0,
+                "unwrapped":list(self.unwrapped),
+                "unwrapped_sim_waits":len(self.unwrapped_sim_waits()),
+                "methods":{n:{"calls":e.calls, "total":round(e.total,6), "own":round(e.own,6)}
+                           for (n,e) in sorted(self.entries.items(), key=lambda ne:-ne[1].own) if e.calls>0},
+        }
+    pass
+
+#c ProfiledExecFile
+class ProfiledExecFile(object):
+    """
+    Mixin for ThExecFile test classes
+    """
+    profile_methods   = []
+    profile_functions = []
+    active_profile    = [None] # the profile whose timers are in place, shared by all tests
+    #f profile_start
+    def profile_start(self):
+        """
+        Start profiling (if enabled); the timers of an earlier test that did not finish are removed first
+        """
+        self.profile = None
+        if self.active_profile[0] is not None:
+            self.active_profile[0].unwrap_all()
+            self.active_profile[0] = None
+            pass
+        self.profile_filename = profile_setting()
+        if self.profile_filename is None: return
+        self.profile = Profile()
+        self.active_profile[0] = self.profile
+        self.profile_start_cycle = self.profile_global_cycle()
+        self.profile.wrap_attribute(self, "bfm_wait", "bfm_wait", cycles_arg=True)
+        for m in self.profile_methods:
+            if hasattr(self, m): self.profile.wrap_attribute(self, m, m)
+            pass
+        for (n, v) in list(vars(self).items()):
+            if hasattr(v, "wait_for_value"):
+                self.profile.wrap_attribute(v, "wait_for_value", "%s.wait_for_value"%n)
+                pass
+            pass
+        for (module, fn) in self.profile_functions:
+            self.profile.wrap_attribute(module, fn, "%s.%s"%(module.__name__.split(".")[-1], fn))
+            pass
+        pass
+    #f profile_global_cycle
+    def profile_global_cycle(self):
+        global_cycle = getattr(self, "global_cycle", None)
+        if global_cycle is None: return None
+        return global_cycle()
+    #f profile_finish
+    def profile_finish(self):
+        """
+        Report the profile of the test (if enabled), and remove the timers
+        """
+        if getattr(self, "profile", None) is None: return
+        try:
+            cycles = None
+            end_cycle = self.profile_global_cycle()
+            if end_cycle is not None: cycles = end_cycle - self.profile_start_cycle
+            summary = self.profile.summary(self.__class__.__name__, cycles)
+            pass
+        finally:
+            self.profile.unwrap_all()
+            self.profile = None
+            self.active_profile[0] = None
+            pass
+        self.verbose.info("Profile %s: %d cycles in %.3fs, %.0f cycles/s, %.1f%% in Python"%(summary["test"], summary["cycles"], summary["wall"], summary["cycles_per_second"], summary["python_percent"]))
+        if len(summary["unwrapped"])>0:
+            self.verbose.info("Profile %s: %d methods could not be timed (%d of them simulation waits, so the Python time is overstated): %s"%(summary["test"], len(summary["unwrapped"]), summary["unwrapped_sim_waits"], " ".join(summary["unwrapped"])))
+            pass
+        for (n, m) in summary["methods"].items():
+            self.verbose.info("Profile %s:   %-32s calls %8d total %9.3fs own %9.3fs"%(summary["test"], n, m["calls"], m["total"], m["own"]))
+            pass
+        if self.profile_filename!="":
+            with open(self.profile_filename, "a") as f:
+                f.write(json.dumps(summary)+"\n")
+                pass
+            pass
+        pass
+    pass
@@ -0,0 +1,319 @@
+#a Copyright
+#
+#  This file 'scoreboard.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Streaming scoreboard matching logged events against expectations
+
+Expectations are any objects with a check_with_log(l) method returning
+(err, optional), as TbiExp has; they are queued in order with add, and
+each logged event is matched against the head of the queue with check.
+An optional expectation that does not match is discarded and the event
+is matched against the next one; an expectation with an 'even'
+requirement (such as TbiR(even=True, optional=True)) therefore only
+consumes an event at the right position.
+
+The queue is a deque, so matching is O(1) per event however far ahead
+the expectations are produced; if window is given then adding more than
+that many outstanding expectations is an error, which keeps the memory
+of a long run bounded (the test must check as it goes). The last few
+matched pairs are kept so that a mismatch can be reported with the
+events that led up to it and the expectations that follow it.
+
+An ArrayScoreboard does the same for expectations without optional
+entries, such as GMII rx data, but compares whole batches of events in
+columnar form (from log_batch.drain_log_columns) against the expected
+values with array operations.
+
+A PacketScoreboard is for whole frames in long soak runs: each frame
+carries a sequence number, and only the frames in flight are held, as
+their length and a hash of their data, so memory does not grow with the
+length of the run. Received frames are classified as in order,
+reordered, corrupted (bad FCS, length or hash) or unknown; frames still
+outstanding when a frame drop_horizon later in the sequence arrives, or
+at the end, are dropped.
+"""
+
+#a Imports
+from collections import deque, OrderedDict
+import zlib
+import itertools
+import array
+import numpy as np
+
+#a Classes
+#c Scoreboard
+class Scoreboard(object):
+    """
+    check and drain return a list of mismatch messages (empty if all matched)
+    """
+    #f __init__
+    def __init__(self, name="scoreboard", window=None, context=4):
+        self.name       = name
+        self.window     = window
+        self.expected   = deque()
+        self.history    = deque(maxlen=context)
+        self.context    = context
+        self.matched    = 0
+        self.skipped    = 0
+        self.mismatches = 0
+        pass
+    #f __len__
+    def __len__(self):
+        return len(self.expected)
+    #f add
+    def add(self, expectation):
+        if (self.window is not None) and (len(self.expected)>=self.window):
+            raise Exception("%s: more than %d expectations outstanding - check the scoreboard as the test runs"%(self.name, self.window))
+        self.expected.append(expectation)
+        pass
+    #f extend
+    def extend(self, expectations):
+        for e in expectations:
+            self.add(e)
+            pass
+        pass
+    #f mismatch_context
+    def mismatch_context(self, l, exp):
+        r = "%s: mismatch of %s with expected %s"%(self.name, str(l), str(exp))
+        if len(self.history)>0:
+            r += "; after " + ", ".join(["%s=%s"%(str(hl),str(he)) for (hl,he) in self.history])
+            pass
+        if len(self.expected)>0:
+            r += "; then expecting " + ", ".join([str(e) for e in itertools.islice(self.expected, self.context)])
+            pass
+        return r
+    #f check
+    def check(self, l):
+        """
+        Match one logged event against the expectations
+        """
+        while len(self.expected)>0:
+            exp = self.expected.popleft()
+            (err, optional) = exp.check_with_log(l)
+            if not err:
+                self.matched += 1
+                self.history.append((l, exp))
+                return []
+            if not optional:
+                self.mismatches += 1
+                message = self.mismatch_context(l, exp)
+                self.history.append((l, exp))
+                return [message]
+            self.skipped += 1
+            pass
+        self.mismatches += 1
+        return ["%s: unexpected %s when no more expected"%(self.name, str(l))]
+    #f drain
+    def drain(self, log_data, log_parser, stop_when_empty=False):
+        """
+        Check all the events currently in a log recorder, using log_parser to parse them
+
+        If stop_when_empty then events are left in the recorder once there
+        are no outstanding expectations (for tests that add them as they go)
+        """
+        messages = []
+        while log_data.num_events()!=0:
+            if stop_when_empty and (len(self.expected)==0): break
+            l = log_parser.parse_log_event(log_data.event_pop())
+            if l is None: continue
+            messages.extend(self.check(l))
+            pass
+        return messages
+    #f finish
+    def finish(self):
+        """
+        Discard trailing optional expectations; return a message if any others are still outstanding
+        """
+        while (len(self.expected)>0) and getattr(self.expected[0], "optional", False):
+            self.expected.popleft()
+            self.skipped += 1
+            pass
+        if len(self.expected)==0: return []
+        return ["%s: %d expectations not seen, first %s"%(self.name, len(self.expected), str(self.expected[0]))]
+    #f __str__
+    def __str__(self):
+        return "%s: matched %d skipped %d mismatched %d outstanding %d"%(self.name, self.matched, self.skipped, self.mismatches, len(self.expected))
+    pass
+
+#c ArrayScoreboard
+class ArrayScoreboard(object):
+    """
+    Scoreboard of expected values for fields, checked a batch of columns at a time
+
+    An expected value of None (stored as -1) matches anything.
+    """
+    #f __init__
+    def __init__(self, name, fields, window=None, context=4):
+        self.name       = name
+        self.fields     = fields
+        self.window     = window
+        self.context    = context
+        self.expected   = {f:array.array("q") for f in fields}
+        self.matched    = 0
+        self.mismatches = 0
+        pass
+    #f __len__
+    def __len__(self):
+        return len(self.expected[self.fields[0]])
+    #f add
+    def add(self, values):
+        """
+        Add one expectation, a tuple of values in the order of fields
+        """
+        if (self.window is not None) and (len(self)>=self.window):
+            raise Exception("%s: more than %d expectations outstanding - check the scoreboard as the test runs"%(self.name, self.window))
+        for (f,v) in zip(self.fields, values):
+            self.expected[f].append(-1 if v is None else v)
+            pass
+        pass
+    #f extend
+    def extend(self, values_list):
+        for values in values_list:
+            self.add(values)
+            pass
+        pass
+    #f expected_str
+    def expected_str(self, i):
+        return " ".join(["%s:%s"%(f, "-" if self.expected[f][i]<0 else "%d"%self.expected[f][i]) for f in self.fields])
+    #f check_columns
+    def check_columns(self, columns):
+        """
+        Check a LogColumns against the outstanding expectations, consuming those that it covers
+        """
+        messages = []
+        n_actual = len(columns)
+        n = min(n_actual, len(self))
+        if n>0:
+            mismatch = np.zeros(n, dtype=np.bool_)
+            for f in self.fields:
+                exp = np.frombuffer(self.expected[f][:n], dtype=np.int64)
+                mismatch |= (exp>=0) & (exp!=columns[f][:n])
+                pass
+            bad = np.flatnonzero(mismatch)
+            if len(bad)>0:
+                i = int(bad[0])
+                r = "%s: %d mismatches, first at event %d: %s with expected %s"%(self.name, len(bad), self.matched+i, columns.row_str(i), self.expected_str(i))
+                if i>0:
+                    r += "; after " + ", ".join([columns.row_str(j) for j in range(max(0,i-self.context), i)])
+                    pass
+                messages.append(r)
+                pass
+            self.mismatches += len(bad)
+            self.matched    += n - len(bad)
+            for f in self.fields:
+                del self.expected[f][:n]
+                pass
+            pass
+        if n_actual>n:
+            self.mismatches += n_actual-n
+            messages.append("%s: %d unexpected events when no more expected, first %s"%(self.name, n_actual-n, columns.row_str(n)))
+            pass
+        return messages
+    #f finish
+    def finish(self):
+        if len(self)==0: return []
+        return ["%s: %d expectations not seen, first %s"%(self.name, len(self), self.expected_str(0))]
+    #f __str__
+    def __str__(self):
+        return "%s: matched %d mismatched %d outstanding %d"%(self.name, self.matched, self.mismatches, len(self))
+    pass
+
+#c PacketScoreboard
+class PacketScoreboard(object):
+    """
+    Scoreboard of in-flight frames by sequence number, holding (length, hash) of each
+    """
+    #f __init__
+    def __init__(self, name="packets", drop_horizon=64):
+        self.name         = name
+        self.drop_horizon = drop_horizon
+        self.in_flight    = OrderedDict()
+        self.max_in_flight = 0
+        self.sent       = 0
+        self.received   = 0
+        self.in_order   = 0
+        self.reordered  = 0
+        self.corrupted  = 0
+        self.dropped    = 0
+        self.unknown    = 0
+        pass
+    #f frame_hash
+    @staticmethod
+    def frame_hash(data):
+        return zlib.crc32(data)
+    #f add
+    def add(self, seq, data):
+        """
+        Add a frame sent with sequence number seq; data is what should be received
+        """
+        self.in_flight[seq] = (len(data), self.frame_hash(data))
+        self.sent += 1
+        if len(self.in_flight)>self.max_in_flight: self.max_in_flight = len(self.in_flight)
+        pass
+    #f drop_before
+    def drop_before(self, seq):
+        messages = []
+        while len(self.in_flight)>0:
+            oldest = next(iter(self.in_flight))
+            if oldest>=seq: break
+            del self.in_flight[oldest]
+            self.dropped += 1
+            messages.append("%s: frame %d dropped"%(self.name, oldest))
+            pass
+        return messages
+    #f check
+    def check(self, seq, data, fcs_ok=True):
+        """
+        Check a received frame whose data carries sequence number seq; return a list of messages for any errors
+        """
+        self.received += 1
+        messages = self.drop_before(seq - self.drop_horizon)
+        if seq not in self.in_flight:
+            if not fcs_ok:
+                self.corrupted += 1
+                messages.append("%s: frame with bad FCS and unknown sequence number %d"%(self.name, seq))
+                return messages
+            self.unknown += 1
+            messages.append("%s: frame %d received but not in flight (duplicate, or dropped earlier)"%(self.name, seq))
+            return messages
+        (length, h) = self.in_flight.pop(seq)
+        if (not fcs_ok) or (length!=len(data)) or (h!=self.frame_hash(data)):
+            self.corrupted += 1
+            messages.append("%s: frame %d corrupted (FCS %s, length %d expected %d)"%(self.name, seq, "ok" if fcs_ok else "bad", len(data), length))
+            return messages
+        if (len(self.in_flight)>0) and (next(iter(self.in_flight))<seq):
+            self.reordered += 1
+            messages.append("%s: frame %d received before earlier frame %d"%(self.name, seq, next(iter(self.in_flight))))
+            return messages
+        self.in_order += 1
+        return messages
+    #f finish
+    def finish(self):
+        """
+        All frames still in flight are dropped
+        """
+        return self.drop_before(1<<62)
+    #f counts
+    def counts(self):
+        return {"sent":self.sent, "received":self.received, "in_order":self.in_order, "reordered":self.reordered,
+                "corrupted":self.corrupted, "dropped":self.dropped, "unknown":self.unknown,
+                "in_flight":len(self.in_flight), "max_in_flight":self.max_in_flight}
+    #f __str__
+    def __str__(self):
+        return "%s: "%self.name + " ".join(["%s %d"%(k,v) for (k,v) in self.counts().items()])
+    pass
@@ -0,0 +1,56 @@
+#a Copyright
+#
+#  This file 'shards.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Sharding of exhaustive tests across independent simulations
+
+A test class declares that it can be split by setting a class attribute
+'shards' to the number of pieces, and uses shard_range to get its part of
+the range it covers (such as the 1024 symbols of a decode test). The
+parallel regression (regress_parallel.py) runs each shard as a separate
+simulation, with the environment variable CDL_REGRESS_SHARD set to
+'index/count'; without it (as in a normal regression) a test is one
+shard and covers the whole range.
+"""
+
+#a Imports
+import os
+
+#a Constants
+shard_env = "CDL_REGRESS_SHARD"
+
+#a Functions
+#f shard
+def shard():
+    """
+    Return (index, count) of the shard this simulation is running
+    """
+    s = os.environ.get(shard_env, "")
+    if s=="": return (0,1)
+    (index, count) = s.split("/")
+    (index, count) = (int(index), int(count))
+    if (count<1) or (index<0) or (index>=count): raise Exception("Bad shard '%s' in %s"%(s, shard_env))
+    return (index, count)
+
+#f shard_range
+def shard_range(n):
+    """
+    Return (start, end) of the part of range(n) covered by this shard
+    """
+    (index, count) = shard()
+    return ((n*index)//count, (n*(index+1))//count)
@@ -0,0 +1,252 @@
+#a Copyright
+#
+#  This file 'stream_8b10b.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Bulk 8b10b encode and decode of whole arrays of symbols using NumPy
+
+The tables are built from the reference model in encdec_8b10b, so the
+results match find_encoding_8b10b bit for bit; the running disparity
+is carried across the array with a prefix scan rather than a Python
+loop per symbol.
+
+Every symbol, valid or not, changes the running disparity in one of four
+ways: it leaves it unchanged, inverts it, or forces it negative or
+positive. For the valid encodings it is only ever unchanged or inverted;
+for code violations the IEEE 802.3 clause 36.2.4.4 sub-block rule is used
+(a sub-block with more ones than zeros, or 000111/0011, leaves it positive;
+more zeros than ones, or 111000/1100, leaves it negative).
+"""
+
+#a Imports
+import numpy as np
+from .encdec_8b10b import get_tables, symbol_disparity
+
+#a Tables
+#c Tables8b10b
+class Tables8b10b(object):
+    """
+    Encode tables are indexed by is_control<<9 | data<<1 | disparity_in
+
+    Decode tables are indexed by symbol<<1 | disparity_in
+    """
+    def __init__(self):
+        self.enc_symbol    = np.zeros(1024, dtype=np.uint16)
+        self.enc_flip      = np.zeros(1024, dtype=np.uint8)
+        self.enc_valid     = np.zeros(1024, dtype=np.bool_)
+        self.dec_data      = np.zeros(2048, dtype=np.uint8)
+        self.dec_control   = np.zeros(2048, dtype=np.bool_)
+        self.dec_valid     = np.zeros(2048, dtype=np.bool_)
+        self.dec_disparity = np.zeros(2048, dtype=np.uint8)
+        for i in range(2048):
+            self.dec_disparity[i] = symbol_disparity(i>>1, i&1)
+            pass
+        for e in get_tables().encodings_8b10b:
+            ei = (e.is_control<<9) | (e.data<<1) | e.disparity_in
+            di = (e.encoding<<1) | e.disparity_in
+            self.enc_symbol[ei]    = e.encoding
+            self.enc_flip[ei]      = e.disparity_in ^ e.disparity_out
+            self.enc_valid[ei]     = True
+            self.dec_data[di]      = e.data
+            self.dec_control[di]   = e.is_control
+            self.dec_valid[di]     = True
+            self.dec_disparity[di] = e.disparity_out
+            pass
+        pass
+    pass
+
+#f stream_tables
+_tables = None
+def stream_tables():
+    """
+    Build the NumPy tables on first use
+    """
+    global _tables
+    if _tables is None: _tables = Tables8b10b()
+    return _tables
+
+#a Running disparity
+#f running_disparity_out
+def running_disparity_out(out_if_negative, out_if_positive, start_disparity):
+    """
+    Given, per symbol, the disparity out for a negative and for a positive
+    disparity in, return the running disparity after each symbol
+
+    Symbols that force the disparity are reset points; between reset points
+    the disparity is the value at the last reset point XORed with the parity
+    of the inverting symbols since then.
+    """
+    n = len(out_if_negative)
+    if n==0: return np.zeros(0, dtype=np.uint8)
+    forced   = (out_if_negative==out_if_positive)
+    inverts  = (out_if_negative!=0) & (out_if_positive==0)
+    parity   = np.bitwise_xor.accumulate(inverts.astype(np.uint8))
+    last_forced = np.maximum.accumulate(np.where(forced, np.arange(n), -1))
+    base = np.where(last_forced<0,
+                    (start_disparity&1) ^ parity,
+                    out_if_negative[np.maximum(last_forced,0)] ^ parity ^ parity[np.maximum(last_forced,0)])
+    return base.astype(np.uint8)
+
+#f disparity_in_of_out
+def disparity_in_of_out(disparity_out, start_disparity):
+    disparity_in = np.empty_like(disparity_out)
+    if len(disparity_out)==0: return disparity_in
+    disparity_in[0]  = start_disparity&1
+    disparity_in[1:] = disparity_out[:-1]
+    return disparity_in
+
+#a Stream encode/decode
+#f encode_stream
+def encode_stream(data, is_control_mask=None, start_disparity=0):
+    """
+    Encode an array of bytes (with an optional per-byte control mask)
+
+    Returns (symbols, disparity, code_violation) where symbols is uint16,
+    disparity is the running disparity after each symbol (uint8), and
+    code_violation is asserted for a byte that has no encoding (a control
+    that is not one of the K code groups); such a byte yields a 0 symbol
+    and leaves the disparity unchanged.
+    """
+    data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else np.asarray(data, dtype=np.uint8)
+    index = data.astype(np.uint16)<<1
+    if is_control_mask is not None:
+        index |= np.asarray(is_control_mask, dtype=np.uint16)<<9
+        pass
+    tables = stream_tables()
+    code_violation = ~tables.enc_valid[index]
+    inverts        = tables.enc_flip[index]
+    disparity      = ((start_disparity&1) ^ np.bitwise_xor.accumulate(inverts)).astype(np.uint8)
+    symbols        = tables.enc_symbol[index | disparity_in_of_out(disparity, start_disparity)]
+    return (symbols, disparity, code_violation)
+
+#f decode_stream
+def decode_stream(symbols, start_disparity=0):
+    """
+    Decode an array of 10-bit symbols
+
+    Returns (data, is_control, disparity, code_violation) where data is
+    uint8, is_control is bool, disparity is the running disparity after
+    each symbol (uint8), and code_violation is asserted for a symbol that is
+    not a valid code group for the running disparity at that point.
+    """
+    tables = stream_tables()
+    index = (np.asarray(symbols, dtype=np.uint16)&0x3ff)<<1
+    disparity      = running_disparity_out(tables.dec_disparity[index], tables.dec_disparity[index|1], start_disparity)
+    index         |= disparity_in_of_out(disparity, start_disparity)
+    data           = tables.dec_data[index]
+    is_control     = tables.dec_control[index]
+    code_violation = ~tables.dec_valid[index]
+    return (data, is_control, disparity, code_violation)
+
+#a Stream validation
+#c StreamCheck
+class StreamCheck(object):
+    """
+    Result of check_stream
+
+    counts is a dictionary of aggregate counters; violations is the array
+    of the indexes of the first max_violations symbols with any violation,
+    and violation_kinds the bitmask (violation_*) of each of those
+    """
+    violation_invalid   = 1 # not a code group for either disparity
+    violation_disparity = 2 # a code group, but not for the running disparity
+    violation_odd_comma = 4 # a comma at an odd position
+    violation_names = {violation_invalid:"invalid", violation_disparity:"disparity", violation_odd_comma:"odd_comma"}
+    def __init__(self, counts, violations, violation_kinds, even_offset):
+        self.counts          = counts
+        self.violations      = violations
+        self.violation_kinds = violation_kinds
+        self.even_offset     = even_offset
+        pass
+    def ok(self):
+        return self.counts["violations"]==0
+    def violation_list(self):
+        """
+        List of (index, [names of violations]) for the recorded violations
+        """
+        result = []
+        for (i,k) in zip(self.violations.tolist(), self.violation_kinds.tolist()):
+            result.append((i, [n for (b,n) in self.violation_names.items() if k & b]))
+            pass
+        return result
+    def __str__(self):
+        r = " ".join(["%s:%d"%(k,v) for (k,v) in self.counts.items()])
+        if len(self.violations)>0:
+            r += " first violations " + ", ".join(["%d:%s"%(i,"/".join(k)) for (i,k) in self.violation_list()])
+            pass
+        return r
+    pass
+
+#f initial_disparity
+def initial_disparity(symbols):
+    """
+    Running disparity that the first symbol of a capture that starts mid-stream must have been sent with
+
+    This is the disparity of the first symbol that is only a valid code
+    group for one disparity (0 if there is none)
+    """
+    tables = stream_tables()
+    index = (np.asarray(symbols, dtype=np.uint16)&0x3ff)<<1
+    valid_neg = tables.dec_valid[index]
+    valid_pos = tables.dec_valid[index|1]
+    one_only = np.flatnonzero(valid_neg ^ valid_pos)
+    if len(one_only)==0: return 0
+    first = one_only[0]
+    (data, is_control, disparity, code_violation) = decode_stream(symbols[:first+1], 0)
+    if code_violation[first]: return 1
+    return 0
+
+#f check_stream
+def check_stream(symbols, start_disparity=None, even_offset=None, max_violations=16):
+    """
+    Check a captured stream of 10-bit code groups, such as the tbi_tx output of the gasket
+
+    Checks that every symbol is a valid code group for the running
+    disparity, and that commas (K28.1, K28.5, K28.7) only occur in even
+    positions. If start_disparity is None it is deduced from the stream
+    (see initial_disparity); if even_offset is None then the position of the
+    first comma is taken to be even.
+
+    The whole capture is checked with array operations; returns a StreamCheck.
+    """
+    symbols = np.asarray(symbols, dtype=np.uint16)&0x3ff
+    n = len(symbols)
+    tables = stream_tables()
+    if start_disparity is None: start_disparity = initial_disparity(symbols)
+    index = symbols.astype(np.uint16)<<1
+    valid_either = tables.dec_valid[index] | tables.dec_valid[index|1]
+    (data, is_control, disparity, code_violation) = decode_stream(symbols, start_disparity)
+    comma = ((symbols>>3)==0x1f) | ((symbols>>3)==0x60)
+    comma_positions = np.flatnonzero(comma)
+    if even_offset is None:
+        even_offset = int(comma_positions[0]&1) if len(comma_positions)>0 else 0
+        pass
+    odd_comma_positions = comma_positions[((comma_positions - even_offset)&1)!=0]
+    kinds = np.zeros(n, dtype=np.uint8)
+    kinds[~valid_either] |= StreamCheck.violation_invalid
+    kinds[code_violation & valid_either] |= StreamCheck.violation_disparity
+    kinds[odd_comma_positions] |= StreamCheck.violation_odd_comma
+    violations = np.flatnonzero(kinds)
+    counts = {"symbols":n,
+              "invalid":int(np.count_nonzero(~valid_either)),
+              "disparity_errors":int(np.count_nonzero(code_violation & valid_either)),
+              "commas":len(comma_positions),
+              "odd_commas":len(odd_comma_positions),
+              "violations":len(violations),
+    }
+    first = violations[:max_violations]
+    return StreamCheck(counts, first, kinds[first], even_offset)
@@ -73,3 +73,9 @@ t_enc_8b10b_data = {
     "disparity":1,
 }
 
+
+#t t_apb_request
+t_apb_request = {"paddr":32, "penable":1, "psel":1, "pwrite":1, "pwdata":32}
+
+#t t_apb_response
+t_apb_response = {"prdata":32, "pready":1, "perr":1}
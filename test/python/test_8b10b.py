@@ -24,7 +24,12 @@ from cdl.sim     import ThExecFile
 from cdl.sim     import HardwareThDut
 from cdl.sim     import TestCase
 from cdl.utils   import csr
-from .encdec_8b10b import find_encoding, encodings_8b10b
+from .encdec_8b10b import decode_8b10b, get_tables
+from .shards       import shard_range
+from .profiling    import ProfiledExecFile
+import sys
+import array
+import numpy as np
 
 #a Signal types
 #t t_dec_8b10b_data - t_8b10b_dec_data
@@ -51,11 +56,14 @@ t_enc_8b10b_data = {
 
 #a Test classes
 #c Code8b10bTest_Base
-class Code8b10bTest_Base(ThExecFile):
+class Code8b10bTest_Base(ProfiledExecFile, ThExecFile):
     """
     """
+    profile_methods   = ["pipeline", "compare_arrays"]
+    profile_functions = [(sys.modules[__name__], "decode_8b10b"), (sys.modules[__name__], "get_tables")]
     #f run__init - invoked by submodules
     def run__init(self):
+        self.profile_start()
         self.bfm_wait(10)
         pass
 
@@ -65,6 +73,7 @@ class Code8b10bTest_Base(ThExecFile):
 
     #f run__finalize
     def run__finalize(self):
+        self.profile_finish()
         self.passtest("Test completed")
         pass
 
@@ -74,7 +83,7 @@ class Code8b10bTest_Encode_0(Code8b10bTest_Base):
     """
     #f run
     def run(self):
-        for e in encodings_8b10b:
+        for e in get_tables().encodings_8b10b:
             self.enc_data__data.drive(e.data)
             self.enc_data__is_control.drive(e.is_control)
             self.enc_data__disparity.drive(e.disparity_in)
@@ -92,7 +101,7 @@ class Code8b10bTest_Decode_0(Code8b10bTest_Base):
     """
     #f run
     def run(self):
-        for e in encodings_8b10b:
+        for e in get_tables().encodings_8b10b:
             self.enc_data__data.drive(e.data)
             self.enc_data__is_control.drive(e.is_control)
             self.enc_data__disparity.drive(e.disparity_in)
@@ -120,13 +129,15 @@ class Code8b10bTest_Decode_0(Code8b10bTest_Base):
 #c Code8b10bTest_Decode_1
 class Code8b10bTest_Decode_1(Code8b10bTest_Base):
     """
+    Decode every 10-bit symbol in both disparities; split by symbol range in a parallel regression
     """
+    shards = 4
     #f run
     def run(self):
         pass
-        for symbol in range(1024):
+        for symbol in range(*shard_range(1024)):
             for disp in range(2):
-                e = find_encoding(encodings_8b10b, {"encoding":symbol, "disparity_in":disp})
+                e = decode_8b10b(symbol, disp)
                 self.dec_symbol__disparity_positive.drive(disp)
                 self.dec_symbol__symbol.drive(symbol)
                 self.bfm_wait(2)
@@ -152,6 +163,109 @@ class Code8b10bTest_Decode_1(Code8b10bTest_Base):
         pass
     pass
 
+#c Code8b10bTest_Pipelined_Base
+class Code8b10bTest_Pipelined_Base(Code8b10bTest_Base):
+    """
+    Present a new input every cycle and capture the outputs every cycle,
+    then compare them all against the reference at the end
+
+    tb_8b10b registers the combinatorial encoder and decoder outputs, so
+    the output for an input driven before a clock edge is read after it
+    (pipeline_lag cycles later).
+    """
+    pipeline_lag = 1
+    #f pipeline
+    def pipeline(self, inputs, drive, outputs):
+        """
+        Drive each of inputs in turn (with drive(input)), one per cycle, and
+        return a dictionary of arrays of the outputs (name:signal) for each input
+        """
+        captured = {name:array.array("q") for name in outputs}
+        reads = [(captured[name].append, signal.value) for (name, signal) in outputs.items()]
+        for i in range(len(inputs)+self.pipeline_lag-1):
+            if i<len(inputs): drive(inputs[i])
+            self.bfm_wait(1)
+            for (append, value) in reads:
+                append(value())
+                pass
+            pass
+        skip = self.pipeline_lag-1
+        return {name:np.array(captured[name][skip:], dtype=np.int64) for name in outputs}
+    #f compare_arrays
+    def compare_arrays(self, reason, describe, expected, actual, mask=None):
+        """
+        Compare arrays of expected and actual values (where mask is true), reporting the first few mismatches
+        """
+        mismatch = (expected!=actual)
+        if mask is not None: mismatch &= mask
+        bad = np.flatnonzero(mismatch)
+        for i in bad[:8]:
+            self.compare_expected("%s of %s"%(reason, describe(int(i))), int(expected[i]), int(actual[i]))
+            pass
+        if len(bad)>8:
+            self.failtest("%s: %d mismatches in total"%(reason, len(bad)))
+            pass
+        pass
+    #f All done
+    pass
+
+#c Code8b10bTest_Encode_1
+class Code8b10bTest_Encode_1(Code8b10bTest_Pipelined_Base):
+    """
+    Pipelined encode of every encoding
+    """
+    #f run
+    def run(self):
+        encodings = get_tables().encodings_8b10b
+        def drive(e):
+            self.enc_data__data.drive(e.data)
+            self.enc_data__is_control.drive(e.is_control)
+            self.enc_data__disparity.drive(e.disparity_in)
+            pass
+        actual = self.pipeline(encodings, drive, {"symbol":self.enc_symbol__symbol,
+                                                  "disparity":self.enc_symbol__disparity_positive})
+        describe = lambda i:str(encodings[i])
+        self.compare_arrays("Encoding", describe, np.array([e.encoding for e in encodings]), actual["symbol"])
+        self.compare_arrays("Disparity out", describe, np.array([e.disparity_out for e in encodings]), actual["disparity"])
+        self.bfm_wait(10)
+        self.enc_data__data.drive(0)
+        pass
+    pass
+
+#c Code8b10bTest_Decode_2
+class Code8b10bTest_Decode_2(Code8b10bTest_Pipelined_Base):
+    """
+    Pipelined decode of every 10-bit symbol in both disparities
+    """
+    #f run
+    def run(self):
+        inputs = [(symbol, disp) for symbol in range(1024) for disp in range(2)]
+        def drive(symbol_disp):
+            self.dec_symbol__symbol.drive(symbol_disp[0])
+            self.dec_symbol__disparity_positive.drive(symbol_disp[1])
+            pass
+        actual = self.pipeline(inputs, drive, {"valid":self.dec_data__valid,
+                                               "data":self.dec_data__data,
+                                               "is_control":self.dec_data__is_control,
+                                               "is_data":self.dec_data__is_data,
+                                               "disparity":self.dec_data__disparity_positive})
+        decodes = [decode_8b10b(symbol, disp) for (symbol, disp) in inputs]
+        valid = np.array([e is not None for e in decodes])
+        expected = {"valid":valid.astype(np.int64),
+                    "data":np.array([0 if e is None else e.data for e in decodes]),
+                    "is_control":np.array([0 if e is None else e.is_control for e in decodes]),
+                    "is_data":np.array([0 if e is None else 1^e.is_control for e in decodes]),
+                    "disparity":np.array([0 if e is None else e.disparity_out for e in decodes]),
+        }
+        describe = lambda i:"code %03d disparity %d"%inputs[i]
+        self.compare_arrays("Valid", describe, expected["valid"], actual["valid"])
+        for f in ["data", "is_control", "is_data", "disparity"]:
+            self.compare_arrays(f, describe, expected[f], actual[f], mask=valid)
+            pass
+        self.bfm_wait(10)
+        pass
+    pass
+
 #a Hardware classes
 #c Code8b10bHw
 class Code8b10bHw(HardwareThDut):
@@ -178,6 +292,8 @@ class Code8b10b(TestCase):
         "enc_0"  : (Code8b10bTest_Encode_0, 5*1000,  kwargs),
         "dec_0"  : (Code8b10bTest_Decode_0, 8*1000,  kwargs),
         "dec_1"  : (Code8b10bTest_Decode_1,10*1000,  kwargs),
+        "enc_1"  : (Code8b10bTest_Encode_1, 1*1000,  kwargs),
+        "dec_2"  : (Code8b10bTest_Decode_2, 3*1000,  kwargs),
         "smoke"  : (Code8b10bTest_Decode_0, 8*1000,  kwargs),
     }
     pass
@@ -0,0 +1,554 @@
+#a Copyright
+#
+#  This file 'test_gbe.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Throughput tests of gbe_axi4s32 with sgmii_gmii_gasket, using tb_gbe
+
+Packets are streamed back-to-back in to the MAC transmit AXI4-S, through
+the gasket to TBI, looped back in the testbench to the gasket receive,
+and out of the MAC receive AXI4-S. Every received frame is checked
+against the transmitted data (with padding to 60 bytes) and for a good
+FCS, and the rate at which frames complete is compared with 1Gb/s line
+rate at the minimum inter-packet gap.
+
+tb_gbe logs a latency_probe event (with its cycle) for the first cycle
+of tx_axi4s valid for a packet, each /S/ on tbi_tx, each /T/ on the
+gasket tbi_rx, and each last word taken from rx_axi4s. The latency tests
+send one packet at a time, so the transmit latency (tvalid to /S/) and
+receive latency (/T/ to tlast) are those of the pipeline rather than of
+queueing; they are collected in to per-size histograms and written out
+as JSON.
+
+The GMII clock is one byte per cycle (8ns at 1Gb/s), and a frame of n
+bytes (including FCS) occupies 8 (preamble) + n + 12 (minimum IPG)
+byte times on the wire.
+"""
+
+#a Imports
+import itertools
+import struct
+import numpy as np
+from cdl.sim     import ThExecFile, LogEventParser
+from cdl.sim     import HardwareThDut
+from cdl.sim     import TestCase
+from .structs    import t_tbi_valid, t_sgmii_gasket_control, t_sgmii_gasket_status
+from .log_batch  import drain_log_columns
+from .latency    import LatencyCollector
+from .scoreboard import PacketScoreboard
+from .pcap       import PcapReader, PcapWriter
+from .traffic    import RandomTraffic
+from .crc32      import residue, fcs_ok, fcs_residue
+from .an_model   import an_fsm_data
+from typing import Optional
+
+#a Constants
+byte_time_ns   = 8
+preamble_bytes = 8
+min_ipg_bytes  = 12
+min_frame_data = 60 # without FCS; the MAC pads to this
+
+#v Latency probe numbers - as in tb_gbe
+latency_probe_tx_axi4s_start = 0
+latency_probe_tbi_tx_S       = 1
+latency_probe_tbi_rx_T       = 2
+latency_probe_rx_axi4s_last  = 3
+
+#f wire_bytes
+def wire_bytes(frame_length):
+    """
+    Byte times on the wire for a frame of frame_length bytes (including FCS) at minimum IPG
+    """
+    return preamble_bytes + frame_length + min_ipg_bytes
+
+#a Log parsers
+#c LatencyLogParser - log event parser for tb_gbe latency probes
+class LatencyLogParser(LogEventParser):
+    def filter_module(self, module_name:str) -> bool : return True
+    def map_log_type(self, log_type:str) -> Optional[str] :
+        if log_type in self.attr_map: return log_type
+        return None
+    attr_map = {"latency_probe":{"probe":1,"cycle":2}}
+    pass
+
+#a Test classes
+#c GbeTest_Base
+class GbeTest_Base(ThExecFile):
+    """
+    """
+    sync_timeout = 1000
+    #f run__init - invoked by submodules
+    def run__init(self):
+        self.bfm_wait(10)
+        self.cycle = 0
+        self.rx_frame = bytearray()
+        self.rx_frames = []
+        self.rx_count = 0
+        self.tx_axi4s_valid.drive(0)
+        self.rx_axi4s_tready.drive(1)
+        self.tbi_loopback.drive(1)
+        self.sys_cfg.drive(0)
+        self.write_sgmii_control(0,7)
+        self.write_sgmii_control(0,3)
+        self.wait_for_link()
+        pass
+
+    #f wait_for_link
+    def wait_for_link(self):
+        """
+        Wait until the gasket is in data and the receiver is in sync (rather than for a fixed time)
+        """
+        for i in range(self.sync_timeout):
+            if self.sgmii_gasket_status__rx_sync.value() and (self.sgmii_gasket_status__trace__an_fsm.value()==an_fsm_data): return
+            self.bfm_wait(1)
+            pass
+        self.failtest("SGMII gasket did not reach data with rx sync within %d cycles"%self.sync_timeout)
+        pass
+
+    #f run
+    def run(self):
+        pass
+
+    #f run__finalize
+    def run__finalize(self):
+        self.passtest("Test completed")
+        pass
+
+    #f write_sgmii_control
+    def write_sgmii_control(self, address, data):
+        self.sgmii_gasket_control__write_config.drive(1)
+        self.sgmii_gasket_control__write_address.drive(address)
+        self.sgmii_gasket_control__write_data.drive(data)
+        self.bfm_wait(1)
+        self.sgmii_gasket_control__write_config.drive(0)
+        self.bfm_wait(10)
+        pass
+
+    #f tx_axi4s_words
+    def tx_axi4s_words(self, frames):
+        """
+        Generate the (data, strb, last) AXI4-S words for frames, first byte in the bottom of data
+        """
+        for f in frames:
+            for i in range(0, len(f), 4):
+                word = f[i:i+4]
+                data = 0
+                for (j,b) in enumerate(word):
+                    data |= b<<(8*j)
+                    pass
+                yield (data, (1<<len(word))-1, (i+4>=len(f)))
+                pass
+            pass
+        pass
+
+    #f rx_axi4s_cycle
+    def rx_axi4s_cycle(self):
+        """
+        Collect receive AXI4-S data for the current cycle; the last word of a frame completes it
+        """
+        if not self.rx_axi4s_valid.value(): return
+        data = self.rx_axi4s_data.value()
+        strb = self.rx_axi4s_strb.value()
+        for i in range(4):
+            if (strb>>i)&1: self.rx_frame.append((data>>(8*i))&0xff)
+            pass
+        if self.rx_axi4s_last.value():
+            self.rx_count += 1
+            self.rx_frame_complete(self.cycle, bytes(self.rx_frame), self.rx_axi4s_user.value())
+            self.rx_frame = bytearray()
+            pass
+        pass
+
+    #f rx_frame_complete
+    def rx_frame_complete(self, cycle, data, status):
+        self.rx_frames.append((cycle, data, status))
+        pass
+
+    #f stream_frames
+    def stream_frames(self, frames, timeout=None):
+        """
+        Stream frames back-to-back in to the transmit AXI4-S, collecting received frames, until
+        all have been received; returns the list of (cycle, frame data, status) received
+        """
+        if timeout is None: timeout = 1000 + 4*sum([wire_bytes(len(f)+4) for f in frames])
+        first_rx = len(self.rx_frames)
+        if not self.stream(frames, lambda all_sent:len(self.rx_frames)-first_rx>=len(frames), timeout):
+            self.failtest("Timeout waiting for %d frames, received %d"%(len(frames), len(self.rx_frames)-first_rx))
+            pass
+        return self.rx_frames[first_rx:]
+
+    #f stream
+    def stream(self, frames, done, timeout, idle_timeout=False):
+        """
+        Stream frames (any iterable, consumed as they are sent) back-to-back in
+        to the transmit AXI4-S, handling received frames, until done(all_sent)
+
+        Returns False if timeout cycles pass first (or, if idle_timeout, timeout cycles with no frame received)
+        """
+        words = self.tx_axi4s_words(frames)
+        word = next(words, None)
+        end_cycle = self.cycle + timeout
+        rx_count = self.rx_count
+        while not done(word is None):
+            if word is not None:
+                (data, strb, last) = word
+                self.tx_axi4s_valid.drive(1)
+                self.tx_axi4s_data.drive(data)
+                self.tx_axi4s_strb.drive(strb)
+                self.tx_axi4s_last.drive(last)
+                pass
+            else:
+                self.tx_axi4s_valid.drive(0)
+                pass
+            ready = self.tx_axi4s_tready.value()
+            self.bfm_wait(1)
+            self.cycle += 1
+            if (word is not None) and ready: word = next(words, None)
+            self.rx_axi4s_cycle()
+            if idle_timeout and (self.rx_count!=rx_count):
+                rx_count = self.rx_count
+                end_cycle = self.cycle + timeout
+                pass
+            if self.cycle>end_cycle:
+                self.tx_axi4s_valid.drive(0)
+                return False
+            pass
+        self.tx_axi4s_valid.drive(0)
+        return True
+
+    #f check_frames
+    def check_frames(self, frames, received):
+        """
+        Check received frames against transmitted frames - padded data then a good FCS
+        """
+        for (i, (f, (cycle, rx, status))) in enumerate(zip(frames, received)):
+            expected = bytes(f) + bytes(max(0, min_frame_data-len(f)))
+            self.compare_expected("Length of frame %d"%i, len(expected)+4, len(rx))
+            if rx[:len(expected)]!=expected:
+                self.failtest("Data mismatch in frame %d of length %d"%(i, len(f)))
+                pass
+            self.compare_expected("FCS residue of frame %d"%i, fcs_residue, residue(rx))
+            pass
+        pass
+
+    #f line_rate_fraction
+    def line_rate_fraction(self, received):
+        """
+        Fraction of line rate achieved at minimum IPG, measured between the first and last frames received
+
+        Returns (fraction, frames per second, bytes per second)
+        """
+        if len(received)<2: return (0.0, 0.0, 0.0)
+        elapsed = received[-1][0] - received[0][0]
+        ideal   = sum([wire_bytes(len(rx)) for (c, rx, s) in received[1:]])
+        frames  = len(received)-1
+        nbytes  = sum([len(rx) for (c, rx, s) in received[1:]])
+        seconds = elapsed * byte_time_ns * 1e-9
+        return (ideal/elapsed, frames/seconds, nbytes/seconds)
+
+    #f All done
+    pass
+
+#c GbeTest_Throughput_Base
+class GbeTest_Throughput_Base(GbeTest_Base):
+    """
+    For each frame size (data bytes, without FCS) stream frames_per_size frames back-to-back
+
+    The gasket may add a code group to the gap after a frame to keep
+    ordered sets even, and the MAC goes through an idle cycle between
+    packets, so slightly under full line rate is accepted.
+    """
+    frame_sizes        = [60]
+    frames_per_size    = 16
+    line_rate_required = 0.95
+    #f run
+    def run(self):
+        for size in self.frame_sizes:
+            frames = [bytes([(i+j)&0xff for j in range(size)]) for i in range(self.frames_per_size)]
+            received = self.stream_frames(frames)
+            self.check_frames(frames, received)
+            (fraction, frames_per_second, bytes_per_second) = self.line_rate_fraction(received)
+            self.verbose.info("Frame size %d: %.0f frames/s %.0f bytes/s, %.3f of line rate"%(size+4, frames_per_second, bytes_per_second, fraction))
+            if fraction<self.line_rate_required:
+                self.failtest("Frame size %d achieved only %.3f of line rate (required %.3f)"%(size+4, fraction, self.line_rate_required))
+                pass
+            pass
+        pass
+    #f All done
+    pass
+
+#c GbeTest_Throughput_0
+class GbeTest_Throughput_0(GbeTest_Throughput_Base):
+    frame_sizes     = [60]
+    frames_per_size = 32
+
+#c GbeTest_Throughput_1
+class GbeTest_Throughput_1(GbeTest_Throughput_Base):
+    frame_sizes     = [60, 124, 252, 508, 1020, 1514]
+    frames_per_size = 4
+
+#c GbeTest_Latency_Base
+class GbeTest_Latency_Base(GbeTest_Base):
+    """
+    Send frames_per_size frames of each size one at a time, and collect the
+    latency of each from the tb_gbe probes
+
+    If latency_json is not None the histograms are written to it at the end of the test
+    """
+    probe_module    = "dut"
+    frame_sizes     = [60]
+    frames_per_size = 8
+    idle_cycles     = 32
+    latency_json    = "gbe_latency.json"
+    #f run__init
+    def run__init(self):
+        GbeTest_Base.run__init(self)
+        self.latency    = LatencyCollector()
+        self.log_data   = self.log_recorder(self.probe_module)
+        self.log_parser = LatencyLogParser()
+        drain_log_columns(self.log_data, self.log_parser)
+        pass
+    #f probe_cycles
+    def probe_cycles(self, columns, probe, count, name):
+        cycles = columns["cycle"][columns["probe"]==probe]
+        if len(cycles)!=count:
+            self.failtest("Expected %d %s latency probe events but got %d"%(count, name, len(cycles)))
+            return None
+        return cycles
+    #f collect_latencies
+    def collect_latencies(self, size, count):
+        """
+        Drain the probe events for count packets of size bytes (with FCS) and add them to the histograms
+        """
+        columns = drain_log_columns(self.log_data, self.log_parser)
+        tx_start = self.probe_cycles(columns, latency_probe_tx_axi4s_start, count, "tx_axi4s start")
+        tx_S     = self.probe_cycles(columns, latency_probe_tbi_tx_S,       count, "tbi_tx /S/")
+        rx_T     = self.probe_cycles(columns, latency_probe_tbi_rx_T,       count, "tbi_rx /T/")
+        rx_last  = self.probe_cycles(columns, latency_probe_rx_axi4s_last,  count, "rx_axi4s last")
+        if (tx_start is None) or (tx_S is None) or (rx_T is None) or (rx_last is None): return
+        sizes = np.full(count, size)
+        self.latency.add_many("tx", sizes, tx_S - tx_start)
+        self.latency.add_many("rx", sizes, rx_last - rx_T)
+        pass
+    #f run
+    def run(self):
+        for size in self.frame_sizes:
+            for i in range(self.frames_per_size):
+                frame = bytes([(i+j)&0xff for j in range(size)])
+                received = self.stream_frames([frame])
+                self.check_frames([frame], received)
+                self.bfm_wait(self.idle_cycles)
+                pass
+            self.collect_latencies(max(size,min_frame_data)+4, self.frames_per_size)
+            pass
+        pass
+    #f run__finalize
+    def run__finalize(self):
+        for l in str(self.latency).split("\n"):
+            self.verbose.info(l)
+            pass
+        if self.latency_json is not None:
+            self.latency.write_json(self.latency_json)
+            pass
+        GbeTest_Base.run__finalize(self)
+        pass
+    #f All done
+    pass
+
+#c GbeTest_Latency_0
+class GbeTest_Latency_0(GbeTest_Latency_Base):
+    frame_sizes     = [60, 252, 1020, 1514]
+    frames_per_size = 4
+
+#c GbeTest_Pcap
+class GbeTest_Pcap(GbeTest_Base):
+    """
+    Replay the frames of a capture (pcap_in) through tx_axi4s, pcap_batch
+    at a time, and write the frames received on rx_axi4s (without FCS) to
+    pcap_out, timestamped with the simulation time they completed
+
+    If pcap_in is None then a capture of pcap_frames seeded IMIX frames is written first and replayed
+    """
+    pcap_in        = None
+    pcap_out       = "gbe_rx.pcap"
+    pcap_frames    = 16
+    pcap_batch     = 8
+    pcap_generated = "gbe_tx_pcap_in.pcap"
+    #f run
+    def run(self):
+        filename = self.pcap_in
+        if filename is None:
+            filename = self.pcap_generated
+            with PcapWriter(filename) as w:
+                for f in RandomTraffic(seed=3, lengths="imix").frames(self.pcap_frames):
+                    w.write(f.data[:-4])
+                    pass
+                pass
+            pass
+        with PcapReader(filename) as r, PcapWriter(self.pcap_out) as w:
+            packets = iter(r)
+            while True:
+                frames = [p.data for p in itertools.islice(packets, self.pcap_batch)]
+                if len(frames)==0: break
+                received = self.stream_frames(frames)
+                self.check_frames(frames, received)
+                for (cycle, rx, status) in received:
+                    w.write(rx[:-4], cycle*byte_time_ns)
+                    pass
+                pass
+            pass
+        pass
+    #f All done
+    pass
+
+#c GbeTest_Soak_Base
+class GbeTest_Soak_Base(GbeTest_Base):
+    """
+    Soak test - stream soak_frames frames with lengths from soak_lengths
+    (as RandomTraffic) back-to-back, each carrying its sequence number in
+    its first four bytes
+
+    Frames are generated as they are sent and checked as they are
+    received against a PacketScoreboard, which holds only the frames in
+    flight (as length and hash), so memory is flat however long the run.
+    Every report_interval frames received the counts of drops, reorders
+    and corruptions and the throughput over the interval are reported.
+    A longer soak is a subclass with a larger soak_frames (and a cycle
+    limit to match, about 500 cycles per IMIX frame).
+    """
+    soak_frames     = 256
+    soak_lengths    = "imix"
+    soak_seed       = 0
+    report_interval = 64
+    drop_horizon    = 64
+    stall_timeout   = 10000
+    #f run__init
+    def run__init(self):
+        GbeTest_Base.run__init(self)
+        self.packets = PacketScoreboard("soak", drop_horizon=self.drop_horizon)
+        self.interval_start = self.cycle
+        self.interval_frames = 0
+        self.interval_bytes  = 0
+        pass
+    #f soak_tx_frames
+    def soak_tx_frames(self):
+        """
+        Generate the frames (without FCS) to send, adding each to the scoreboard as it is started
+        """
+        traffic = RandomTraffic(seed=self.soak_seed, lengths=self.soak_lengths, min_length=64)
+        for (seq, f) in enumerate(traffic.frames(self.soak_frames)):
+            data = struct.pack("<I", seq) + f.data[4:-4]
+            self.packets.add(seq, data + bytes(max(0, min_frame_data-len(data))))
+            yield data
+            pass
+        pass
+    #f rx_frame_complete
+    def rx_frame_complete(self, cycle, data, status):
+        seq = struct.unpack("<I", data[:4])[0] if len(data)>=4 else -1
+        for m in self.packets.check(seq, data[:-4], fcs_ok=fcs_ok(data)):
+            self.failtest(m)
+            pass
+        self.interval_frames += 1
+        self.interval_bytes  += wire_bytes(len(data))
+        if self.interval_frames>=self.report_interval:
+            self.soak_report(cycle)
+            pass
+        pass
+    #f soak_report
+    def soak_report(self, cycle):
+        elapsed = cycle - self.interval_start
+        if elapsed>0:
+            fraction = self.interval_bytes / elapsed
+            frames_per_second = self.interval_frames / (elapsed * byte_time_ns * 1e-9)
+            self.verbose.info("Soak at cycle %d: %s; last %d frames %.0f frames/s %.3f of line rate"%(cycle, str(self.packets), self.interval_frames, frames_per_second, fraction))
+            pass
+        self.interval_start  = cycle
+        self.interval_frames = 0
+        self.interval_bytes  = 0
+        pass
+    #f run
+    def run(self):
+        if not self.stream(self.soak_tx_frames(), lambda all_sent:all_sent and len(self.packets.in_flight)==0, self.stall_timeout, idle_timeout=True):
+            self.failtest("Soak stalled with no frame received for %d cycles: %s"%(self.stall_timeout, str(self.packets)))
+            pass
+        self.soak_report(self.cycle)
+        for m in self.packets.finish():
+            self.failtest(m)
+            pass
+        self.compare_expected("Soak frames received in order", self.soak_frames, self.packets.in_order)
+        pass
+    #f All done
+    pass
+
+#c GbeTest_Soak_0
+class GbeTest_Soak_0(GbeTest_Soak_Base):
+    soak_frames = 256
+
+#c GbeTest_Soak_1
+class GbeTest_Soak_1(GbeTest_Soak_Base):
+    soak_frames  = 256
+    soak_seed    = 1
+    soak_lengths = [(64,10), (128,2), (256,2), (512,1), (1024,1), (1518,2)]
+
+#a Hardware classes
+#c GbeHw
+class GbeHw(HardwareThDut):
+    clock_desc = [("clk",(0,1,1)),
+    ]
+    reset_desc = {"name":"reset_n", "init_value":0, "wait":5}
+    module_name = "tb_gbe"
+    dut_inputs  = {"tx_axi4s_valid":1,
+                   "tx_axi4s_data":32,
+                   "tx_axi4s_strb":4,
+                   "tx_axi4s_last":1,
+                   "rx_axi4s_tready":1,
+                   "tbi_rx":t_tbi_valid,
+                   "tbi_loopback":1,
+                   "sys_cfg":32,
+                   "sgmii_gasket_control":t_sgmii_gasket_control,
+    }
+    dut_outputs = {"tx_axi4s_tready":1,
+                   "rx_axi4s_valid":1,
+                   "rx_axi4s_data":32,
+                   "rx_axi4s_strb":4,
+                   "rx_axi4s_last":1,
+                   "rx_axi4s_user":32,
+                   "tbi_tx":t_tbi_valid,
+                   "sgmii_txd":4,
+                   "sgmii_gasket_status":t_sgmii_gasket_status,
+    }
+    loggers = {
+        }
+    pass
+
+#a Simulation test classes
+#c Gbe
+class Gbe(TestCase):
+    hw = GbeHw
+    kwargs = {
+     # "verbosity":0,
+        }
+    _tests = {
+        "throughput_0"  : (GbeTest_Throughput_0, 10*1000,  kwargs),
+        "throughput_1"  : (GbeTest_Throughput_1, 40*1000,  kwargs),
+        "latency_0"     : (GbeTest_Latency_0,    30*1000,  kwargs),
+        "pcap_0"        : (GbeTest_Pcap,         20*1000,  kwargs),
+        "soak_0"        : (GbeTest_Soak_0,      150*1000,  kwargs),
+        "soak_1"        : (GbeTest_Soak_1,      150*1000,  kwargs),
+        "smoke"  : (GbeTest_Throughput_0, 10*1000,  kwargs),
+    }
+    pass
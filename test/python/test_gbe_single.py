@@ -0,0 +1,293 @@
+#a Copyright
+#
+#  This file 'test_gbe_single.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Tests of gbe_single, using tb_gbe_single
+
+The testbench has the same AXI4-S and TBI loopback ports as tb_gbe, so
+the frame streaming and checking of the tb_gbe tests is used, but the
+gasket and statistics are reached through the gbe_single APB target.
+
+The statistics test polls the counters with a GbeStatsPoller while
+frames are looped back, checking that snapshots count the frames sent,
+that a snapshot with clear restarts the counters without losing any
+events, and that a snapshot stays frozen while the live counters move.
+
+The packet statistic FIFO test slows the draining of the FIFOs with a
+holdoff in the configuration register, and streams back-to-back minimum
+size frames in to them; the frames must still go at line rate, and every
+packet must be either counted or counted as an overflow. With no holdoff
+the same stream must not overflow.
+"""
+
+#a Imports
+from cdl.sim     import HardwareThDut
+from cdl.sim     import TestCase
+from .structs    import t_tbi_valid, t_apb_request, t_apb_response
+from .gbe_stats  import GbeStatsPoller, statistic_names
+from .gbe_stats  import apb_address_sgmii_status, apb_address_sgmii_control, apb_address_config, apb_address_snapshot_offset
+from .gbe_stats  import apb_address_tx_okay, apb_address_tx_okay_bytes_hi, apb_address_rx_okay_bytes_hi
+from .an_model   import an_fsm_data
+from .test_gbe   import GbeTest_Base, wire_bytes, byte_time_ns
+
+#a Constants
+packet_stat_fifo_depth = 8 # 1<<packet_stat_fifo_log2_depth in gbe_single
+min_frame_data         = 60 # frames are padded to this before the FCS
+
+#a Functions
+#f tx_stat_bytes
+def tx_stat_bytes(size):
+    """
+    Bytes counted in tx okay_bytes for a frame of size bytes - gbe_axi4s32 counts the data and padding, but not the FCS
+    """
+    return max(size, min_frame_data)
+
+#f rx_stat_bytes
+def rx_stat_bytes(size):
+    """
+    Bytes counted in rx okay_bytes for a frame of size bytes - gbe_axi4s32 counts everything after the SFD, including the FCS
+    """
+    return max(size, min_frame_data) + 4
+
+#a Test classes
+#c GbeSingleTest_Base
+class GbeSingleTest_Base(GbeTest_Base):
+    """
+    GbeTest_Base with the gasket control through APB, and a statistics poller
+    """
+    #f run__init - invoked by submodules
+    def run__init(self):
+        self.bfm_wait(10)
+        self.cycle = 0
+        self.rx_frame = bytearray()
+        self.rx_frames = []
+        self.rx_count = 0
+        self.tx_axi4s_valid.drive(0)
+        self.rx_axi4s_tready.drive(1)
+        self.tbi_loopback.drive(1)
+        self.apb_request__psel.drive(0)
+        self.apb_request__penable.drive(0)
+        self.write_sgmii_control(0,7)
+        self.write_sgmii_control(0,3)
+        self.wait_for_link()
+        self.poller = GbeStatsPoller(self.apb_read, self.apb_write, lambda:self.cycle*byte_time_ns*1e-9)
+        pass
+
+    #f wait_for_link
+    def wait_for_link(self):
+        """
+        Poll the gasket status register until the gasket is in data with rx sync
+        """
+        end_cycle = self.cycle + self.sync_timeout
+        while self.cycle<end_cycle:
+            status = self.apb_read(apb_address_sgmii_status)
+            if ((status>>31)&1) and (((status>>16)&7)==an_fsm_data): return
+            pass
+        self.failtest("SGMII gasket did not reach data with rx sync within %d cycles"%self.sync_timeout)
+        pass
+
+    #f apb_wait
+    def apb_wait(self, cycles):
+        """
+        Wait during APB accesses, collecting any received frames
+        """
+        for i in range(cycles):
+            self.bfm_wait(1)
+            self.cycle += 1
+            self.rx_axi4s_cycle()
+            pass
+        pass
+
+    #f apb_access
+    def apb_access(self, address, write, data):
+        self.apb_request__paddr.drive(address)
+        self.apb_request__pwrite.drive(write)
+        self.apb_request__pwdata.drive(data)
+        self.apb_request__psel.drive(1)
+        self.apb_request__penable.drive(0)
+        self.apb_wait(1)
+        self.apb_request__penable.drive(1)
+        self.apb_wait(1)
+        while not self.apb_response__pready.value():
+            self.apb_wait(1)
+            pass
+        prdata = self.apb_response__prdata.value()
+        self.apb_wait(1)
+        self.apb_request__psel.drive(0)
+        self.apb_request__penable.drive(0)
+        return prdata
+
+    #f apb_read
+    def apb_read(self, address):
+        return self.apb_access(address, 0, 0)
+
+    #f apb_write
+    def apb_write(self, address, data):
+        self.apb_access(address, 1, data)
+        pass
+
+    #f write_sgmii_control
+    def write_sgmii_control(self, address, data):
+        self.apb_write(apb_address_sgmii_control, (data<<4) | address)
+        self.apb_wait(10)
+        pass
+
+    #f send_frames
+    def send_frames(self, n, size):
+        """
+        Send n frames of size back-to-back, check them, and return the fraction of line rate achieved
+        """
+        frames = [bytes([(i+j)&0xff for j in range(size)]) for i in range(n)]
+        received = self.stream_frames(frames)
+        self.check_frames(frames, received)
+        return self.line_rate_fraction(received)[0]
+
+    #f compare_stats
+    def compare_stats(self, reason, stats, **kwargs):
+        for (n, v) in kwargs.items():
+            self.compare_expected("%s %s"%(reason, n), v, getattr(stats, n))
+            pass
+        pass
+
+    #f All done
+    pass
+
+#c GbeSingleTest_Statistics
+class GbeSingleTest_Statistics(GbeSingleTest_Base):
+    """
+    Poll the statistics around bursts of frames
+    """
+    frame_size = 60
+    frames     = 16
+    #f run
+    def run(self):
+        n = self.frames
+        self.poller.poll(clear=True) # Clear the counts of sync lost during link up
+
+        self.send_frames(n, self.frame_size)
+        s = self.poller.poll()
+        self.verbose.info("Statistics after %d frames: %s"%(n, str(s)))
+        self.compare_stats("After first burst", s.stats, tx_okay=n, rx_okay=n, tx_errored=0, rx_errored=0, rx_sync_lost=0)
+        tx_frame_bytes = tx_stat_bytes(self.frame_size)
+        rx_frame_bytes = rx_stat_bytes(self.frame_size)
+        self.compare_stats("After first burst", s.stats, tx_okay_bytes=n*tx_frame_bytes, rx_okay_bytes=n*rx_frame_bytes)
+
+        self.send_frames(2*n, self.frame_size)
+        s = self.poller.poll(clear=True)
+        self.verbose.info("Statistics after %d frames: %s"%(2*n, str(s)))
+        self.compare_stats("Second burst totals", s.stats, tx_okay=3*n, rx_okay=3*n, tx_okay_bytes=3*n*tx_frame_bytes)
+        self.compare_stats("Second burst", s.delta, tx_okay=2*n, rx_okay=2*n, tx_okay_bytes=2*n*tx_frame_bytes, rx_okay_bytes=2*n*rx_frame_bytes)
+        self.compare_expected("Snapshot tx_okay_bytes high word", 0, self.apb_read(apb_address_tx_okay_bytes_hi+apb_address_snapshot_offset))
+        self.compare_expected("Snapshot rx_okay_bytes high word", 0, self.apb_read(apb_address_rx_okay_bytes_hi+apb_address_snapshot_offset))
+        max_frame_rate = 1.0e9 / (byte_time_ns * wire_bytes(self.frame_size+4))
+        if s.rates["rx_frames_per_second"]>max_frame_rate:
+            self.failtest("Received frame rate %.0f above line rate %.0f"%(s.rates["rx_frames_per_second"], max_frame_rate))
+            pass
+
+        s = self.poller.poll()
+        self.compare_stats("After clear", s.stats, **{name:0 for name in statistic_names})
+
+        self.send_frames(n, self.frame_size)
+        live = self.poller.read_live()
+        self.compare_stats("Live after clear", live, tx_okay=n, rx_okay=n)
+        self.compare_expected("Snapshot tx_okay while live counters move", 0, self.apb_read(apb_address_tx_okay+apb_address_snapshot_offset))
+        pass
+
+    #f All done
+    pass
+
+#c GbeSingleTest_StatFifo
+class GbeSingleTest_StatFifo(GbeSingleTest_Base):
+    """
+    Saturate the packet statistic FIFOs with back-to-back short frames
+    """
+    frame_size         = 60
+    frames             = 48
+    stat_holdoff       = 255
+    line_rate_required = 0.95
+    #f run
+    def run(self):
+        n = self.frames
+        self.apb_write(apb_address_config, self.stat_holdoff)
+        self.poller.poll(clear=True)
+        fraction = self.send_frames(n, self.frame_size)
+        self.verbose.info("Saturating packet statistic FIFOs: %.3f of line rate"%fraction)
+        if fraction<self.line_rate_required:
+            self.failtest("Frames achieved only %.3f of line rate with the packet statistic FIFOs full"%fraction)
+            pass
+        self.apb_wait((self.stat_holdoff+1)*(packet_stat_fifo_depth+2))
+        s = self.poller.poll()
+        self.verbose.info("Statistics with holdoff %d: %s"%(self.stat_holdoff, str(s)))
+        self.compare_expected("tx packets counted or overflowed", n, s.stats.tx_okay+s.stats.tx_stat_overflow)
+        self.compare_expected("rx packets counted or overflowed", n, s.stats.rx_okay+s.stats.rx_stat_overflow)
+        if s.stats.tx_stat_overflow==0 or s.stats.rx_stat_overflow==0:
+            self.failtest("Packet statistic FIFOs did not overflow (%s)"%str(s.stats))
+            pass
+
+        self.apb_write(apb_address_config, 0)
+        self.poller.poll(clear=True)
+        self.send_frames(n, self.frame_size)
+        s = self.poller.poll()
+        self.compare_stats("No holdoff", s.stats, tx_okay=n, rx_okay=n, tx_stat_overflow=0, rx_stat_overflow=0)
+        pass
+
+    #f All done
+    pass
+
+#a Hardware classes
+#c GbeSingleHw
+class GbeSingleHw(HardwareThDut):
+    clock_desc = [("clk",(0,1,1)),
+    ]
+    reset_desc = {"name":"reset_n", "init_value":0, "wait":5}
+    module_name = "tb_gbe_single"
+    dut_inputs  = {"tx_axi4s_valid":1,
+                   "tx_axi4s_data":32,
+                   "tx_axi4s_strb":4,
+                   "tx_axi4s_last":1,
+                   "rx_axi4s_tready":1,
+                   "tbi_rx":t_tbi_valid,
+                   "tbi_loopback":1,
+                   "apb_request":t_apb_request,
+    }
+    dut_outputs = {"tx_axi4s_tready":1,
+                   "rx_axi4s_valid":1,
+                   "rx_axi4s_data":32,
+                   "rx_axi4s_strb":4,
+                   "rx_axi4s_last":1,
+                   "rx_axi4s_user":32,
+                   "tbi_tx":t_tbi_valid,
+                   "apb_response":t_apb_response,
+    }
+    loggers = {
+        }
+    pass
+
+#a Simulation test classes
+#c GbeSingle
+class GbeSingle(TestCase):
+    hw = GbeSingleHw
+    kwargs = {
+     # "verbosity":0,
+        }
+    _tests = {
+        "stats_0" : (GbeSingleTest_Statistics, 30*1000, kwargs),
+        "stat_fifo_0" : (GbeSingleTest_StatFifo, 30*1000, kwargs),
+        "smoke"   : (GbeSingleTest_Statistics, 30*1000, kwargs),
+    }
+    pass
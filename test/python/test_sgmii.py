@@ -24,9 +24,23 @@ from cdl.sim     import ThExecFile, LogEventParser
 from cdl.sim     import HardwareThDut
 from cdl.sim     import TestCase
 from cdl.utils   import csr
-from .encdec_8b10b import find_encoding, encodings_8b10b
+from .encdec_8b10b import encode_8b10b, decode_8b10b
+from .pcs_model    import TxPcs, RxPcs, gmii_packet
+from .stream_8b10b import check_stream
+from .traffic      import RandomTraffic
+from .scoreboard   import Scoreboard, ArrayScoreboard
+from .log_batch    import drain_log_columns
+from .profiling    import ProfiledExecFile
+from .pcap         import PcapReader, PcapWriter, gmii_frame
+from .             import pcs_model
+from .an_model     import an_fsm_data, an_fsm_restart, an_fsm_names, an_control_enable_interface, an_control_an_disable, an_control_restart_an, an_control_fast_link, predict_data_cycle
 from .structs    import t_tbi_valid, t_gmii_tx, t_gmii_rx, t_sgmii_gasket_control, t_sgmii_gasket_status
 from typing import Optional, List
+import array
+import sys
+
+#a Constants
+sram_message_load_mif = 8 # se_sram message to load a MIF file (at an address) in to the memory
 
 #a Test classes
 #c TxGmiiLogParser - log event parser for tx gmii
@@ -49,17 +63,19 @@ class RxGmiiLogParser(LogEventParser):
 
 #c Tbi expectation classes
 class TbiExp(object):
-    def __init__(self, data, is_symbol=False, optional=False, even=None):
+    def __init__(self, data, is_symbol=False, optional=False, even=None, disparity=None):
         self.data = data
         self.is_symbol = is_symbol
         self.optional = optional
         self.even = even
-        self.encoding_p = find_encoding(encodings_8b10b,{"data":data,"is_control":is_symbol,"disparity_in":0})
-        self.encoding_n = find_encoding(encodings_8b10b,{"data":data,"is_control":is_symbol,"disparity_in":1})
+        self.disparity = disparity
+        self.encoding_p = encode_8b10b(is_symbol, data, 0)
+        self.encoding_n = encode_8b10b(is_symbol, data, 1)
         pass
     def check_with_log(self, l) -> [bool, bool]:
         err=False
         if (self.even is not None) and l.even!=self.even: err=True
+        if (self.disparity is not None) and l.disparity!=self.disparity: err=True
         if self.is_symbol != l.is_control: err=True
         if self.data != l.data: err=True
         return (err, self.optional)
@@ -73,6 +89,9 @@ class TbiExp(object):
         r += ":%d"%(int(self.optional))
         if self.even is not None: r+=":%d"%(int(self.even))
         return r
+    @classmethod
+    def of_code_group(cls, cg):
+        return cls(cg.data, is_symbol=cg.is_control, even=cg.even, disparity=cg.disparity)
     pass
 class TbiCtl(TbiExp):
     def __init__(self, **kwargs):
@@ -93,11 +112,21 @@ class TbiExpPacket(object):
     expected_data : List[TbiExp]
 
 #c SgmiiTest_Base
-class SgmiiTest_Base(ThExecFile):
+class SgmiiTest_Base(ProfiledExecFile, ThExecFile):
     """
+    Tests bring the link up (link_up), set up their models (test_setup),
+    run their body, and check everything was seen (test_finish); a
+    checkpointed test does the link up once and runs the bodies of several
+    tests from it (checkpoint_run)
     """
+    checkpoint_name = "link_up"
+    profile_methods = ["gmii_bfm_wait", "gmii_tx_pkt", "gmii_tx_expect", "gmii_tx_sync_pcs", "tbi_tx_wait", "tbi_tx_check_stream",
+                       "gmii_rx_encoding", "gmii_rx_expect", "gmii_rx_stream", "gmii_rx_idle", "tbi_replay_flush",
+                       "scoreboard_check", "an_partner_cycle", "link_up"]
+    profile_functions = [(pcs_model, "encode_8b10b"), (pcs_model, "decode_8b10b"), (sys.modules[__name__], "encode_8b10b"), (sys.modules[__name__], "check_stream")]
     #f run__init - invoked by submodules
     def run__init(self):
+        self.profile_start()
         self.bfm_wait(10)
         pass
 
@@ -107,6 +136,7 @@ class SgmiiTest_Base(ThExecFile):
 
     #f run__finalize
     def run__finalize(self):
+        self.profile_finish()
         self.passtest("Test completed")
         pass
 
@@ -119,60 +149,26 @@ class SgmiiTest_Base(ThExecFile):
                 pass
             pass
         pass
-    #f gmii_tx_check_expected_data
-    def gmii_tx_check_expected_data(self):
-        while (self.log_data.num_events()!=0) and (self.expected_symbols!=[]):
-            l = self.log_data_parser.parse_log_event(self.log_data.event_pop())
-            if l is None: continue
-            while True:
-                if self.expected_symbols==[]: raise Exception("expected_symbols was empty - can only occur if an optional symbol is at the end of the list, which is a bug")
-                sym = self.expected_symbols.pop(0)
-                (err,opt) = sym.check_with_log(l)
-                if (not err) or (not opt): break
-                pass
-            if err:
-                self.failtest("Symbol mismatch in tx data check (log %s symbol %s)"%(str(l),str(sym)))
-                pass
+    #f scoreboard_check
+    def scoreboard_check(self, stop_when_empty=False):
+        """
+        Check the events logged so far against the scoreboard; this may be done at any point in a test
+        """
+        for m in self.scoreboard.drain(self.log_data, self.log_data_parser, stop_when_empty):
+            self.failtest(m)
             pass
         pass
-    #f gmii_tx_pkt
-    def gmii_tx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
-        self.expected_symbols.append(TbiS())
-        dn = 0
-        for d in data:
-            if dn>0: self.expected_symbols.append(TbiD(d,optional=(dn==1)))
-            dn = dn + 1
-            self.gmii_tx__tx_en.drive(1)
-            self.gmii_tx__tx_er.drive(0)
-            self.gmii_tx__txd.drive(d)
-            self.gmii_tx_enable.wait_for_value(1)
-            self.bfm_wait(1)
-            pass
-        for i in range(error_data):
-            self.gmii_tx__tx_en.drive(1)
-            self.gmii_tx__tx_er.drive(1)
-            self.gmii_tx_enable.wait_for_value(1)
-            self.bfm_wait(1)
-            pass
-        self.expected_symbols.append(TbiT())
-        for i in range(carrier_extend):
-            self.expected_symbols.append(TbiR())
-            self.gmii_tx__tx_en.drive(0)
-            self.gmii_tx__tx_er.drive(1)
-            self.gmii_tx_enable.wait_for_value(1)
-            self.bfm_wait(1)
-            pass
-        self.expected_symbols.append(TbiR(even=True, optional=True))
-        self.expected_symbols.append(TbiR(even=False))
-        # We don't log the I after a packet
-        # self.expected_symbols.append(TbiK(even=True, optional=True))
-        for i in range(ipg):
-            self.gmii_tx__tx_en.drive(0)
-            self.gmii_tx__tx_er.drive(0)
-            self.gmii_tx_enable.wait_for_value(1)
-            self.bfm_wait(1)
+    #f scoreboard_finish
+    def scoreboard_finish(self):
+        self.scoreboard_check()
+        for m in self.scoreboard.finish():
+            self.failtest(m)
             pass
         pass
+    #f gmii_tx_check_expected_data
+    def gmii_tx_check_expected_data(self):
+        self.scoreboard_check(stop_when_empty=True)
+        pass
     #f send_packet
     def send_packet(self, pkt):
         self.gmii_tx__tx_en.drive(1)
@@ -198,6 +194,60 @@ class SgmiiTest_Base(ThExecFile):
         self.sgmii_gasket_control__write_config.drive(0)
         self.bfm_wait(10)
         pass
+    #f wait_for_an_data
+    def wait_for_an_data(self, timeout=1000):
+        """
+        Wait until the autonegotiation FSM is in data (rather than for a fixed time)
+        """
+        for i in range(timeout):
+            if self.sgmii_gasket_status__trace__an_fsm.value()==an_fsm_data: return
+            self.bfm_wait(1)
+            pass
+        self.failtest("Autonegotiation did not reach data within %d cycles"%timeout)
+        pass
+    #f checkpoint_save
+    def checkpoint_save(self):
+        """
+        Checkpoint the simulation as checkpoint_name, if the simulation engine supports it; return True if it does
+        """
+        checkpoint_add = getattr(self, "checkpoint_add", None)
+        if checkpoint_add is None: return False
+        checkpoint_add(self.checkpoint_name)
+        return True
+    #f link_state
+    def link_state(self):
+        """
+        State of the test's models of the link (not the simulation) that a checkpoint must restore
+        """
+        return None
+    #f restore_link_state
+    def restore_link_state(self, state):
+        pass
+    #f checkpoint_run
+    def checkpoint_run(self, tests):
+        """
+        Run the stimulus of each of tests in turn, each starting from the
+        state just after link_up (which must have been done)
+
+        The simulation is checkpointed after link_up and restored before
+        each subsequent test; if the engine cannot checkpoint then the
+        test fails, as the tests would not start from the same state (the
+        tests can each be run on their own instead)
+        """
+        if not self.checkpoint_save():
+            self.failtest("Simulation engine cannot checkpoint - run the tests individually")
+            return
+        link_state = self.link_state()
+        for (i, test) in enumerate(tests):
+            if i>0:
+                self.checkpoint_restore(self.checkpoint_name)
+                self.restore_link_state(link_state)
+                pass
+            self.test_setup()
+            self.test_body(test)
+            self.test_finish()
+            pass
+        pass
     pass
 
 #c SgmiiTest_0
@@ -244,95 +294,143 @@ class SgmiiTest_0(SgmiiTest_Base):
 #c SgmiiTest_GmiiTx_Base
 class SgmiiTest_GmiiTx_Base(SgmiiTest_Base):
     sgmii_module = "dut.sgg"
+    scoreboard_window = 4096
+    #f Stimulus
+    class Pkt(object):
+        """
+        A packet driven with gmii_tx_pkt
+        """
+        def __init__(self, data, **kwargs):
+            self.data = data
+            self.kwargs = kwargs
+            pass
+        def action(self, test):
+            test.gmii_tx_pkt(self.data, **self.kwargs)
+            pass
+        pass
+    stimulus = []
     #f run__init - invoked by submodules
     def run__init(self):
+        self.profile_start()
+        self.link_up()
+        self.test_setup()
+        pass
+
+    #f link_up
+    def link_up(self):
         self.bfm_wait(10)
-        self.expected_symbols = []
         self.log_data         = self.log_recorder(self.sgmii_module)
         self.log_data_parser  = TxGmiiLogParser()
         self.write_sgmii_control(0,7)
         self.write_sgmii_control(0,3)
-        # Wait and clear log queue - as the config/autonegotiation data will be in the log
-        self.bfm_wait(100)
+        self.wait_for_an_data()
         self.gmii_tx_enable.wait_for_value(1)
         self.bfm_wait(1)
+        pass
+
+    #f test_setup
+    def test_setup(self):
+        self.scoreboard       = Scoreboard("gmii_tx", window=self.scoreboard_window)
+        # Clear log queue - as the config/autonegotiation data (or a previous test) will be in the log
         while self.log_data.num_events()!=0:
             self.log_data.event_pop()
             pass
+        self.gmii_tx_sync_pcs()
         pass
 
-    #f gmii_tx_check_expected_data
-    def gmii_tx_check_expected_data(self):
-        while (self.log_data.num_events()!=0) and (self.expected_symbols!=[]):
-            l = self.log_data_parser.parse_log_event(self.log_data.event_pop())
-            if l is None: continue
-            while True:
-                if self.expected_symbols==[]: raise Exception("expected_symbols was empty - can only occur if an optional symbol is at the end of the list, which is a bug")
-                sym = self.expected_symbols.pop(0)
-                (err,opt) = sym.check_with_log(l)
-                if (not err) or (not opt): break
-                pass
-            if err:
-                self.failtest("Symbol mismatch in tx data check (log %s symbol %s)"%(str(l),str(sym)))
-                pass
-            pass
+    #f test_body
+    def test_body(self, test):
+        self.run_stimulus(test.stimulus)
         pass
-    #f gmii_tx_pkt
-    def gmii_tx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
-        self.expected_symbols.append(TbiS())
-        dn = 0
-        for d in data:
-            if dn>0: self.expected_symbols.append(TbiD(d,optional=(dn==1)))
-            dn = dn + 1
-            self.gmii_tx_enable.wait_for_value(1)
-            self.gmii_tx__tx_en.drive(1)
-            self.gmii_tx__tx_er.drive(0)
-            self.gmii_tx__txd.drive(d)
+
+    #f test_finish
+    def test_finish(self):
+        self.tbi_tx_wait(100)
+        self.gmii_tx_check_expected_data()
+        self.scoreboard_finish()
+        self.tbi_tx_check_stream()
+        pass
+
+    #f gmii_tx_sync_pcs
+    def gmii_tx_sync_pcs(self):
+        """
+        Wait for the K28.5 of an idle on tbi_tx, and start the transmit PCS model from there
+
+        The K28.5 was sent for the GMII value captured on the previous
+        cycle; the GMII value captured in the cycle it appears (idle) is
+        sent next, and then the first value driven by the test
+        """
+        while True:
             self.bfm_wait(1)
-            pass
-        for i in range(error_data):
-            self.expected_symbols.append(TbiV())
-            self.gmii_tx_enable.wait_for_value(1)
-            self.gmii_tx__tx_en.drive(1)
-            self.gmii_tx__tx_er.drive(1)
+            if self.tbi_tx__valid.value()==0: continue
+            symbol = self.tbi_tx__data.value()
+            if symbol not in [0x0fa, 0x305]: continue
+            break
+        e = decode_8b10b(symbol, 0)
+        if e is None: e = decode_8b10b(symbol, 1)
+        self.tx_pcs = TxPcs(tx_even=0, disparity=e.disparity_out)
+        self.tbi_tx_capture = array.array("H", [symbol])
+        self.tbi_tx_start_disparity = e.disparity_in
+        self.gmii_tx_expect(0,0,0)
+        pass
+
+    #f tbi_tx_wait
+    def tbi_tx_wait(self, delay):
+        """
+        Wait for delay cycles, capturing the symbols on tbi_tx for check_stream at the end of the test
+        """
+        for i in range(delay):
             self.bfm_wait(1)
+            if self.tbi_tx__valid.value(): self.tbi_tx_capture.append(self.tbi_tx__data.value())
             pass
-        self.expected_symbols.append(TbiT())
-        if carrier_extend==0:
-            self.expected_symbols.append(TbiR(even=True, optional=True))
-            self.expected_symbols.append(TbiR(even=False))
-            pass
-        else:
-            cn = 0
-            for i in range(carrier_extend):
-                # one cycle provides T, one for the R at the end
-                if (cn>=1): self.expected_symbols.append(TbiR())
-                cn = cn + 1
-                self.gmii_tx_enable.wait_for_value(1)
-                self.gmii_tx__txd.drive(0xf)
-                self.gmii_tx__tx_en.drive(0)
-                self.gmii_tx__tx_er.drive(1)
-                self.bfm_wait(1)
-                pass
-            self.expected_symbols.append(TbiR(even=True, optional=True))
-            if ipg>0: # if ipg is 0 then we have added enough cycles; S does not have to be even
-                self.expected_symbols.append(TbiR(even=False))
-                pass
+        pass
+
+    #f tbi_tx_check_stream
+    def tbi_tx_check_stream(self):
+        """
+        Check the whole tbi_tx capture in one go - valid code groups, running disparity, and commas only at even positions
+        """
+        check = check_stream(self.tbi_tx_capture, start_disparity=self.tbi_tx_start_disparity, even_offset=0)
+        if not check.ok():
+            self.failtest("tbi_tx stream check failed: %s"%str(check))
             pass
-        # We don't log the I after a packet
-        # self.expected_symbols.append(TbiK(even=True, optional=True))
-        for i in range(ipg):
+        pass
+
+    #f gmii_tx_expect
+    def gmii_tx_expect(self, tx_en, tx_er, txd):
+        cg = self.tx_pcs.step(tx_en, tx_er, txd)
+        if cg.logged: self.scoreboard.add(TbiExp.of_code_group(cg))
+        pass
+
+    #f gmii_tx_pkt
+    def gmii_tx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
+        """
+        Drive a packet on GMII tx, adding the code groups that the transmit PCS model
+        says will be sent to the expected symbols
+        """
+        for (tx_en, tx_er, txd) in gmii_packet(data, error_data=error_data, carrier_extend=carrier_extend, ipg=ipg):
             self.gmii_tx_enable.wait_for_value(1)
-            self.gmii_tx__tx_en.drive(0)
-            self.gmii_tx__tx_er.drive(0)
-            self.bfm_wait(1)
+            self.gmii_tx__tx_en.drive(tx_en)
+            self.gmii_tx__tx_er.drive(tx_er)
+            self.gmii_tx__txd.drive(txd)
+            self.gmii_tx_expect(tx_en, tx_er, txd)
+            self.tbi_tx_wait(1)
+            pass
+        self.gmii_tx_check_expected_data()
+        pass
+    #f run_stimulus
+    def run_stimulus(self, stimulus):
+        for x in stimulus:
+            x.action(self)
             pass
         pass
+    #f run
+    def run(self):
+        self.run_stimulus(self.stimulus)
+        pass
     #f run__finalize
     def run__finalize(self):
-        self.bfm_wait(100)
-        self.gmii_tx_check_expected_data()
-        self.compare_expected("Expected data is empty",len(self.expected_symbols),0)
+        self.test_finish()
         super(SgmiiTest_GmiiTx_Base,self).run__finalize()
         pass
         
@@ -340,68 +438,84 @@ class SgmiiTest_GmiiTx_Base(SgmiiTest_Base):
     pass
 #c SgmiiTest_GmiiTx_0
 class SgmiiTest_GmiiTx_0(SgmiiTest_GmiiTx_Base):
-    #f run
-    def run(self):
-        self.gmii_tx_pkt([1,2,3,4,5,6])
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5])
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5])
-        self.gmii_tx_pkt([1,2,3,4,5])
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5])
-        self.gmii_tx_pkt([1,2,3,4,5])
-        pass
+    Pkt = SgmiiTest_GmiiTx_Base.Pkt
+    stimulus = [ Pkt([1,2,3,4,5,6]),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5]),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5]),
+                 Pkt([1,2,3,4,5]),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5]),
+                 Pkt([1,2,3,4,5]) ]
 
 #c SgmiiTest_GmiiTx_1
 class SgmiiTest_GmiiTx_1(SgmiiTest_GmiiTx_Base):
-    #f run
-    def run(self):
-        # def gmii_tx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
-        self.gmii_tx_pkt([1,2,3,4,5,6], error_data=5)
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5], error_data=5)
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5], error_data=2)
-        self.gmii_tx_pkt([1,2,3,4,6], error_data=2)
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5], error_data=5)
-        pass
+    Pkt = SgmiiTest_GmiiTx_Base.Pkt
+    stimulus = [ Pkt([1,2,3,4,5,6], error_data=5),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5], error_data=5),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5], error_data=2),
+                 Pkt([1,2,3,4,6], error_data=2),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5], error_data=5) ]
 
 #c SgmiiTest_GmiiTx_2
 class SgmiiTest_GmiiTx_2(SgmiiTest_GmiiTx_Base):
-    #f run
-    def run(self):
-        # def gmii_tx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=4)
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,6], error_data=2)
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5], error_data=5)
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=3)
-        self.gmii_tx_pkt([1,2,3,4])
-        pass
+    Pkt = SgmiiTest_GmiiTx_Base.Pkt
+    stimulus = [ Pkt([1,2,3,4,5,6], carrier_extend=4),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,6], error_data=2),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5], error_data=5),
+                 Pkt([1,2,3,4,5,6], carrier_extend=3),
+                 Pkt([1,2,3,4]) ]
 
 #c SgmiiTest_GmiiTx_3
 class SgmiiTest_GmiiTx_3(SgmiiTest_GmiiTx_Base):
+    Pkt = SgmiiTest_GmiiTx_Base.Pkt
+    stimulus = [ Pkt([1,2,3,4,5,6], carrier_extend=4),
+                 Pkt([1,2,3,4]),
+                 Pkt([1,2,3,4,5,6], carrier_extend=4),
+                 Pkt([1,2,3,4,5,6], carrier_extend=4,ipg=0),
+                 Pkt([1,2,3,4,5],   carrier_extend=4,ipg=0),
+                 Pkt([1,2,3,4,5,6], carrier_extend=4,ipg=2),
+                 Pkt([1,2,3,4,5,6], carrier_extend=3),
+                 Pkt([1,2,3,4]) ]
+
+#c SgmiiTest_GmiiTx_Pcap
+class SgmiiTest_GmiiTx_Pcap(SgmiiTest_GmiiTx_Base):
+    """
+    Replay the frames of a capture on GMII tx (with preamble and FCS), a packet at a time
+
+    If pcap_in is None then a capture of pcap_frames seeded random frames is written first and replayed
+    """
+    pcap_in     = None
+    pcap_frames = 8
+    pcap_generated = "gmii_tx_pcap_in.pcap"
     #f run
     def run(self):
-        # def gmii_tx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=4)
-        self.gmii_tx_pkt([1,2,3,4])
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=4)
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=4,ipg=0)
-        self.gmii_tx_pkt([1,2,3,4,5],   carrier_extend=4,ipg=0)
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=4,ipg=2)
-        self.gmii_tx_pkt([1,2,3,4,5,6], carrier_extend=3)
-        self.gmii_tx_pkt([1,2,3,4])
+        filename = self.pcap_in
+        if filename is None:
+            filename = self.pcap_generated
+            with PcapWriter(filename) as w:
+                for f in RandomTraffic(seed=2, min_length=60, max_length=200).frames(self.pcap_frames):
+                    w.write(f.data)
+                    pass
+                pass
+            pass
+        with PcapReader(filename) as r:
+            for p in r:
+                self.gmii_tx_pkt(gmii_frame(p.data), ipg=12)
+                pass
+            pass
         pass
 
 #c SgmiiTest_GmiiRx_Base
 class SgmiiTest_GmiiRx_Base(SgmiiTest_Base):
     sgmii_module = "dut.sgg"
-    pkt_sop     = (1,0,0x55)
-    pkt_carrier = (0,1,0x0f)
+    scoreboard_window = 65536
     #f Stimulus
     class Stimulus(object):
         pass
@@ -411,74 +525,147 @@ class SgmiiTest_GmiiRx_Base(SgmiiTest_Base):
             pass
         def action(self, test):
             test.gmii_rx_idle(self.size)
-            test.is_idle = True
             pass
         pass
     class Pkt(Stimulus):
-        def __init__(self, size, errors=0, error_insert_at=None):
+        def __init__(self, size, errors=0, error_insert_at=None, data=None):
             self.data = range(size)
+            if data is not None: self.data = data
             self.errors = errors
             self.error_insert_at = error_insert_at
             pass
         def action(self, test):
-            if test.is_idle:
-                test.gmii_rx_expected.append(test.pkt_sop)
-                pass
-            else:
-                test.gmii_rx_expected.append(test.pkt_carrier)
-                pass
             if self.error_insert_at is None:
-                for d in self.data:
-                    test.gmii_rx_expected.append((1,0,(d&0xff)))
-                    pass
                 test.gmii_rx_stream([TbiS] + list(self.data) + [TbiV]*self.errors + [TbiT,TbiR], opt_r=True)
-                for i in range(self.errors):
-                    test.gmii_rx_expected.append((1,1,None))
-                    pass
                 pass
             else:
                 data = list(self.data)
-                for d in data[0:self.error_insert_at]:
-                    test.gmii_rx_expected.append((1,0,(d&0xff)))
-                    pass
-                for i in range(self.errors):
-                    test.gmii_rx_expected.append((1,1,None))
-                    pass
-                for d in data[self.error_insert_at:]:
-                    test.gmii_rx_expected.append((1,0,(d&0xff)))
-                    pass
                 test.gmii_rx_stream([TbiS] + data[0:self.error_insert_at])
                 test.gmii_rx_stream([TbiV]*self.errors)
-                print(data[self.error_insert_at:] + [TbiT,TbiR])
                 test.gmii_rx_stream(data[self.error_insert_at:] + [TbiT,TbiR], opt_r=True)
                 pass
-            test.is_idle = False
             pass
         pass
+    class Random(Stimulus):
+        """
+        count seeded random frames, each followed by idles for its inter-packet gap; kwargs are passed to RandomTraffic
+        """
+        def __init__(self, count, seed=0, **kwargs):
+            self.count = count
+            self.seed = seed
+            self.kwargs = kwargs
+            pass
+        def action(self, test):
+            for f in RandomTraffic(seed=self.seed, **self.kwargs).frames(self.count):
+                SgmiiTest_GmiiRx_Base.Pkt(len(f), errors=f.errors, error_insert_at=f.error_insert_at, data=f.data).action(test)
+                test.gmii_rx_idle(max(1, f.ipg//2))
+                if test.tbi_replay: test.tbi_replay_flush()
+                test.scoreboard_check()
+                pass
+            pass
+        pass
+    tbi_replay      = False
+    tbi_replay_mem  = "dut.tbi_replay_mem"
+    tbi_replay_size = 16384
+    tbi_replay_mif  = "tbi_replay_%s.mif" # of the test class name, so concurrent tests do not share it
     #f run__init - invoked by submodules
     def run__init(self):
+        self.profile_start()
+        self.link_up()
+        self.test_setup()
+        pass
+    #f link_up
+    def link_up(self):
         self.bfm_wait(10)
-        self.expected_symbols = []
-        self.even = True
-        self.disparity = 1
-        self.gmii_symbols = {}
-        self.gmii_datas = {}
         self.log_data         = self.log_recorder(self.sgmii_module)
         self.log_data_parser  = RxGmiiLogParser()
+        self.even = True
+        self.disparity = 1
         self.write_sgmii_control(0,7)
         self.write_sgmii_control(0,3)
         pass
+    #f link_state
+    def link_state(self):
+        return (self.even, self.disparity)
+    #f restore_link_state
+    def restore_link_state(self, state):
+        (self.even, self.disparity) = state
+        pass
+    #f test_setup
+    def test_setup(self):
+        if self.tbi_replay:
+            self.sim_msg = self.sim_message()
+            self.tbi_replay_symbols = array.array("H")
+            self.tbi_replay_filename = self.tbi_replay_mif%self.__class__.__name__
+            pass
+        self.scoreboard = ArrayScoreboard("gmii_rx", ["dv", "er", "data"], window=self.scoreboard_window)
+        self.gmii_symbols = {}
+        self.gmii_datas = {}
+        self.rx_pcs = RxPcs()
+        pass
+    #f test_body
+    def test_body(self, test):
+        self.run_stimulus(test.stimulus)
+        pass
+    #f test_finish
+    def test_finish(self):
+        self.bfm_wait(100)
+        self.scoreboard_finish()
+        pass
     #f gmii_rx_encoding
     def gmii_rx_encoding(self, ei):
         e = ei.encoding_p
         if self.disparity!=0: e = ei.encoding_n
         self.disparity = e.disparity_out
         self.even = not self.even
+        if self.tbi_replay:
+            self.tbi_replay_symbols.append(e.encoding)
+            if len(self.tbi_replay_symbols)==self.tbi_replay_size: self.tbi_replay_flush()
+            return
         self.tbi_rx__valid.drive(1)
         self.tbi_rx__data.drive(e.encoding)
+        self.gmii_rx_expect([e.encoding])
         self.bfm_wait(1)
         self.tbi_rx__valid.drive(0)
         pass
+    #f gmii_rx_expect
+    def gmii_rx_expect(self, symbols):
+        """
+        Add the GMII rx events the receive PCS model produces for symbols to the scoreboard
+        """
+        self.scoreboard.extend(self.rx_pcs.process(symbols))
+        pass
+    #f scoreboard_check
+    def scoreboard_check(self, stop_when_empty=False):
+        """
+        Check all the GMII rx events logged so far in one batch
+        """
+        for m in self.scoreboard.check_columns(drain_log_columns(self.log_data, self.log_data_parser)):
+            self.failtest(m)
+            pass
+        pass
+    #f tbi_replay_flush
+    def tbi_replay_flush(self):
+        """
+        Load the pending symbols in to the testbench replay memory, and wait for them to be replayed
+
+        The symbols are written to a MIF file which the memory loads in
+        one message, taking no simulation time; the testbench then
+        presents one symbol per clock to the gasket on its own.
+        """
+        if len(self.tbi_replay_symbols)==0: return
+        with open(self.tbi_replay_filename, "w") as f:
+            f.write("".join(["%03x\n"%(symbol | 0x400) for symbol in self.tbi_replay_symbols]))
+            pass
+        self.sim_msg.send_value(self.tbi_replay_mem, sram_message_load_mif, 0, 0, self.tbi_replay_filename)
+        self.gmii_rx_expect(self.tbi_replay_symbols)
+        self.tbi_replay_length.drive(len(self.tbi_replay_symbols))
+        self.tbi_replay_start.drive(1)
+        self.bfm_wait(1)
+        self.tbi_replay_start.drive(0)
+        self.tbi_replay_busy.wait_for_value(0)
+        self.tbi_replay_symbols = array.array("H")
+        pass
     #f gmii_rx_symbol
     def gmii_rx_symbol(self, s):
         if s not in self.gmii_symbols:
@@ -527,107 +714,23 @@ class SgmiiTest_GmiiRx_Base(SgmiiTest_Base):
             self.gmii_rx_symbol(TbiR)
             pass
         pass
-    #f gmii_rx_check_expected_data
-    def gmii_rx_check_expected_data(self):
-        while (self.log_data.num_events()!=0) and (self.expected_symbols!=[]):
-            l = self.log_data_parser.parse_log_event(self.log_data.event_pop())
-            if l is None: continue
-            while True:
-                if self.expected_symbols==[]: raise Exception("expected_symbols was empty - can only occur if an optional symbol is at the end of the list, which is a bug")
-                sym = self.expected_symbols.pop(0)
-                (err,opt) = sym.check_with_log(l)
-                if (not err) or (not opt): break
-                pass
-            if err:
-                self.failtest("Symbol mismatch in rx data check (log %s symbol %s)"%(str(l),str(sym)))
-                pass
-            pass
-        pass
-    #f gmii_rx_pkt
-    def gmii_rx_pkt(self, data, error_data=0, carrier_extend=0, ipg=8):
-        """
-        Assumes that any idle is properly complete
-        """
-        self.gmii_rx_symbol(RxS)
-        self.expected_symbols.append(TbiS())
-        dn = 0
-        for d in data:
-            if dn>0: self.expected_symbols.append(TbiD(d,optional=(dn==1)))
-            dn = dn + 1
-            self.gmii_rx_enable.wait_for_value(1)
-            self.gmii_rx__rx_en.drive(1)
-            self.gmii_rx__rx_er.drive(0)
-            self.gmii_rx__rxd.drive(d)
-            self.bfm_wait(1)
-            pass
-        for i in range(error_data):
-            self.expected_symbols.append(TbiV())
-            self.gmii_rx_enable.wait_for_value(1)
-            self.gmii_rx__rx_en.drive(1)
-            self.gmii_tx__tx_er.drive(1)
-            self.bfm_wait(1)
-            pass
-        self.expected_symbols.append(TbiT())
-        if carrier_extend==0:
-            self.expected_symbols.append(TbiR(even=True, optional=True))
-            self.expected_symbols.append(TbiR(even=False))
-            pass
-        else:
-            cn = 0
-            for i in range(carrier_extend):
-                # one cycle provides T, one for the R at the end
-                if (cn>=1): self.expected_symbols.append(TbiR())
-                cn = cn + 1
-                self.gmii_tx_enable.wait_for_value(1)
-                self.gmii_tx__txd.drive(0xf)
-                self.gmii_tx__tx_en.drive(0)
-                self.gmii_tx__tx_er.drive(1)
-                self.bfm_wait(1)
-                pass
-            self.expected_symbols.append(TbiR(even=True, optional=True))
-            if ipg>0: # if ipg is 0 then we have added enough cycles; S does not have to be even
-                self.expected_symbols.append(TbiR(even=False))
-                pass
-            pass
-        # We don't log the I after a packet
-        # self.expected_symbols.append(TbiK(even=True, optional=True))
-        for i in range(ipg):
-            self.gmii_tx_enable.wait_for_value(1)
-            self.gmii_tx__tx_en.drive(0)
-            self.gmii_tx__tx_er.drive(0)
-            self.bfm_wait(1)
+    #f run_stimulus
+    def run_stimulus(self, stimulus):
+        for x in stimulus:
+            x.action(self)
+            if self.tbi_replay: self.tbi_replay_flush()
+            self.scoreboard_check()
             pass
+        self.bfm_wait(1)
+        self.scoreboard_check()
         pass
     #f run
     def run(self):
-        self.gmii_rx_expected = []
-        is_idle = False
-        # Wait and clear log queue - as the config/autonegotiation data will be in the log
-        for x in self.stimulus:
-            x.action(self)
-            pass
-        self.bfm_wait(1)
-        while self.log_data.num_events()!=0:
-            l = self.log_data_parser.parse_log_event(self.log_data.event_pop())
-            if l is None: continue
-            if self.gmii_rx_expected==[]:
-                self.failtest("Extra GMII received when none expected %s"%(str(l)))
-                pass
-            else:
-                (dv, er, d) = self.gmii_rx_expected.pop(0)
-                self.compare_expected("dv in gmii rx data (log %s)"%(str(l)), dv, l.dv)
-                self.compare_expected("er in gmii rx data (log %s)"%(str(l)), er, l.er)
-                if d is not None:
-                    self.compare_expected("data in gmii rx data (log %s)"%(str(l)), d, l.data)
-                    pass
-                pass
-            pass
+        self.run_stimulus(self.stimulus)
         pass
     #f run__finalize
     def run__finalize(self):
-        self.bfm_wait(100)
-        self.gmii_rx_check_expected_data()
-        self.compare_expected("Expected data is empty",len(self.expected_symbols),0)
+        self.test_finish()
         super(SgmiiTest_GmiiRx_Base,self).run__finalize()
         pass
         
@@ -657,6 +760,135 @@ class SgmiiTest_GmiiRx_3(SgmiiTest_GmiiRx_Base):
     Pkt = SgmiiTest_GmiiRx_Base.Pkt
     stimulus = [ Idle(32), Pkt(8, errors=1, error_insert_at=3), Idle(32) ]
 
+#c SgmiiTest_GmiiTx_Checkpoint
+class SgmiiTest_GmiiTx_Checkpoint(SgmiiTest_GmiiTx_Base):
+    """
+    Run the GMII tx tests in one simulation, each from a checkpoint after link up
+    """
+    checkpoint_tests = [SgmiiTest_GmiiTx_0, SgmiiTest_GmiiTx_1, SgmiiTest_GmiiTx_2, SgmiiTest_GmiiTx_3]
+    #f run__init
+    def run__init(self):
+        self.profile_start()
+        self.link_up()
+        pass
+    #f run
+    def run(self):
+        self.checkpoint_run(self.checkpoint_tests)
+        pass
+    #f run__finalize
+    def run__finalize(self):
+        SgmiiTest_Base.run__finalize(self)
+        pass
+    pass
+
+#c SgmiiTest_GmiiRx_Checkpoint
+class SgmiiTest_GmiiRx_Checkpoint(SgmiiTest_GmiiRx_Base):
+    """
+    Run the GMII rx tests in one simulation, each from a checkpoint after link up
+    """
+    checkpoint_tests = [SgmiiTest_GmiiRx_0, SgmiiTest_GmiiRx_1, SgmiiTest_GmiiRx_2, SgmiiTest_GmiiRx_3]
+    #f run__init
+    def run__init(self):
+        self.profile_start()
+        self.link_up()
+        pass
+    #f run
+    def run(self):
+        self.checkpoint_run(self.checkpoint_tests)
+        pass
+    #f run__finalize
+    def run__finalize(self):
+        SgmiiTest_Base.run__finalize(self)
+        pass
+    pass
+
+#c SgmiiTest_An_Base
+class SgmiiTest_An_Base(SgmiiTest_Base):
+    """
+    Autonegotiation with a link partner that sends a steady acknowledged config word
+
+    The gasket is put in data mode (autonegotiation disabled), then
+    autonegotiation is restarted; the cycle at which the status trace shows
+    the restart is recorded, and the AN model predicts the exact cycle at
+    which the gasket then reaches data, which is checked for.
+    """
+    counter_10ms = 200
+    fast_link    = False
+    partner_config = 0x4020 # ack and full duplex
+    #f run__init - invoked by submodules
+    def run__init(self):
+        self.profile_start()
+        self.bfm_wait(10)
+        self.cycle = 0
+        self.partner = TxPcs(fsm_state="cfg", an_mode="config", an_data=self.partner_config)
+        self.write_sgmii_control(2,self.counter_10ms)
+        self.write_sgmii_control(1,0x20)
+        self.write_sgmii_control(0,an_control_enable_interface | an_control_an_disable)
+        pass
+    #f an_partner_cycle
+    def an_partner_cycle(self):
+        """
+        Drive the next partner code group for one cycle, and return the AN state from the status trace
+        """
+        cg = self.partner.step(0,0,0)
+        self.tbi_rx__valid.drive(1)
+        self.tbi_rx__data.drive(cg.symbol)
+        self.bfm_wait(1)
+        self.cycle += 1
+        return self.sgmii_gasket_status__trace__an_fsm.value()
+    #f run
+    def run(self):
+        for i in range(64):
+            self.an_partner_cycle()
+            pass
+        control = an_control_enable_interface | an_control_restart_an
+        if self.fast_link: control |= an_control_fast_link
+        self.sgmii_gasket_control__write_config.drive(1)
+        self.sgmii_gasket_control__write_address.drive(0)
+        self.sgmii_gasket_control__write_data.drive(control)
+        self.an_partner_cycle()
+        self.sgmii_gasket_control__write_config.drive(0)
+        restart_cycle = None
+        for i in range(32):
+            if self.an_partner_cycle()==an_fsm_restart:
+                restart_cycle = self.cycle
+                break
+            pass
+        if restart_cycle is None:
+            self.failtest("Autonegotiation did not restart")
+            return
+        data_cycle = predict_data_cycle(restart_cycle, self.counter_10ms, self.fast_link)
+        an_fsm = an_fsm_restart
+        while self.cycle<data_cycle-1:
+            an_fsm = self.an_partner_cycle()
+            pass
+        self.compare_expected("AN state one cycle before predicted data", an_fsm!=an_fsm_data, True)
+        an_fsm = self.an_partner_cycle()
+        self.compare_expected("AN state at predicted data cycle %d"%data_cycle, an_fsm_names[an_fsm], "data")
+        pass
+    #f All done
+    pass
+
+#c SgmiiTest_An_0
+class SgmiiTest_An_0(SgmiiTest_An_Base):
+    counter_10ms = 200
+    fast_link    = False
+
+#c SgmiiTest_An_1
+class SgmiiTest_An_1(SgmiiTest_An_Base):
+    counter_10ms = 0x10000
+    fast_link    = True
+
+#c SgmiiTest_GmiiRx_4
+class SgmiiTest_GmiiRx_4(SgmiiTest_GmiiRx_Base):
+    Idle = SgmiiTest_GmiiRx_Base.Idle
+    Random = SgmiiTest_GmiiRx_Base.Random
+    stimulus = [ Idle(32), Random(8, seed=1, lengths="imix", min_ipg=2, max_ipg=24, error_rate=0.25, max_errors=3), Idle(32) ]
+
+#c SgmiiTest_GmiiRx_Replay_0
+class SgmiiTest_GmiiRx_Replay_0(SgmiiTest_GmiiRx_4):
+    tbi_replay = True
+
 #a Hardware classes
 #c SgmiiHw
 class SgmiiHw(HardwareThDut):
@@ -667,6 +899,8 @@ class SgmiiHw(HardwareThDut):
     dut_inputs  = {"gmii_tx":t_gmii_tx,
                    "sgmii_rxd":4,
                    "tbi_rx" :t_tbi_valid,
+                   "tbi_replay_start":1,
+                   "tbi_replay_length":15,
                    "sgmii_gasket_control":t_sgmii_gasket_control,
     }
     dut_outputs = {"gmii_tx_enable":1,
@@ -674,6 +908,7 @@ class SgmiiHw(HardwareThDut):
                    "tbi_tx":t_tbi_valid,
                    "gmii_rx":t_gmii_rx,
                    "gmii_rx_enable":1,
+                   "tbi_replay_busy":1,
                    "sgmii_gasket_status":t_sgmii_gasket_status,
     }
     loggers = {
@@ -693,10 +928,17 @@ class Sgmii(TestCase):
         "gmii_tx_1"  : (SgmiiTest_GmiiTx_1, 8*1000,  kwargs),
         "gmii_tx_2"  : (SgmiiTest_GmiiTx_2, 8*1000,  kwargs),
         "gmii_tx_3"  : (SgmiiTest_GmiiTx_3, 8*1000,  kwargs),
+        "gmii_tx_pcap"  : (SgmiiTest_GmiiTx_Pcap, 10*1000,  kwargs),
         "gmii_rx_0"  : (SgmiiTest_GmiiRx_0, 8*1000,  kwargs),
         "gmii_rx_1"  : (SgmiiTest_GmiiRx_1, 8*1000,  kwargs),
         "gmii_rx_2"  : (SgmiiTest_GmiiRx_2, 8*1000,  kwargs),
         "gmii_rx_3"  : (SgmiiTest_GmiiRx_3, 8*1000,  kwargs),
+        "gmii_rx_4"  : (SgmiiTest_GmiiRx_4, 20*1000,  kwargs),
+        "gmii_rx_replay_0"  : (SgmiiTest_GmiiRx_Replay_0, 20*1000,  kwargs),
+        "gmii_tx_checkpoint"  : (SgmiiTest_GmiiTx_Checkpoint, 32*1000,  kwargs),
+        "gmii_rx_checkpoint"  : (SgmiiTest_GmiiRx_Checkpoint, 32*1000,  kwargs),
+        "an_0"  : (SgmiiTest_An_0, 8*1000,  kwargs),
+        "an_1"  : (SgmiiTest_An_1, 8*1000,  kwargs),
         "smoke"  : (SgmiiTest_GmiiRx_2, 8*1000,  kwargs),
     }
     pass
@@ -0,0 +1,96 @@
+#a Copyright
+#
+#  This file 'test_trace_decode.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Unit tests of trace_decode, which need no simulation
+
+Captured words are worked out by hand from the bundle() of each
+analyzer mux mode in gbe_single (and from t_sgmii_gasket_trace packed
+first field most significant), and each decoded field is checked against
+a hand-written value; the run statistics of a capture decoded a chunk at
+a time, with a run that crosses chunks, are checked against runs counted
+by hand.
+
+Run from the test directory with: python3 -m unittest python.test_trace_decode
+"""
+
+#a Imports
+import io
+import struct
+import unittest
+from .trace_decode import gasket_trace_layout, analyzer_layouts, decode_chunks, RunStats
+
+#a Test vectors
+#v trace_vectors - captured words worked out by hand from the bundle() in gbe_single (or t_sgmii_gasket_trace), and their fields
+trace_vectors = [
+    (0, 0x05530d5b, {"gmii_tx__txd":0x55, "gmii_tx__tx_er":0, "gmii_tx__tx_en":1, "gmii_tx_enable":1,
+                     "gmii_rx__rxd":0xd5, "gmii_rx__rx_crs":1, "gmii_rx__rx_er":0, "gmii_rx__rx_dv":1, "gmii_rx_enable":1}),
+    (1, 0xa533bc07, {"debug_count":0xa5, "rx_config_data_match":3, "an_fsm":1, "valid":1, "symbol_data":0xbc,
+                     "seeking_comma":0, "symbol_is_R":0, "symbol_is_T":0, "symbol_is_V":0, "symbol_is_S":0,
+                     "symbol_is_K":1, "symbol_is_control":1, "symbol_valid":1}),
+    (1, 0x01f44ac0, {"debug_count":0x01, "rx_config_data_match":0xf, "an_fsm":2, "valid":0, "symbol_data":0x4a,
+                     "seeking_comma":1, "symbol_is_R":1, "symbol_is_T":0, "symbol_is_V":0, "symbol_is_S":0,
+                     "symbol_is_K":0, "symbol_is_control":0, "symbol_valid":0}),
+    (2, 0x1232aa53, {"rx_symbols_since_sync":0x123, "comma_found":0x2aa, "rx_fsm":5, "rx_sync_toggle":1, "rx_sync":1}),
+    (3, 0xabcdef11, {"sgmii_txd":0xabcdef1, "sgmii_txd_valid":1}),
+    (4, 0x00000070, {"sgmii_rxd":0x7, "sgmii_rxd_valid":0}),
+    ("gasket", 0x135402f92f0bc, {"valid":1, "an_fsm":1, "rx_config_data_match":0x2a, "debug_count":0x80, "comma_found":0x17c, "rx_fsm":9,
+                                 "seeking_comma":0, "rx_sync":1, "symbol_valid":1, "symbol_is_control":1, "symbol_is_K":1,
+                                 "symbol_is_S":0, "symbol_is_V":0, "symbol_is_T":0, "symbol_is_R":0, "symbol_data":0xbc}),
+    ("gasket", 0x04180c021014a, {"valid":0, "an_fsm":2, "rx_config_data_match":0x03, "debug_count":0x01, "comma_found":0x201, "rx_fsm":0,
+                                 "seeking_comma":1, "rx_sync":0, "symbol_valid":0, "symbol_is_control":0, "symbol_is_K":0,
+                                 "symbol_is_S":0, "symbol_is_V":0, "symbol_is_T":0, "symbol_is_R":1, "symbol_data":0x4a}),
+]
+
+#a Test classes
+#c TraceDecodeTest
+class TraceDecodeTest(unittest.TestCase):
+    #f test_layout_fields
+    def test_layout_fields(self):
+        for (mode, word, fields) in trace_vectors:
+            layout = gasket_trace_layout if mode=="gasket" else analyzer_layouts[mode]
+            self.assertEqual(sorted(fields.keys()), sorted(layout.fields), "Fields of %s layout"%str(mode))
+            pass
+        pass
+    #f test_decode
+    def test_decode(self):
+        for (mode, word, fields) in trace_vectors:
+            layout = gasket_trace_layout if mode=="gasket" else analyzer_layouts[mode]
+            decoded = layout.decode([word])
+            for (f, v) in fields.items():
+                self.assertEqual(v, int(decoded[f][0]), "%s layout word %x field %s"%(str(mode), word, f))
+                pass
+            pass
+        pass
+    #f test_chunked_runs
+    def test_chunked_runs(self):
+        # seeking_comma is bit 7 of a mode 1 word: runs of 2, 4 (over the second and third chunks) and 1
+        seeking = [0x80, 0x80, 0, 0x80, 0x80, 0x80, 0x80, 0, 0, 0x80]
+        capture = io.BytesIO(struct.pack("<%dI"%len(seeking), *seeking))
+        s = RunStats()
+        for c in decode_chunks(capture, analyzer_layouts[1], ["seeking_comma"], chunk_words=3):
+            s.add(c["seeking_comma"]!=0)
+            pass
+        self.assertEqual((s.samples, s.total, s.runs, s.longest), (10, 7, 3, 4))
+        pass
+    pass
+
+#a Toplevel
+if __name__ == '__main__':
+    unittest.main()
+    pass
@@ -0,0 +1,307 @@
+#a Copyright
+#
+#  This file 'trace_decode.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Columnar decoding of gasket trace and analyzer captures
+
+A TraceLayout describes how fields are packed in to a captured word,
+most significant first as in a CDL bundle(); the shift and mask of each
+field are computed once, and decode turns a NumPy array of captured
+words in to a TraceColumns with one array per field (of the smallest
+unsigned type that holds it), a shift and a mask per field over the
+whole capture.
+
+TraceLayout.from_struct builds the layout of a whole structure from
+its structs.py definition (such as t_sgmii_gasket_trace, with the first
+field most significant, nested fields named with '__'); analyzer_layouts
+gives the layouts of the gbe_single analyzer trace for each mux_control
+setting, with the field widths taken from structs.py.
+
+Captures larger than memory are decoded a chunk at a time with
+decode_chunks, from a file (or binary file object) of little-endian
+words. RunStats accumulates the number of samples, the number of runs,
+and the longest run for which a condition holds across chunks (a run
+that spans chunks is counted once), so a question such as how long the
+gasket spent seeking a comma is a few array operations per chunk:
+
+  s = RunStats()
+  for c in decode_chunks("capture.bin", analyzer_layouts[1]):
+      s.add(c["seeking_comma"]!=0)
+      pass
+
+Running this module (from the test directory, with 'python3 -m
+python.trace_decode') reports the decode and run-length rate.
+"""
+
+#a Imports
+import time
+import numpy as np
+from .structs import t_sgmii_gasket_trace, t_gmii_tx, t_gmii_rx
+
+#a Functions
+#f struct_fields
+def struct_fields(struct_desc, prefix=""):
+    """
+    Flatten a structs.py structure to a list of (name, width), first field first
+    """
+    fields = []
+    for (name, width) in struct_desc.items():
+        if isinstance(width, dict):
+            fields += struct_fields(width, prefix+name+"__")
+            pass
+        else:
+            fields.append((prefix+name, width))
+            pass
+        pass
+    return fields
+
+#f unsigned_dtype
+def unsigned_dtype(width):
+    for (w, dtype) in [(8, np.uint8), (16, np.uint16), (32, np.uint32), (64, np.uint64)]:
+        if width<=w: return dtype
+        pass
+    raise Exception("Field of width %d too wide to decode"%width)
+
+#a Classes
+#c TraceColumns
+class TraceColumns(object):
+    """
+    Decoded trace - columns[field] is an array per field, all the same length
+    """
+    #f __init__
+    def __init__(self, fields, columns):
+        self.fields  = fields
+        self.columns = columns
+        pass
+    #f __len__
+    def __len__(self):
+        if len(self.fields)==0: return 0
+        return len(self.columns[self.fields[0]])
+    #f __getitem__
+    def __getitem__(self, field):
+        return self.columns[field]
+    #f row_str
+    def row_str(self, i):
+        return " ".join(["%s:%d"%(f,self.columns[f][i]) for f in self.fields])
+    pass
+
+#c TraceLayout
+class TraceLayout(object):
+    """
+    Layout of fields in a captured word, from a list of (name, width), most significant first
+
+    A name of None is padding; it is not decoded
+    """
+    #f __init__
+    def __init__(self, fields):
+        self.width  = sum([w for (n,w) in fields])
+        self.dtype  = unsigned_dtype(self.width)
+        self.fields = []
+        self.shifts = {}
+        self.masks  = {}
+        self.dtypes = {}
+        shift = self.width
+        for (name, width) in fields:
+            shift -= width
+            if name is None: continue
+            self.fields.append(name)
+            self.shifts[name] = self.dtype(shift)
+            self.masks[name]  = self.dtype((1<<width)-1)
+            self.dtypes[name] = unsigned_dtype(width)
+            pass
+        pass
+    #f from_struct
+    @classmethod
+    def from_struct(cls, struct_desc):
+        """
+        Layout of a structure packed with its first field most significant
+
+        This is the order of a bundle() of the fields as listed, not
+        necessarily the order in which CDL packs the structure itself (which
+        has not been checked against a simulation); a capture must be
+        packed this way (as gbe_single packs its analyzer trace, field by
+        field) for the layout to apply
+        """
+        return cls(struct_fields(struct_desc))
+    #f decode
+    def decode(self, words, fields=None):
+        """
+        Decode an array of captured words in to a TraceColumns (of just fields, if given)
+        """
+        words = np.asarray(words).astype(self.dtype, copy=False)
+        if fields is None: fields = self.fields
+        columns = {}
+        for f in fields:
+            columns[f] = ((words >> self.shifts[f]) & self.masks[f]).astype(self.dtypes[f])
+            pass
+        return TraceColumns(list(fields), columns)
+    #f encode
+    def encode(self, columns):
+        """
+        Pack columns (a dict of arrays, missing fields zero) in to words - the inverse of decode
+        """
+        n = max([len(c) for c in columns.values()])
+        words = np.zeros(n, dtype=self.dtype)
+        for (f, c) in columns.items():
+            words |= (np.asarray(c).astype(self.dtype) & self.masks[f]) << self.shifts[f]
+            pass
+        return words
+    #f word_dtype
+    def word_dtype(self):
+        """
+        Little-endian dtype of a captured word in a file
+        """
+        return np.dtype(self.dtype).newbyteorder("<")
+    pass
+
+#c RunStats
+class RunStats(object):
+    """
+    Accumulate the samples, runs and longest run for which a condition holds, over chunks of a capture
+    """
+    #f __init__
+    def __init__(self):
+        self.samples = 0
+        self.total   = 0
+        self.runs    = 0
+        self.longest = 0
+        self.current = 0 # length of the run at the end of the last chunk, if the condition held there
+        pass
+    #f add
+    def add(self, condition):
+        condition = np.asarray(condition, dtype=np.bool_)
+        n = len(condition)
+        if n==0: return
+        self.samples += n
+        self.total   += int(np.count_nonzero(condition))
+        edges  = np.diff(np.concatenate(([False], condition, [False])).astype(np.int8))
+        starts = np.flatnonzero(edges==1)
+        ends   = np.flatnonzero(edges==-1)
+        if len(starts)==0:
+            self.current = 0
+            return
+        lengths = ends - starts
+        if starts[0]==0 and self.current>0:
+            lengths[0] += self.current # continues the run from the last chunk
+            self.runs -= 1
+            pass
+        self.runs += len(lengths)
+        self.longest = max(self.longest, int(lengths.max()))
+        self.current = int(lengths[-1]) if ends[-1]==n else 0
+        pass
+    #f fraction
+    def fraction(self):
+        if self.samples==0: return 0.0
+        return self.total / self.samples
+    #f __str__
+    def __str__(self):
+        return "%d of %d samples (%.3f%%) in %d runs, longest %d"%(self.total, self.samples, 100.0*self.fraction(), self.runs, self.longest)
+    pass
+
+#a Streaming
+#f read_chunks
+def read_chunks(source, dtype, chunk_words=1<<20):
+    """
+    Generate arrays of up to chunk_words words of dtype from a filename or binary file object
+    """
+    own_file = isinstance(source, str)
+    f = open(source, "rb") if own_file else source
+    itemsize = np.dtype(dtype).itemsize
+    try:
+        while True:
+            data = f.read(chunk_words*itemsize)
+            if len(data)==0: return
+            if len(data)%itemsize!=0: raise Exception("Capture ends with a partial word")
+            yield np.frombuffer(data, dtype=dtype)
+            pass
+        pass
+    finally:
+        if own_file: f.close()
+        pass
+    pass
+
+#f decode_chunks
+def decode_chunks(source, layout, fields=None, chunk_words=1<<20):
+    """
+    Generate a TraceColumns for each chunk of a capture file of little-endian words
+    """
+    for words in read_chunks(source, layout.word_dtype(), chunk_words):
+        yield layout.decode(words, fields)
+        pass
+    pass
+
+#a Layouts
+#f width_of
+def width_of(struct_desc, name):
+    return dict(struct_fields(struct_desc))[name]
+
+#v analyzer_layouts - gbe_single analyzer_trace for each analyzer_ctl.mux_control
+analyzer_layouts = {
+    0 : TraceLayout([(None,4), ("gmii_tx__txd",width_of(t_gmii_tx,"txd")), (None,1), ("gmii_tx__tx_er",1), ("gmii_tx__tx_en",1), ("gmii_tx_enable",1),
+                     (None,4), ("gmii_rx__rxd",width_of(t_gmii_rx,"rxd")), ("gmii_rx__rx_crs",1), ("gmii_rx__rx_er",1), ("gmii_rx__rx_dv",1), ("gmii_rx_enable",1)]),
+    1 : TraceLayout([("debug_count",width_of(t_sgmii_gasket_trace,"debug_count")),
+                     ("rx_config_data_match",4), # bottom 4 bits only
+                     ("an_fsm",width_of(t_sgmii_gasket_trace,"an_fsm")),
+                     ("valid",1),
+                     ("symbol_data",width_of(t_sgmii_gasket_trace,"symbol_data")),
+                     ("seeking_comma",1), ("symbol_is_R",1), ("symbol_is_T",1), ("symbol_is_V",1),
+                     ("symbol_is_S",1), ("symbol_is_K",1), ("symbol_is_control",1), ("symbol_valid",1)]),
+    2 : TraceLayout([("rx_symbols_since_sync",12), # bottom 12 bits only
+                     (None,2),
+                     ("comma_found",width_of(t_sgmii_gasket_trace,"comma_found")),
+                     ("rx_fsm",width_of(t_sgmii_gasket_trace,"rx_fsm")),
+                     (None,2), ("rx_sync_toggle",1), ("rx_sync",1)]),
+    3 : TraceLayout([("sgmii_txd",28), (None,3), ("sgmii_txd_valid",1)]),
+    4 : TraceLayout([("sgmii_rxd",28), (None,3), ("sgmii_rxd_valid",1)]),
+}
+
+#v gasket_trace_layout - the whole of t_sgmii_gasket_trace, as a bundle() of its fields in order (not CDL's own packing of the structure)
+gasket_trace_layout = TraceLayout.from_struct(t_sgmii_gasket_trace)
+
+#a Benchmark
+#f benchmark
+def benchmark(samples=4*1000*1000, seed=0):
+    """
+    Check decode inverts encode, and return the rate (samples per second) of decoding and of a run-length query
+    """
+    layout = analyzer_layouts[1]
+    rng = np.random.default_rng(seed)
+    columns = {f:rng.integers(0, int(layout.masks[f])+1, samples) for f in layout.fields}
+    columns["seeking_comma"] = (np.arange(samples)//1000)%3==0
+    words = layout.encode(columns)
+    start = time.perf_counter()
+    decoded = layout.decode(words)
+    decode_time = time.perf_counter() - start
+    for f in layout.fields:
+        if (decoded[f]!=columns[f]).any(): raise Exception("Decode of %s does not match"%f)
+        pass
+    start = time.perf_counter()
+    s = RunStats()
+    for i in range(0, samples, 1<<20):
+        s.add(layout.decode(words[i:i+(1<<20)], ["seeking_comma"])["seeking_comma"]!=0)
+        pass
+    query_time = time.perf_counter() - start
+    if s.total!=int(np.count_nonzero(columns["seeking_comma"])) or s.longest!=1000: raise Exception("Run statistics mismatch (%s)"%str(s))
+    return {"decode all fields":samples/decode_time, "seeking_comma runs":samples/query_time}
+
+#a Toplevel
+if __name__ == '__main__':
+    for (name, rate) in benchmark().items():
+        print("%-28s %8.1f Msamples/s"%(name, rate/1e6))
+        pass
+    pass
@@ -0,0 +1,181 @@
+#a Copyright
+#
+#  This file 'traffic.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Seeded random Ethernet traffic for the SGMII and GbE tests
+
+A RandomTraffic is a reproducible source of frames: the same seed and
+parameters always give the same lengths, data, inter-packet gaps and
+errors. Frame lengths are uniform between min_length and max_length,
+drawn from the simple IMIX (7:4:1 of 64, 570 and 1518 bytes), or drawn
+from a list of (length, weight) pairs. A fraction
+of frames (error_rate) have a run of 1 to max_errors errors inserted at a
+random point (error_insert_at), as SgmiiTest_GmiiRx_Base.Pkt does.
+
+Everything is a generator - frames, the GMII values for them, and the
+code groups that a link partner would send for them (from the transmit
+PCS model) - so a soak run holds only the frame in flight.
+
+Running this module (as it is in a package, from the test directory
+with 'python3 -m python.traffic') reports the rate of each generator,
+which should be far above the rate at which a simulation can consume it.
+"""
+
+#a Imports
+import random
+import time
+from .pcs_model import TxPcs
+
+#a Constants
+imix = [(64,7), (570,4), (1518,1)]
+
+#a Classes
+#c Frame
+class Frame(object):
+    """
+    A frame, the number of errors to insert (at error_insert_at) and the inter-packet gap after it
+    """
+    __slots__ = ("data", "errors", "error_insert_at", "ipg")
+    def __init__(self, data, errors=0, error_insert_at=None, ipg=12):
+        self.data = data
+        self.errors = errors
+        self.error_insert_at = error_insert_at
+        self.ipg = ipg
+        pass
+    def __len__(self):
+        return len(self.data)
+    def __str__(self):
+        r = "Frame len %d ipg %d"%(len(self.data), self.ipg)
+        if self.errors>0: r += " errors %d at %d"%(self.errors, self.error_insert_at)
+        return r
+    pass
+
+#c RandomTraffic
+class RandomTraffic(object):
+    """
+    Seeded random frame generator
+
+    lengths is "uniform" (min_length to max_length inclusive), "imix", or a list of (length, weight)
+    """
+    #f __init__
+    def __init__(self, seed=0, lengths="uniform", min_length=64, max_length=1518, min_ipg=12, max_ipg=12, error_rate=0.0, max_errors=1):
+        if isinstance(lengths, str) and (lengths not in ["uniform", "imix"]): raise Exception("Unknown frame length distribution '%s'"%lengths)
+        self.rng        = random.Random(seed)
+        self.lengths    = lengths
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_ipg    = min_ipg
+        self.max_ipg    = max_ipg
+        self.error_rate = error_rate
+        self.max_errors = max_errors
+        self.imix_lengths = [l for (l,n) in imix for i in range(n)]
+        if not isinstance(lengths, str):
+            self.weighted_lengths = [l for (l,w) in lengths]
+            self.weights = [w for (l,w) in lengths]
+            pass
+        pass
+    #f frame_length
+    def frame_length(self):
+        if self.lengths=="imix": return self.rng.choice(self.imix_lengths)
+        if self.lengths=="uniform": return self.rng.randint(self.min_length, self.max_length)
+        return self.rng.choices(self.weighted_lengths, self.weights)[0]
+    #f frames
+    def frames(self, count=None):
+        """
+        Generate count frames (forever if count is None)
+        """
+        n = 0
+        while (count is None) or (n<count):
+            length = self.frame_length()
+            data = self.rng.randbytes(length)
+            ipg  = self.rng.randint(self.min_ipg, self.max_ipg)
+            errors = 0
+            error_insert_at = None
+            if (self.error_rate>0) and (self.rng.random()<self.error_rate):
+                errors = self.rng.randint(1, self.max_errors)
+                error_insert_at = self.rng.randint(1, length-1)
+                pass
+            yield Frame(data, errors, error_insert_at, ipg)
+            n += 1
+            pass
+        pass
+    #f gmii
+    def gmii(self, count=None):
+        """
+        Generate the GMII (tx_en, tx_er, txd) values for count frames, as gmii_packet does
+        (the first byte of each frame is replaced by /S/), with errors inserted as tx_er
+        """
+        for f in self.frames(count):
+            error_insert_at = len(f.data) if f.error_insert_at is None else f.error_insert_at
+            for d in f.data[:error_insert_at]:
+                yield (1, 0, d)
+                pass
+            for i in range(f.errors):
+                yield (1, 1, 0)
+                pass
+            for d in f.data[error_insert_at:]:
+                yield (1, 0, d)
+                pass
+            for i in range(f.ipg):
+                yield (0, 0, 0)
+                pass
+            pass
+        pass
+    #f code_groups
+    def code_groups(self, count=None, **kwargs):
+        """
+        Generate the code groups a link partner sends for count frames; kwargs are passed to TxPcs
+        """
+        return TxPcs(**kwargs).code_groups(self.gmii(count))
+    #f symbols
+    def symbols(self, count=None, **kwargs):
+        """
+        Generate the 10-bit symbols a link partner sends for count frames
+        """
+        for cg in self.code_groups(count, **kwargs):
+            yield cg.symbol
+            pass
+        pass
+    #f All done
+    pass
+
+#a Benchmark
+#f benchmark
+def benchmark(frames=2000, seed=0, lengths="imix"):
+    """
+    Time each of the generators over frames frames; returns a dictionary of rates
+    """
+    results = {}
+    for (name, unit, fn) in [("frames",  "bytes",   lambda t:sum([len(f) for f in t.frames(frames)])),
+                             ("gmii",    "cycles",  lambda t:sum([1 for g in t.gmii(frames)])),
+                             ("symbols", "symbols", lambda t:sum([1 for s in t.symbols(frames)])),
+    ]:
+        t = RandomTraffic(seed=seed, lengths=lengths, error_rate=0.1, max_errors=3)
+        start = time.perf_counter()
+        n = fn(t)
+        elapsed = time.perf_counter() - start
+        results[name] = (n, unit, n/elapsed)
+        pass
+    return results
+
+#a Toplevel
+if __name__ == '__main__':
+    for (name, (n, unit, rate)) in benchmark().items():
+        print("%-8s %10d %-8s %12.0f %s per second"%(name, n, unit, rate, unit))
+        pass
+    pass
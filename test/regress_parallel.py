@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+#a Copyright
+#
+#  This file 'regress_parallel.py' copyright Gavin J Stark 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#a Documentation
+"""
+Parallel regression - run each test (and each shard of a sharded test) as a separate cdl_regress
+
+The test modules in the suite directory are parsed (not imported, as
+the CDL simulation python need not be importable by the python running
+this) to find the entries in the _tests of each class; a test class with
+a 'shards' attribute (on it or a base class, found through the suite's
+relative imports) is run that many times, with CDL_REGRESS_SHARD set
+(see python/shards.py). The 'smoke' entries repeat other tests, and are
+skipped. Jobs are run longest first (by simulation cycles per shard)
+across --jobs concurrent simulations, and the results are merged in to
+one report, which is printed and optionally written to a file. The exit
+status is non-zero if any job failed.
+
+Each job runs in a directory of its own under --work-dir, as the tests
+write their logs and other files (such as gmii.log and the pcap files)
+to the current directory; the directories are kept, and the report lists
+each job's directory and the files it wrote. Paths in --regress-args
+must therefore be absolute (as the grip environment paths are).
+
+A test module that cannot be parsed, or whose _tests cannot be
+understood, is an error.
+"""
+
+#a Imports
+import argparse
+import ast
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+#a Classes
+#c Job
+class Job(object):
+    """
+    One cdl_regress run - a test module, optionally one test in it and one shard of that
+    """
+    def __init__(self, module, test=None, cycles=0, shard=0, shards=1):
+        self.module = module
+        self.test   = test
+        self.cycles = cycles
+        self.shard  = shard
+        self.shards = shards
+        self.returncode = None
+        self.output  = ""
+        self.elapsed = 0.0
+        self.directory = None
+        self.files   = []
+        pass
+    def name(self):
+        r = self.module
+        if self.test is not None: r += "." + self.test
+        if self.shards>1: r += " [shard %d/%d]"%(self.shard, self.shards)
+        return r
+    def run(self, cdl_regress, regress_args, work_dir):
+        prefix = self.module
+        if self.test is not None: prefix += "." + self.test
+        if self.shards>1: prefix += ".%d"%self.shard
+        self.directory = tempfile.mkdtemp(prefix=prefix+"_", dir=work_dir)
+        cmd = [cdl_regress] + regress_args
+        if self.test is not None: cmd += ["--only-tests", self.test]
+        cmd += [self.module]
+        env = dict(os.environ)
+        if self.shards>1: env["CDL_REGRESS_SHARD"] = "%d/%d"%(self.shard, self.shards)
+        start = time.time()
+        p = subprocess.run(cmd, env=env, cwd=self.directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        self.elapsed = time.time() - start
+        self.returncode = p.returncode
+        self.output = p.stdout
+        self.files = sorted(os.listdir(self.directory))
+        return self
+    pass
+
+#c SuiteModules
+class SuiteModules(object):
+    """
+    The parsed test modules of a suite directory, and the class attributes they define
+    """
+    def __init__(self, suite_dir):
+        self.suite_dir = suite_dir
+        self.modules = {}
+        pass
+    def module(self, name):
+        """
+        Return (classes, imports) of a module - its class definitions, and the names it imports from sibling modules
+        """
+        if name not in self.modules:
+            filename = os.path.join(self.suite_dir, name+".py")
+            try:
+                with open(filename) as f:
+                    tree = ast.parse(f.read(), filename)
+                    pass
+                pass
+            except Exception as e:
+                raise Exception("Could not parse test module %s (%s)"%(name, str(e)))
+            classes = {}
+            imports = {}
+            for node in tree.body:
+                if isinstance(node, ast.ClassDef):
+                    classes[node.name] = node
+                    pass
+                elif isinstance(node, ast.ImportFrom) and node.level==1 and node.module is not None:
+                    for a in node.names:
+                        imports[a.asname or a.name] = (node.module, a.name)
+                        pass
+                    pass
+                pass
+            self.modules[name] = (classes, imports)
+            pass
+        return self.modules[name]
+    def class_attribute(self, module, class_name, attribute, default):
+        """
+        Find the value assigned to a class attribute, on the class or its bases
+        """
+        (classes, imports) = self.module(module)
+        if class_name in imports:
+            (module, class_name) = imports[class_name]
+            return self.class_attribute(module, class_name, attribute, default)
+        if class_name not in classes: return default
+        node = classes[class_name]
+        for statement in node.body:
+            if not isinstance(statement, ast.Assign): continue
+            for target in statement.targets:
+                if isinstance(target, ast.Name) and target.id==attribute: return statement.value
+                pass
+            pass
+        for base in node.bases:
+            if not isinstance(base, ast.Name): continue
+            value = self.class_attribute(module, base.id, attribute, None)
+            if value is not None: return value
+            pass
+        return default
+    pass
+
+#a Functions
+#f constant_value
+def constant_value(node, where):
+    """
+    Value of a constant expression (such as 8*1000) in a test module
+    """
+    if isinstance(node, ast.Constant): return node.value
+    if isinstance(node, ast.BinOp):
+        (l, r) = (constant_value(node.left, where), constant_value(node.right, where))
+        if isinstance(node.op, ast.Mult): return l*r
+        if isinstance(node.op, ast.Add): return l+r
+        if isinstance(node.op, ast.Sub): return l-r
+        if isinstance(node.op, ast.FloorDiv): return l//r
+        if isinstance(node.op, ast.Pow): return l**r
+        pass
+    raise Exception("Expected a constant for %s, found '%s'"%(where, ast.dump(node)))
+
+#f find_jobs
+def find_jobs(suite_dir, modules, skip_tests=("smoke",)):
+    """
+    Find the jobs for the test modules, one per test entry per shard
+    """
+    jobs = []
+    suite = SuiteModules(suite_dir)
+    for module in modules:
+        (classes, imports) = suite.module(module)
+        for class_name in classes:
+            tests = suite.class_attribute(module, class_name, "_tests", None)
+            if tests is None: continue
+            if not isinstance(tests, ast.Dict):
+                raise Exception("%s.%s._tests is not a dictionary"%(module, class_name))
+            for (key, value) in zip(tests.keys, tests.values):
+                test = constant_value(key, "a test name in %s.%s._tests"%(module, class_name))
+                if test in skip_tests: continue
+                if not isinstance(value, ast.Tuple) or len(value.elts)<2 or not isinstance(value.elts[0], ast.Name):
+                    raise Exception("%s.%s._tests['%s'] is not (test class, cycles, kwargs)"%(module, class_name, test))
+                cycles = constant_value(value.elts[1], "the cycles of %s.%s"%(module, test))
+                shards = constant_value(suite.class_attribute(module, value.elts[0].id, "shards", ast.Constant(1)), "the shards of %s.%s"%(module, test))
+                for s in range(shards):
+                    jobs.append(Job(module, test, cycles//shards, s, shards))
+                    pass
+                pass
+            pass
+        pass
+    jobs.sort(key=lambda j:-j.cycles)
+    return jobs
+
+#f report
+def report(jobs, elapsed):
+    """
+    Merged report of all the jobs, failures last with their output
+    """
+    failed = [j for j in jobs if j.returncode!=0]
+    r = []
+    r.append("Parallel regression: %d jobs, %d passed, %d failed, %.1fs elapsed, %.1fs total simulation"%
+             (len(jobs), len(jobs)-len(failed), len(failed), elapsed, sum([j.elapsed for j in jobs])))
+    for j in sorted(jobs, key=lambda j:j.name()):
+        r.append("%s %8.1fs %s in %s: %s"%("PASS" if j.returncode==0 else "FAIL", j.elapsed, j.name(), j.directory, " ".join(j.files)))
+        pass
+    for j in failed:
+        r.append("")
+        r.append("Output of failing %s (exit %d):"%(j.name(), j.returncode))
+        r.append(j.output)
+        pass
+    return "\n".join(r)
+
+#a Toplevel
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run cdl_regress tests in parallel")
+    parser.add_argument("--cdl-regress", required=True, help="Path to cdl_regress.py")
+    parser.add_argument("--regress-args", default="", help="Options passed to every cdl_regress (pyengine, package and suite directories)")
+    parser.add_argument("--suite-dir", default="python", help="Directory of the test modules")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of simulations to run at once")
+    parser.add_argument("--report", default=None, help="File to write the merged report to")
+    parser.add_argument("--work-dir", default="regress_parallel_jobs", help="Directory in which each job gets a directory of its own")
+    parser.add_argument("modules", nargs="+", help="Test modules (such as test_8b10b)")
+    args = parser.parse_args()
+    regress_args = shlex.split(args.regress_args) + ["--suite-dir=%s"%os.path.abspath(args.suite_dir)]
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        jobs = find_jobs(args.suite_dir, args.modules)
+        pass
+    except Exception as e:
+        print("regress_parallel: %s"%str(e))
+        sys.exit(2)
+        pass
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for j in pool.map(lambda j:j.run(args.cdl_regress, regress_args, work_dir), jobs):
+            print("%s %s"%("PASS" if j.returncode==0 else "FAIL", j.name()))
+            sys.stdout.flush()
+            pass
+        pass
+    r = report(jobs, time.time()-start)
+    print(r)
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            f.write(r+"\n")
+            pass
+        pass
+    sys.exit(0 if all([j.returncode==0 for j in jobs]) else 1)
+    pass